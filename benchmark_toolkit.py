@@ -0,0 +1,988 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark script cho Network Toolkit
+Đo hiệu năng các engine với fixtures chạy local trên loopback (không cần Internet)
+
+Mỗi benchmark chạy trong một process riêng (peak RSS không lẫn nhau); report JSON có
+commit/python/platform để so sánh giữa các commit:
+
+    python benchmark_toolkit.py --output base.json
+    python benchmark_toolkit.py --compare base.json --threshold 10
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import ipaddress
+import json
+import math
+import multiprocessing
+import os
+import platform
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows: không đo được peak RSS
+    resource = None
+
+from network_toolkit import (NetworkToolkit, NetworkLogger, DnsClient, LogRecord, ColumnarLog, IcmpEchoEngine,
+                             ThroughputServer, ThroughputEngine, UdpProbeEngine, NetworkMonitor, TimeSeriesStore,
+                             MetricsRegistry, MetricsServer, Instrumentation)
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+class ListenerFarm:
+    """Tập hợp TCP listeners trên 127.0.0.1 để làm target cho port scan"""
+
+    def __init__(self, base_port=40000, span=10000, every=20, filtered=0):
+        self.base_port = base_port
+        self.span = span
+        self.every = every
+        self.filtered = filtered
+        self.sockets = []
+        self.open_ports = []
+        self.filtered_ports = []
+
+    def start(self):
+        for port in range(self.base_port, self.base_port + self.span, self.every):
+            sock = self._listen(port, backlog=128)
+            if sock:
+                self.open_ports.append(port)
+
+        # "Filtered" port: listener với accept queue đã đầy -> SYN bị drop, connect bị timeout
+        port = self.base_port + 1
+        while len(self.filtered_ports) < self.filtered and port < self.base_port + self.span:
+            if port not in self.open_ports:
+                sock = self._listen(port, backlog=0)
+                if sock:
+                    self._fill_backlog(port)
+                    self.filtered_ports.append(port)
+            port += self.every
+        return self
+
+    def _listen(self, port, backlog):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind(("127.0.0.1", port))
+            sock.listen(backlog)
+        except OSError:
+            sock.close()
+            return None
+        self.sockets.append(sock)
+        return sock
+
+    def _fill_backlog(self, port):
+        for _ in range(4):
+            client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            client.setblocking(False)
+            client.connect_ex(("127.0.0.1", port))
+            self.sockets.append(client)
+
+    def stop(self):
+        for sock in self.sockets:
+            sock.close()
+        self.sockets = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class StubDnsServer:
+    """DNS server giả lập trên loopback (UDP + TCP cùng port)
+
+    Trả A/AAAA/CNAME/MX cho mọi tên, NXDOMAIN cho tên bắt đầu bằng "nx",
+    set TC bit qua UDP cho tên bắt đầu bằng "big" (trả đủ record qua TCP).
+    """
+
+    def __init__(self, host="127.0.0.1", address="10.0.0.1", ttl=60):
+        self.host = host
+        self.address = address
+        self.ttl = ttl
+        self.port = None
+        self.udp_sock = None
+        self.tcp_sock = None
+        self.threads = []
+
+    def start(self):
+        self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.udp_sock.bind((self.host, 0))
+        self.port = self.udp_sock.getsockname()[1]
+        self.tcp_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp_sock.bind((self.host, self.port))
+        self.tcp_sock.listen(64)
+        for target in (self._serve_udp, self._serve_tcp):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        for sock in (self.udp_sock, self.tcp_sock):
+            if sock:
+                sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def server(self):
+        return f"{self.host}:{self.port}"
+
+    def build_response(self, query, tcp=False):
+        txid = struct.unpack("!H", query[:2])[0]
+        end = 12
+        while query[end] != 0:
+            end += query[end] + 1
+        qname, _ = DnsClient.decode_name(query, 12)
+        qtype = struct.unpack("!H", query[end + 1:end + 3])[0]
+        question = query[12:end + 5]
+
+        flags = 0x8580  # QR, AA, RD, RA
+        answers = []
+        if qname.startswith("nx"):
+            flags |= 3
+        elif qname.startswith("big") and not tcp:
+            flags |= 0x0200
+        else:
+            count = 40 if qname.startswith("big") else 1
+            for i in range(count):
+                answers.append(self._answer(qtype, qname, i))
+
+        header = struct.pack("!HHHHHH", txid, flags, 1, len(answers), 0, 0)
+        return header + question + b"".join(answers)
+
+    def _answer(self, qtype, qname, index):
+        if qtype == 28:
+            rdata = socket.inet_pton(socket.AF_INET6, f"fd00::{index + 1:x}")
+        elif qtype == 5:
+            rdata = DnsClient.encode_name(f"alias.{qname}")
+        elif qtype == 15:
+            rdata = struct.pack("!H", 10) + DnsClient.encode_name(f"mail.{qname}")
+        else:
+            qtype = 1
+            octets = self.address.split(".")
+            rdata = socket.inet_aton(".".join(octets[:3] + [str((int(octets[3]) + index) % 256)]))
+        # 0xC00C: pointer tới qname trong question
+        return struct.pack("!HHHIH", 0xC00C, qtype, 1, self.ttl, len(rdata)) + rdata
+
+    def _serve_udp(self):
+        while True:
+            try:
+                query, addr = self.udp_sock.recvfrom(512)
+                self.udp_sock.sendto(self.build_response(query), addr)
+            except OSError:
+                return
+            except (IndexError, struct.error):
+                continue
+
+    def _serve_tcp(self):
+        while True:
+            try:
+                conn, _ = self.tcp_sock.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    length = struct.unpack("!H", DnsClient._recv_exact(conn, 2))[0]
+                    response = self.build_response(DnsClient._recv_exact(conn, length), tcp=True)
+                    conn.sendall(struct.pack("!H", len(response)) + response)
+                except (OSError, ConnectionError, struct.error):
+                    continue
+
+class UdpEcho:
+    """UDP echo trên loopback: gửi trả nguyên datagram (target cho UdpProbeEngine)"""
+
+    def __init__(self, host="127.0.0.1", buffer_size=65535):
+        self.host = host
+        self.buffer_size = buffer_size
+        self.port = None
+        self.sock = None
+        self.packets = 0
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind((self.host, 0))
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+        return self
+
+    def _serve(self):
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        while True:
+            try:
+                size, addr = self.sock.recvfrom_into(buffer)
+                self.sock.sendto(view[:size], addr)
+            except OSError:
+                return
+            self.packets += 1
+
+    def stop(self):
+        if self.sock:
+            self.sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class HttpSink:
+    """HTTP/1.1 server trên loopback cho bandwidth_test(protocol="http")
+
+    GET trả về body `body_size` bytes cấp phát sẵn (keep-alive, nhận request pipeline),
+    POST đọc rồi bỏ body. `bytes_sent` / `bytes_received` đếm payload.
+    """
+
+    def __init__(self, host="127.0.0.1", body_size=1 << 20):
+        self.host = host
+        self.body = bytes(body_size)
+        self.port = None
+        self.server = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(sink.body)))
+                self.end_headers()
+                self.wfile.write(sink.body)
+                with sink._lock:
+                    sink.bytes_sent += len(sink.body)
+
+            def do_POST(self):
+                remaining = int(self.headers.get("Content-Length", 0))
+                while remaining:
+                    chunk = self.rfile.read(min(remaining, 1 << 16))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    with sink._lock:
+                        sink.bytes_received += len(chunk)
+                self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, 0), Handler)
+        self.server.daemon_threads = True
+        # Client đóng connection giữa chừng khi hết duration -> BrokenPipe, không cần in traceback
+        self.server.handle_error = lambda request, client_address: None
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def make_toolkit(workdir):
+    """Tạo NetworkToolkit với log file nằm trong thư mục tạm"""
+    return NetworkToolkit(logger=NetworkLogger(log_file=os.path.join(workdir, "bench_logs.json")))
+
+def fill_logger(logger, entries):
+    """Ghi `entries` log giống port scan + DNS check, trả về số giây (gồm cả flush)"""
+    start = time.perf_counter()
+    for i in range(entries):
+        if i % 3:
+            logger.log_success("port_check", {'host': '127.0.0.1', 'port': i % 65536, 'connect_time_ms': 0.5})
+        else:
+            logger.log_success("dns_resolve", {'domain': f"host{i}.test", 'ips': ['10.0.0.1'],
+                                               'resolve_time_ms': 1.25})
+    logger.flush()
+    return time.perf_counter() - start
+
+def percentile(values, fraction):
+    """Percentile (nearest rank) của list đã sort, None nếu rỗng"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def span_stats(toolkit, name, prefix=""):
+    """count/p50/p99 (ms) của span `name` trong instrumentation của toolkit"""
+    stats = toolkit.instrumentation.stats().get(name, {})
+    return {f'{prefix}count': stats.get('count', 0),
+            f'{prefix}p50_ms': stats.get('p50'),
+            f'{prefix}p99_ms': stats.get('p99')}
+
+def peak_rss_mb():
+    """Peak RSS của process hiện tại (MB), None khi không có module resource"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux trả về KB, macOS trả về bytes
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+def timed(func, *args, **kwargs):
+    """Chạy func với stdout bị tắt, trả về (kết quả, số giây)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return result, elapsed
+
+# ============================================================================
+# BENCHMARKS
+# ============================================================================
+
+def bench_port_scan(args, workdir):
+    """So sánh engine thread pool và asyncio trên listener farm"""
+    results = {}
+    with ListenerFarm(args.base_port, args.span, args.every, args.filtered) as farm:
+        port_range = (farm.base_port, farm.base_port + farm.span - 1)
+        for engine in ("thread", "async"):
+            toolkit = make_toolkit(workdir)
+            _, elapsed = timed(toolkit.port_scan, "127.0.0.1", port_range=port_range,
+                               engine=engine, concurrency=args.concurrency, timeout=args.timeout)
+            summary = toolkit.results['port_scan']['summary']
+            results[engine] = {
+                'seconds': round(elapsed, 3),
+                'ports_per_second': round(summary['total_ports'] / elapsed, 1),
+                'open_count': summary['open_count'],
+                'expected_open': len(farm.open_ports),
+                'filtered_ports': len(farm.filtered_ports),
+                **span_stats(toolkit, "tcp.connect", "connect_")
+            }
+            toolkit.logger.close()
+
+    results['speedup'] = round(results['thread']['seconds'] / results['async']['seconds'], 2)
+    return results
+
+def bench_connectivity(args, workdir):
+    """check_connectivity tới listener farm: probe/giây và p99 mỗi probe (resolve + connect)"""
+    with ListenerFarm(args.base_port, args.connectivity_hosts * 2, 2) as farm:
+        toolkit = make_toolkit(workdir)
+        hosts = [("127.0.0.1", port) for port in farm.open_ports]
+        _, elapsed = timed(lambda: [toolkit.check_connectivity(hosts) for _ in range(args.connectivity_rounds)])
+        connected = sum(1 for result in toolkit.results['connectivity'] if result['success'])
+        toolkit.logger.close()
+
+    probes = len(hosts) * args.connectivity_rounds
+    return {
+        'hosts': len(hosts),
+        'rounds': args.connectivity_rounds,
+        'connected_last_round': connected,
+        'seconds': round(elapsed, 3),
+        'probes_per_second': round(probes / elapsed, 1),
+        **span_stats(toolkit, "connectivity.check", "probe_"),
+        **span_stats(toolkit, "tcp.connect", "connect_")
+    }
+
+def bench_icmp_sweep(args, workdir):
+    """ICMP echo sweep trên 127.0.0.0/8 (mọi địa chỉ loopback đều reply): IcmpEchoEngine và network_scan"""
+    if not IcmpEchoEngine.is_available():
+        return {'available': False}
+
+    network = ipaddress.ip_network(args.icmp_network)
+    with IcmpEchoEngine(timeout=args.timeout, window=args.icmp_window) as engine:
+        mode = engine.mode
+        start = time.perf_counter()
+        replies = list(engine.sweep(network.hosts()))
+        elapsed = time.perf_counter() - start
+    rtts = sorted(rtt for _, rtt in replies if rtt is not None)
+
+    toolkit = make_toolkit(workdir)
+    _, scan_seconds = timed(toolkit.network_scan, str(network), method="icmp", timeout=args.timeout,
+                            checkpoint_file=os.path.join(workdir, "bench_scan.checkpoint"))
+    found = sum(1 for log in toolkit.logger.logs if log['action'] == "host_ping" and log['status'] == "success")
+    toolkit.logger.close()
+
+    return {
+        'available': True,
+        'mode': mode,
+        'hosts': len(replies),
+        'alive': len(rtts),
+        'sweep_seconds': round(elapsed, 3),
+        'hosts_per_second': round(len(replies) / elapsed, 1),
+        'rtt_p50_ms': round(percentile(rtts, 0.5), 3) if rtts else None,
+        'rtt_p99_ms': round(percentile(rtts, 0.99), 3) if rtts else None,
+        'network_scan_seconds': round(scan_seconds, 3),
+        'network_scan_hosts_per_second': round(len(replies) / scan_seconds, 1),
+        'network_scan_found': found
+    }
+
+def bench_logger(args, workdir):
+    """Throughput của NetworkLogger.log khi nhiều worker thread ghi đồng thời"""
+    logger = NetworkLogger(log_file=os.path.join(workdir, "bench_logger.json"), echo=False)
+    logger.instrumentation = Instrumentation()
+    per_thread = args.log_entries // args.log_threads
+    call_ns = [[] for _ in range(args.log_threads)]
+
+    def worker(worker_id):
+        samples = call_ns[worker_id]
+        for i in range(per_thread):
+            start = time.perf_counter_ns()
+            logger.log_success("port_check", {'host': '127.0.0.1', 'port': i,
+                                              'worker': worker_id, 'connect_time_ms': 0.5})
+            if not i % 64:
+                samples.append(time.perf_counter_ns() - start)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.log_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ingest_seconds = time.perf_counter() - start
+    logger.flush()
+    written_seconds = time.perf_counter() - start
+    logger.close()
+
+    with open(logger.stream_file, encoding='utf-8') as f:
+        lines = sum(1 for _ in f)
+    total = per_thread * args.log_threads
+    call_ns = sorted(sample for samples in call_ns for sample in samples)
+    write_stats = logger.instrumentation.stats().get('log.write', {})
+    return {
+        'threads': args.log_threads,
+        'entries': total,
+        'lines_written': lines,
+        'ingest_entries_per_second': round(total / ingest_seconds),
+        'written_entries_per_second': round(total / written_seconds),
+        'log_call_p50_us': round(percentile(call_ns, 0.5) / 1000, 2) if call_ns else None,
+        'log_call_p99_us': round(percentile(call_ns, 0.99) / 1000, 2) if call_ns else None,
+        'write_batches': write_stats.get('count', 0),
+        'write_batch_p99_ms': write_stats.get('p99')
+    }
+
+def bench_dns_client(args, workdir):
+    """Số query/giây của DnsClient.query_many với stub DNS server"""
+    with StubDnsServer() as stub:
+        client = DnsClient(stub.server, timeout=2.0)
+        names = [(f"host{i}.bench.test", "A") for i in range(args.dns_queries)]
+        start = time.perf_counter()
+        responses = list(client.query_many(names, window=args.dns_window))
+        elapsed = time.perf_counter() - start
+        rtts = sorted(r['rtt_ms'] for r in responses if 'rtt_ms' in r)
+
+        # Tra cứu đủ loại record, NXDOMAIN và TCP fallback
+        checks = {
+            'aaaa': client.query("v6.bench.test", "AAAA")['answers'][0]['data'],
+            'mx': client.query("bench.test", "MX")['answers'][0]['data'],
+            'nxdomain': client.query("nx.bench.test")['rcode'],
+            'truncated_transport': client.query("big.bench.test")['transport']
+        }
+
+        toolkit = make_toolkit(workdir)
+        domains = [f"svc{i}.bench.test" for i in range(args.dns_domains)]
+        _, check_dns_seconds = timed(toolkit.check_dns, domains, concurrency=args.dns_window, server=stub.server)
+        toolkit.logger.close()
+        check_dns_stats = span_stats(toolkit, "dns.query", "check_dns_")
+
+    return {
+        'queries': len(names),
+        'answered': len(rtts),
+        'queries_per_second': round(len(names) / elapsed),
+        'rtt_p50_ms': percentile(rtts, 0.5),
+        'rtt_p99_ms': percentile(rtts, 0.99),
+        'check_dns_domains': len(domains),
+        'check_dns_seconds': round(check_dns_seconds, 3),
+        'check_dns_domains_per_second': round(len(domains) / check_dns_seconds, 1),
+        **check_dns_stats,
+        'checks': checks
+    }
+
+def bench_log_memory(args, workdir):
+    """Bộ nhớ của N log entry: dict kiểu cũ so với LogRecord"""
+    def dict_entry(i):
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'session_id': "20250101_000000",
+            'action': "port_check",
+            'status': "success",
+            'message': "",
+            'details': {'host': '127.0.0.1', 'port': i, 'connect_time_ms': 0.5}
+        }
+
+    def record_entry(i):
+        return LogRecord("port_check", "success", "",
+                         {'host': '127.0.0.1', 'port': i, 'connect_time_ms': 0.5}, "20250101_000000")
+
+    results = {'entries': args.memory_entries}
+    for name, factory in (('dict', dict_entry), ('log_record', record_entry)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        entries = [factory(i) for i in range(args.memory_entries)]
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del entries
+        results[name] = {
+            'megabytes': round(current / 2 ** 20, 1),
+            'bytes_per_entry': round(current / args.memory_entries),
+            'build_seconds': round(elapsed, 3)
+        }
+
+    results['reduction'] = round(results['dict']['megabytes'] / results['log_record']['megabytes'], 2)
+    return results
+
+def bench_csv_export(args, workdir):
+    """Export CSV detailed N entries (phần lớn đã tràn ra disk) trong giới hạn bộ nhớ"""
+    logger = NetworkLogger(log_file=os.path.join(workdir, "bench_csv.json"), echo=False,
+                           compact_interval=float("inf"), max_memory_entries=args.csv_memory_entries)
+    log_seconds = fill_logger(logger, args.csv_entries)
+
+    # Đo thời gian và bộ nhớ ở hai lần export riêng (tracemalloc làm chậm export nhiều lần)
+    csv_file = os.path.join(workdir, "bench.csv")
+    _, export_seconds = timed(logger.export_csv, csv_file, "detailed")
+    tracemalloc.start()
+    timed(logger.export_csv, csv_file, "detailed")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with open(csv_file, encoding='utf-8') as f:
+        header = f.readline().rstrip("\n").split(",")
+        rows = sum(1 for _ in f)
+    result = {
+        'entries': args.csv_entries,
+        'entries_in_memory': logger.logs.in_memory,
+        'log_seconds': round(log_seconds, 3),
+        'rows': rows,
+        'columns': header,
+        'export_seconds': round(export_seconds, 3),
+        'rows_per_second': round(rows / export_seconds),
+        'file_megabytes': round(os.path.getsize(csv_file) / 2 ** 20, 1),
+        'peak_megabytes': round(peak / 2 ** 20, 1),
+        'memory_budget_megabytes': args.csv_memory_budget,
+        'within_budget': peak <= args.csv_memory_budget * 2 ** 20
+    }
+    logger.close()
+    return result
+
+def bench_columnar(args, workdir):
+    """Đọc lại latency history: file columnar (mmap) so với parse CSV performance"""
+    logger = NetworkLogger(log_file=os.path.join(workdir, "bench_columnar.json"), echo=False,
+                           compact_interval=float("inf"))
+    log_seconds = fill_logger(logger, args.columnar_entries)
+    col_file = os.path.join(workdir, "bench.ntcol")
+    csv_file = os.path.join(workdir, "bench_performance.csv")
+    _, export_seconds = timed(logger.export_columnar, col_file)
+    _, csv_export_seconds = timed(logger.export_csv, csv_file, "performance")
+    logger.close()
+
+    # Mean latency theo action từ mỗi format
+    start = time.perf_counter()
+    with ColumnarLog(col_file) as columns:
+        open_seconds = time.perf_counter() - start
+        actions, latencies = columns.columns['action'], columns.columns['latency_ms']
+        totals = {}
+        for action, latency in zip(actions, latencies):
+            if latency == latency:  # bỏ NaN
+                total = totals.setdefault(columns.strings[action], [0, 0.0])
+                total[0] += 1
+                total[1] += latency
+        columnar_seconds = time.perf_counter() - start
+        rows = len(columns)
+    columnar_means = {action: round(total / count, 3) for action, (count, total) in totals.items()}
+
+    start = time.perf_counter()
+    totals = {}
+    with open(csv_file, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            if row[3]:
+                total = totals.setdefault(row[0], [0, 0.0])
+                total[0] += 1
+                total[1] += float(row[3])
+    csv_seconds = time.perf_counter() - start
+    csv_means = {action: round(total / count, 3) for action, (count, total) in totals.items()}
+
+    return {
+        'entries': rows,
+        'log_seconds': round(log_seconds, 3),
+        'export_seconds': round(export_seconds, 3),
+        'csv_export_seconds': round(csv_export_seconds, 3),
+        'file_megabytes': round(os.path.getsize(col_file) / 2 ** 20, 1),
+        'csv_megabytes': round(os.path.getsize(csv_file) / 2 ** 20, 1),
+        'open_ms': round(open_seconds * 1000, 3),
+        'columnar_scan_seconds': round(columnar_seconds, 3),
+        'csv_scan_seconds': round(csv_seconds, 3),
+        'means_match': columnar_means == csv_means and not any(map(math.isnan, columnar_means.values()))
+    }
+
+def bench_html_report(args, workdir):
+    """Thời gian tạo HTML report comprehensive (toàn bộ logs + histogram) cho N entries"""
+    logger = NetworkLogger(log_file=os.path.join(workdir, "bench_html.json"), echo=False,
+                           compact_interval=float("inf"))
+    log_seconds = fill_logger(logger, args.html_entries)
+    html_file = os.path.join(workdir, "bench.html")
+    _, export_seconds = timed(logger.export_html, html_file, "comprehensive", open_browser=False)
+    result = {
+        'entries': args.html_entries,
+        'log_seconds': round(log_seconds, 3),
+        'export_seconds': round(export_seconds, 3),
+        'entries_per_second': round(args.html_entries / export_seconds),
+        'file_megabytes': round(os.path.getsize(html_file) / 2 ** 20, 1)
+    }
+    logger.close()
+    return result
+
+def bench_bandwidth(args, workdir):
+    """Throughput loopback: recv(4096) một stream (như engine cũ) so với recv_into buffer lớn, nhiều stream;
+    upload qua sendfile/memoryview và duplex"""
+    results = {}
+    with ThroughputServer(buffer_size=args.bw_buffer) as server:
+        for name, streams, buffer_size in (('single_4k', 1, 4096),
+                                           ('single_large', 1, args.bw_buffer),
+                                           ('multi_large', args.bw_streams, args.bw_buffer)):
+            engine = ThroughputEngine(streams, args.bw_duration, 1.0, buffer_size)
+            result = engine.run("127.0.0.1", server.port)
+            results[name] = {
+                'streams': streams,
+                'buffer_size': buffer_size,
+                'speed_mbps': result['speed_mbps'],
+                'interval_mbps': [sample['speed_mbps'] for sample in result['intervals']]
+            }
+
+    # Upload (sendfile so với send lát memoryview) và duplex
+    for name, mode, direction, use_sendfile in (('upload_sendfile', "sink", "upload", True),
+                                                ('upload_memoryview', "sink", "upload", False),
+                                                ('duplex', "duplex", "duplex", True)):
+        with ThroughputServer(buffer_size=args.bw_buffer, mode=mode) as server:
+            engine = ThroughputEngine(args.bw_streams, args.bw_duration, 1.0, args.bw_buffer,
+                                      direction=direction, use_sendfile=use_sendfile)
+            result = engine.run("127.0.0.1", server.port)
+            results[name] = {
+                'streams': args.bw_streams,
+                'speed_mbps': result['speed_mbps'],
+                'server_received_bytes': server.bytes_received,
+                **{f'{key}_mbps': result[key]['speed_mbps'] for key in ("download", "upload") if key in result}
+            }
+
+    # bandwidth_test end-to-end: pipeline HTTP GET tới HttpSink và thương lượng với ThroughputServer
+    toolkit = make_toolkit(workdir)
+
+    def toolkit_run(port, protocol, direction="download"):
+        toolkit.results.pop('bandwidth_test', None)
+        timed(toolkit.bandwidth_test, "127.0.0.1", port=port, duration=args.bw_duration, streams=args.bw_streams,
+              buffer_size=args.bw_buffer, protocol=protocol, direction=direction)
+        result = toolkit.results.get('bandwidth_test', {})
+        return {'speed_mbps': result.get('speed_mbps'), 'connections_made': result.get('connections_made')}
+
+    with HttpSink(body_size=args.http_body) as sink:
+        results['toolkit_http'] = {**toolkit_run(sink.port, "http"), 'server_sent_bytes': sink.bytes_sent}
+    with ThroughputServer(buffer_size=args.bw_buffer, mode="auto") as server:
+        for direction in ("download", "upload"):
+            results[f'toolkit_{direction}'] = toolkit_run(server.port, "toolkit", direction)
+    toolkit.logger.close()
+    return results
+
+def bench_jitter(args, workdir):
+    """UDP probe stream tới reflector loopback: pacing thực tế so với pps yêu cầu"""
+    results = {}
+    with UdpEcho() as echo:
+        for rate in args.jitter_rates:
+            result = UdpProbeEngine(rate, args.jitter_packet_size, args.jitter_duration).run("127.0.0.1", echo.port)
+            results[f'{rate}_pps'] = {
+                'sent': result['sent'],
+                'achieved_pps': round(result['sent'] / result['duration_seconds'], 1),
+                'loss_percent': result['loss_percent'],
+                'reordered': result['reordered'],
+                'jitter_ms': result['jitter_ms'],
+                'rtt_p99_ms': result['rtt'].get('p99')
+            }
+    return results
+
+def bench_monitor(args, workdir):
+    """Monitor hàng nghìn tcp target trên listener farm: CPU, probes/s và độ trễ scheduler"""
+    with ListenerFarm(args.base_port, args.monitor_targets, 2) as farm:
+        toolkit = make_toolkit(workdir)
+        targets = [f"tcp:127.0.0.1:{port}" for port in range(farm.base_port, farm.base_port + farm.span)]
+        monitor = NetworkMonitor(toolkit, targets, interval=args.monitor_interval, timeout=args.timeout,
+                                 summary_interval=args.monitor_duration)
+        snapshot = monitor.run(args.monitor_duration)
+        toolkit.logger.close()
+
+    summary = snapshot['summary']
+    expected = len(farm.open_ports) * args.monitor_duration / args.monitor_interval * 2
+    return {
+        **summary,
+        'interval': args.monitor_interval,
+        'expected_probes': round(expected),
+        'cpu_ms_per_probe': round(summary['cpu_seconds'] * 1000 / summary['probes'], 4) if summary['probes'] else None
+    }
+
+def bench_timeseries(args, workdir):
+    """Ghi sample vào TimeSeriesStore theo batch của writer thread, query raw so với rollup"""
+    store = TimeSeriesStore(os.path.join(workdir, "metrics.db"))
+    end = time.time()
+    start = end - args.ts_samples * 10 / args.ts_series  # mỗi series một sample mỗi 10s
+
+    def samples():
+        for i in range(args.ts_samples):
+            success = i % 50 != 0
+            yield (start + i * 10 / args.ts_series, "monitor_tcp", f"10.0.{i % args.ts_series // 256}.{i % 256}:443",
+                   1.0 + (i % 97) / 10 if success else None, success)
+
+    def insert():
+        batch = []
+        for sample in samples():
+            batch.append(sample)
+            if len(batch) >= NetworkLogger.WRITE_BATCH:
+                store.add_samples(batch)
+                batch = []
+        store.add_samples(batch)
+
+    _, insert_seconds = timed(insert)
+    results = {'samples': args.ts_samples, 'series': args.ts_series,
+               'insert_samples_per_second': round(args.ts_samples / insert_seconds, 1),
+               'db_mb': round(os.path.getsize(store.path) / 1e6, 2)}
+    for resolution in ("raw", "1m", "1h"):
+        rows, seconds = timed(lambda: sum(1 for _ in store.query(start=start, end=end, resolution=resolution)))
+        results[f'query_{resolution}'] = {'rows': rows, 'seconds': round(seconds, 3)}
+    store.close()
+    return results
+
+def bench_metrics(args, workdir):
+    """Scrape /metrics khi registry có nhiều series: thời gian render không phụ thuộc số log"""
+    import urllib.request
+
+    registry = MetricsRegistry()
+    samples = [(0.0, "monitor_tcp", f"10.0.{i // 256 % 256}.{i % 256}:443", 1.0 + i % 50, i % 20 != 0)
+               for i in range(args.metrics_targets)]
+    _, feed_seconds = timed(lambda: [registry.add_samples(samples) for _ in range(args.metrics_rounds)])
+
+    results = {'targets': args.metrics_targets,
+               'samples': args.metrics_targets * args.metrics_rounds,
+               'samples_per_second': round(args.metrics_targets * args.metrics_rounds / feed_seconds, 1)}
+    with MetricsServer(registry, port=0) as server:
+        url = f"http://127.0.0.1:{server.port}/metrics"
+        scrape_times = []
+        for _ in range(args.metrics_scrapes):
+            start = time.perf_counter()
+            body = urllib.request.urlopen(url).read()
+            scrape_times.append((time.perf_counter() - start) * 1000)
+    scrape_times.sort()
+    results.update({'body_kb': round(len(body) / 1024, 1),
+                    'scrape_p50_ms': round(scrape_times[len(scrape_times) // 2], 2),
+                    'scrape_max_ms': round(scrape_times[-1], 2)})
+    return results
+
+BENCHMARKS = {
+    'port_scan': bench_port_scan,
+    'connectivity': bench_connectivity,
+    'icmp_sweep': bench_icmp_sweep,
+    'logger': bench_logger,
+    'dns_client': bench_dns_client,
+    'log_memory': bench_log_memory,
+    'csv_export': bench_csv_export,
+    'columnar': bench_columnar,
+    'html_report': bench_html_report,
+    'bandwidth': bench_bandwidth,
+    'jitter': bench_jitter,
+    'monitor': bench_monitor,
+    'timeseries': bench_timeseries,
+    'metrics': bench_metrics,
+}
+
+# ============================================================================
+# HARNESS
+# ============================================================================
+
+# Tham số số lượng được nhân với --scale
+SCALED_OPTIONS = ('log_entries', 'dns_queries', 'dns_domains', 'memory_entries', 'csv_entries', 'csv_memory_entries',
+                  'columnar_entries', 'html_entries', 'connectivity_hosts', 'monitor_targets', 'ts_samples',
+                  'metrics_targets')
+
+# Hướng tốt của metric theo hậu tố tên key, dùng khi --compare
+HIGHER_IS_BETTER = ('_per_second', '_mbps', 'speedup', 'reduction')
+LOWER_IS_BETTER = ('_ms', '_us', '_seconds', 'peak_rss_mb', 'peak_megabytes')
+
+def run_benchmark(name, args):
+    """Chạy một benchmark trong thư mục tạm riêng, thêm wall time và peak RSS của process"""
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        result = BENCHMARKS[name](args, workdir)
+        elapsed = time.perf_counter() - start
+    return {**result, 'wall_seconds': round(elapsed, 3), 'peak_rss_mb': peak_rss_mb()}
+
+def run_isolated(name, args):
+    """Chạy benchmark trong process mới (spawn) để peak RSS và state không lẫn giữa các benchmark"""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_benchmark, name, args).result()
+
+def run_metadata(args):
+    """Commit, môi trường và tham số của lần chạy để so sánh report giữa các commit"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'isolated': not args.no_isolate,
+        'options': {key: value for key, value in vars(args).items()
+                    if key not in ('benchmarks', 'output', 'compare', 'threshold')}
+    }
+
+def metric_direction(key):
+    """1 nếu metric càng lớn càng tốt, -1 nếu càng nhỏ càng tốt, 0 nếu không so sánh"""
+    name = key.rsplit(".", 1)[-1]
+    if name.endswith(HIGHER_IS_BETTER):
+        return 1
+    if name.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+def flatten_metrics(benchmarks):
+    """{'benchmark.key.subkey': số} cho mọi metric có hướng tốt/xấu"""
+    metrics = {}
+
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(f"{prefix}.{key}", item)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and metric_direction(prefix):
+            metrics[prefix] = value
+
+    for name, result in benchmarks.items():
+        walk(name, result)
+    return metrics
+
+def compare_reports(baseline, current, threshold):
+    """So sánh metric chung của hai report, in bảng ra stderr và trả về số regression vượt `threshold` %"""
+    old_metrics = flatten_metrics(baseline.get('benchmarks', {}))
+    new_metrics = flatten_metrics(current['benchmarks'])
+    regressions = 0
+    print(f"📊 So sánh với {baseline.get('meta', {}).get('commit') or 'baseline'} "
+          f"(ngưỡng {threshold}%):", file=sys.stderr)
+    for key in sorted(old_metrics.keys() & new_metrics.keys()):
+        old, new = old_metrics[key], new_metrics[key]
+        if not old:
+            continue
+        change = (new - old) / abs(old) * 100 * metric_direction(key)
+        marker = "  "
+        if change < -threshold:
+            marker = "❌"
+            regressions += 1
+        elif change > threshold:
+            marker = "✅"
+        print(f"{marker} {key:<60} {old:>12g} -> {new:<12g} ({change:+.1f}%)", file=sys.stderr)
+    print(f"{'❌' if regressions else '✅'} {regressions} regression", file=sys.stderr)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Network Toolkit benchmarks (loopback only)")
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS),
+                        help=f"Benchmarks cần chạy ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--base-port", type=int, default=40000)
+    parser.add_argument("--span", type=int, default=10000, help="Số port trong range scan")
+    parser.add_argument("--every", type=int, default=20, help="Khoảng cách giữa các listener")
+    parser.add_argument("--filtered", type=int, default=400, help="Số port giả lập bị filter")
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--log-entries", type=int, default=200000)
+    parser.add_argument("--log-threads", type=int, default=50)
+    parser.add_argument("--connectivity-hosts", type=int, default=500)
+    parser.add_argument("--connectivity-rounds", type=int, default=20)
+    parser.add_argument("--icmp-network", default="127.0.0.0/20", help="Range loopback cho benchmark icmp_sweep")
+    parser.add_argument("--icmp-window", type=int, default=256)
+    parser.add_argument("--dns-queries", type=int, default=20000)
+    parser.add_argument("--dns-domains", type=int, default=500)
+    parser.add_argument("--dns-window", type=int, default=256)
+    parser.add_argument("--memory-entries", type=int, default=1000000)
+    parser.add_argument("--csv-entries", type=int, default=1000000)
+    parser.add_argument("--csv-memory-entries", type=int, default=100000,
+                        help="max_memory_entries của logger trong benchmark csv_export")
+    parser.add_argument("--columnar-entries", type=int, default=1000000)
+    parser.add_argument("--html-entries", type=int, default=500000)
+    parser.add_argument("--bw-duration", type=float, default=3.0)
+    parser.add_argument("--bw-streams", type=int, default=4)
+    parser.add_argument("--bw-buffer", type=int, default=262144)
+    parser.add_argument("--http-body", type=int, default=1 << 20, help="Kích thước body mỗi GET của HttpSink")
+    parser.add_argument("--jitter-rates", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--jitter-packet-size", type=int, default=172)
+    parser.add_argument("--jitter-duration", type=float, default=2.0)
+    parser.add_argument("--monitor-targets", type=int, default=2000)
+    parser.add_argument("--monitor-interval", type=float, default=10.0)
+    parser.add_argument("--monitor-duration", type=float, default=30.0)
+    parser.add_argument("--ts-samples", type=int, default=1000000)
+    parser.add_argument("--ts-series", type=int, default=1000)
+    parser.add_argument("--metrics-targets", type=int, default=5000)
+    parser.add_argument("--metrics-rounds", type=int, default=200)
+    parser.add_argument("--metrics-scrapes", type=int, default=20)
+    parser.add_argument("--csv-memory-budget", type=float, default=64, help="Giới hạn bộ nhớ export (MB)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Nhân số entry/query/target của các benchmark (vd. 0.1 để chạy nhanh)")
+    parser.add_argument("--no-isolate", action="store_true",
+                        help="Chạy mọi benchmark trong process hiện tại (peak RSS cộng dồn)")
+    parser.add_argument("--output", help="Ghi report JSON ra file")
+    parser.add_argument("--compare", metavar="BASELINE", help="So sánh với report JSON cũ, exit 1 nếu có regression")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Ngưỡng regression khi --compare (%%)")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        print(f"❌ Không có benchmark: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    for option in SCALED_OPTIONS:
+        setattr(args, option, max(1, int(getattr(args, option) * args.scale)))
+
+    report = {'meta': run_metadata(args), 'benchmarks': {}}
+    for name in args.benchmarks:
+        print(f"⏱️ {name}...", file=sys.stderr)
+        report['benchmarks'][name] = run_benchmark(name, args) if args.no_isolate else run_isolated(name, args)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare_reports(baseline, report, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
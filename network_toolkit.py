@@ -6,57 +6,1510 @@ Hợp nhất tất cả các tính năng thành một tool duy nhất với menu
 """
 
 import socket
+import errno
+import select
+import selectors
+import struct
 import subprocess
 import platform
 import time
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import json
 import sys
 import os
+import math
+import random
+import heapq
+import atexit
+import contextlib
+import io
+import bisect
+import array
+import mmap
+import queue
+import hashlib
+import html
+import ipaddress
+import itertools
+from collections import OrderedDict, deque
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any
+
+# ============================================================================
+# LATENCY STATISTICS
+# ============================================================================
+
+class LatencyStats:
+    """Aggregate latency (ms) với bộ nhớ cố định
+    
+    count/min/max/mean chính xác; percentile lấy từ histogram log-scale
+    (bucket rộng 5%, sai số tương đối ~2.5%).
+    """
+    
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+    
+    BUCKET_RATIO = 1.05
+    LOG_RATIO = math.log(BUCKET_RATIO)
+    MIN_VALUE_MS = 0.001
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = {}  # bucket index -> count
+    
+    def add(self, value_ms):
+        self.count += 1
+        self.total += value_ms
+        if self.min is None or value_ms < self.min:
+            self.min = value_ms
+        if self.max is None or value_ms > self.max:
+            self.max = value_ms
+        index = self.bucket_index(value_ms)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+    
+    @classmethod
+    def bucket_index(cls, value_ms):
+        return math.floor(math.log(max(value_ms, cls.MIN_VALUE_MS)) / cls.LOG_RATIO)
+    
+    @classmethod
+    def bucket_bounds(cls, index):
+        """(lower, upper) của bucket theo ms"""
+        return cls.BUCKET_RATIO ** index, cls.BUCKET_RATIO ** (index + 1)
+    
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Điểm giữa (geometric) của bucket, kẹp trong [min, max]
+                value = self.BUCKET_RATIO ** (index + 0.5)
+                return min(max(value, self.min), self.max)
+        return self.max
+    
+    def histogram(self, bins=20):
+        """Gộp các bucket 5% thành tối đa `bins` cột: list (lower_ms, upper_ms, count)"""
+        if not self.buckets:
+            return []
+        first, last = min(self.buckets), max(self.buckets)
+        width = max(1, math.ceil((last - first + 1) / bins))
+        counts = {}
+        for index, count in self.buckets.items():
+            group = (index - first) // width
+            counts[group] = counts.get(group, 0) + count
+        
+        result = []
+        for group in range(max(counts) + 1):
+            lower = self.bucket_bounds(first + group * width)[0]
+            upper = self.bucket_bounds(first + (group + 1) * width - 1)[1]
+            result.append((max(lower, self.min), min(upper, self.max), counts.get(group, 0)))
+        return result
+    
+    def to_dict(self) -> Dict[str, Any]:
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'min': round(self.min, 3),
+            'max': round(self.max, 3),
+            'mean': round(self.total / self.count, 3),
+            'p50': round(self.percentile(50), 3),
+            'p95': round(self.percentile(95), 3),
+            'p99': round(self.percentile(99), 3)
+        }
+
+# ============================================================================
+# INSTRUMENTATION
+# ============================================================================
+
+class Span:
+    """Một đoạn đo thời gian (perf_counter_ns), dùng qua `Instrumentation.span()`"""
+    
+    __slots__ = ('instrumentation', 'name', 'labels', 'start_ns', 'duration_ns')
+    
+    def __init__(self, instrumentation, name, labels):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.labels = labels
+        self.start_ns = None
+        self.duration_ns = None
+    
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ns = time.perf_counter_ns() - self.start_ns
+        if exc_type is not None:
+            self.labels = {**self.labels, 'error': exc_type.__name__}
+        self.instrumentation.record(self.name, self.duration_ns, self.labels)
+        return False
+    
+    @property
+    def duration_ms(self):
+        """Thời gian của span (ms), đo tới hiện tại nếu span chưa kết thúc"""
+        duration_ns = self.duration_ns if self.duration_ns is not None else time.perf_counter_ns() - self.start_ns
+        return round(duration_ns / 1e6, 3)
+
+class Instrumentation:
+    """Span đo các đoạn nóng của toolkit (DNS, connect, send/recv, subprocess, ghi log)
+    
+    Mỗi span kết thúc được cộng vào LatencyStats theo tên (`stats()`) và đưa cho từng sink
+    `sink(name, duration_ns, labels)`, vd. MetricsRegistry.observe_span. `profile()` bật
+    cProfile (mọi thread tạo ra trong lúc capture) và/hoặc tracemalloc cho một đoạn code.
+    """
+    
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.sinks = []
+        self._stats = {}  # tên span -> LatencyStats (ms)
+        self._lock = threading.Lock()
+    
+    def span(self, name, **labels):
+        return Span(self, name, labels)
+    
+    def record(self, name, duration_ns, labels=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = LatencyStats()
+            stats.add(duration_ns / 1e6)
+        for sink in self.sinks:
+            try:
+                sink(name, duration_ns, labels or {})
+            except Exception:
+                pass
+    
+    def stats(self) -> Dict[str, Any]:
+        """Aggregate theo tên span: count, min/max/mean, p50/p95/p99 (ms)"""
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in sorted(self._stats.items())}
+    
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+    
+    @contextlib.contextmanager
+    def profile(self, name, cpu=True, memory=False, output_prefix=None, top=15):
+        """Capture cProfile/tracemalloc trong block, điền kết quả vào dict được yield
+        
+        Trước Python 3.12 cProfile chỉ đo thread đã bật nó, nên mỗi thread mới tạo trong lúc
+        capture (vd. worker của test suite) có profiler riêng và được gộp lại khi kết thúc.
+        Từ 3.12 cProfile chạy trên sys.monitoring: một profiler đã thấy mọi thread và chỉ được
+        bật một profiler mỗi lúc, nên chỉ dùng một profiler cho cả process (`profile_scope`).
+        `output_prefix` thì ghi thêm file `<prefix>.prof` (đọc bằng pstats/snakeviz).
+        """
+        import cProfile
+        import pstats
+        import tracemalloc
+        
+        report = {'name': name}
+        profilers = []
+        started_tracing = False
+        per_thread = not hasattr(sys, 'monitoring')
+        
+        def start_thread_profiler(frame, event, arg):
+            sys.setprofile(None)
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Đã có profiler khác đang chạy: bỏ qua thread này, không làm chết worker
+                return
+            profilers.append(profiler)
+        
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        elif memory and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        elif memory:
+            # Python 3.8 không có reset_peak: restart để peak chỉ tính block này
+            tracemalloc.stop()
+            tracemalloc.start()
+        if cpu:
+            main_profiler = cProfile.Profile()
+            profilers.append(main_profiler)
+            report['profile_scope'] = "per_thread" if per_thread else "process"
+            if per_thread:
+                threading.setprofile(start_thread_profiler)
+            main_profiler.enable()
+        
+        start_ns = time.perf_counter_ns()
+        try:
+            yield report
+        finally:
+            report['duration_ms'] = round((time.perf_counter_ns() - start_ns) / 1e6, 3)
+            if cpu:
+                if per_thread:
+                    threading.setprofile(None)
+                for profiler in profilers:
+                    profiler.disable()
+            if memory:
+                # Snapshot trước khi gộp stats để allocation của pstats không lẫn vào top
+                current, peak = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot().filter_traces([
+                    tracemalloc.Filter(False, pattern) for pattern in ("*cProfile.py", "*pstats.py", "*tracemalloc.py")
+                ])
+                report['memory_current_kb'] = round(current / 1024, 1)
+                report['memory_peak_kb'] = round(peak / 1024, 1)
+                report['top_allocations'] = [
+                    {'location': f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                     'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:top]
+                ]
+            if cpu:
+                stats = pstats.Stats(main_profiler, stream=io.StringIO())
+                for profiler in profilers[1:]:
+                    stats.add(profiler)
+                if output_prefix:
+                    report['profile_file'] = output_prefix + ".prof"
+                    stats.dump_stats(report['profile_file'])
+                if per_thread:
+                    report['threads_profiled'] = len(profilers)
+                report['top_functions'] = [
+                    {'function': f"{os.path.basename(filename)}:{line}({function})", 'calls': calls,
+                     'total_seconds': round(total, 4), 'cumulative_seconds': round(cumulative, 4)}
+                    for (filename, line, function), (_, calls, total, cumulative, _) in
+                    sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+                ]
+            if memory:
+                if started_tracing:
+                    tracemalloc.stop()
+
+# ============================================================================
+# LOG RECORD
+# ============================================================================
+
+class LogRecord:
+    """Log entry gọn nhẹ cho session dài
+    
+    Dùng __slots__, timestamp là float epoch, action/status được intern, message lưu
+    UTF-8 và details lưu thành (keys tuple dùng chung theo shape, values tuple).
+    Vẫn đọc được như dict cũ (`record['status']`, `record.get('details')`, `to_dict()`);
+    dict trả về từ `details` là bản copy, sửa nó không thay đổi record.
+    """
+    
+    __slots__ = ('created', 'session_id', 'action', 'status', '_message', '_detail_keys', '_detail_values')
+    
+    FIELDS = ('timestamp', 'session_id', 'action', 'status', 'message', 'details')
+    _shapes = {}  # keys tuple -> tuple dùng chung cho mọi record cùng shape
+    
+    def __init__(self, action, status, message="", details=None, session_id="", created=None):
+        self.created = time.time() if created is None else created
+        self.session_id = session_id
+        self.action = sys.intern(action)
+        self.status = sys.intern(status)
+        self._message = message.encode('utf-8')
+        if details:
+            keys = tuple(details)
+            self._detail_keys = self._shapes.setdefault(keys, keys)
+            self._detail_values = tuple(details.values())
+        else:
+            self._detail_keys = self._detail_values = ()
+    
+    @classmethod
+    def from_dict(cls, entry):
+        """Tạo record từ dict format cũ (file JSON/JSONL)"""
+        try:
+            created = datetime.fromisoformat(entry['timestamp']).timestamp()
+        except (KeyError, TypeError, ValueError):
+            created = None
+        return cls(entry.get('action', ''), entry.get('status', ''), entry.get('message', ''),
+                   entry.get('details'), entry.get('session_id', ''), created)
+    
+    @property
+    def message(self):
+        return self._message.decode('utf-8')
+    
+    @property
+    def details(self):
+        return dict(zip(self._detail_keys, self._detail_values))
+    
+    @property
+    def detail_keys(self):
+        return self._detail_keys
+    
+    def detail_items(self):
+        """Duyệt (key, value) của details mà không tạo dict"""
+        return zip(self._detail_keys, self._detail_values)
+    
+    @property
+    def timestamp(self):
+        return datetime.fromtimestamp(self.created).isoformat()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'timestamp': self.timestamp,
+            'session_id': self.session_id,
+            'action': self.action,
+            'status': self.status,
+            'message': self.message,
+            'details': self.details
+        }
+    
+    # Truy cập kiểu dict cho code đọc log cũ
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+    
+    def __contains__(self, key):
+        return key in self.FIELDS
+    
+    def keys(self):
+        return self.FIELDS
+    
+    def __repr__(self):
+        return f"LogRecord({self.timestamp!r}, {self.action!r}, {self.status!r}, {self.message!r})"
+
+# ============================================================================
+# LOG RETENTION
+# ============================================================================
+
+class LogBuffer:
+    """Ring buffer giữ các log entry gần nhất trong bộ nhớ, phần cũ hơn tràn ra disk
+    
+    `append()` luôn giữ entry trong bộ nhớ; writer thread gọi `spill_overflow()` để ghi
+    các entry vượt quá `max_entries` ra segment file JSON Lines rồi mới bỏ khỏi bộ nhớ,
+    nên mỗi entry luôn nằm ở bộ nhớ hoặc trên disk. Duyệt buffer (`for log in logs`) trả
+    về toàn bộ session theo thứ tự: segment trên disk trước, rồi tới bộ nhớ.
+    `max_entries=None` giữ tất cả trong bộ nhớ như list cũ.
+    """
+    
+    def __init__(self, max_entries=None, spill_prefix="network_toolkit_logs", segment_entries=100000):
+        self.max_entries = max_entries
+        self.spill_prefix = spill_prefix
+        self.segment_entries = segment_entries
+        self.spilled = 0
+        self.dropped = 0  # entry đã spill nhưng segment bị xóa khi close()
+        self.segments = []  # [path, số entry]
+        self._memory = deque()
+        self._segment = None
+        self._lock = threading.Lock()
+    
+    def append(self, record):
+        with self._lock:
+            self._memory.append(record)
+    
+    def __len__(self):
+        return self.spilled + len(self._memory)
+    
+    def __bool__(self):
+        return len(self) > 0
+    
+    @property
+    def in_memory(self):
+        return len(self._memory)
+    
+    def recent(self, count):
+        """`count` entry mới nhất (chỉ lấy từ bộ nhớ)"""
+        with self._lock:
+            start = max(0, len(self._memory) - count)
+            return list(itertools.islice(self._memory, start, None))
+    
+    def spill_overflow(self):
+        """Ghi các entry vượt quá max_entries ra segment file rồi bỏ khỏi bộ nhớ"""
+        if self.max_entries is None:
+            return 0
+        with self._lock:
+            overflow = len(self._memory) - self.max_entries
+            if overflow <= 0:
+                return 0
+            batch = list(itertools.islice(self._memory, overflow))
+        
+        # Chỉ thread gọi spill_overflow() lấy entry ra khỏi đầu deque, nên batch vẫn là
+        # các entry cũ nhất khi ghi xong
+        try:
+            self._write_segments(batch)
+        except Exception as e:
+            print(f"❌ Lỗi ghi log segment: {e}")
+            return 0
+        
+        with self._lock:
+            for _ in range(overflow):
+                self._memory.popleft()
+            self.spilled += overflow
+        return overflow
+    
+    def _write_segments(self, batch):
+        start = 0
+        while start < len(batch):
+            if self._segment is None or self.segments[-1][1] >= self.segment_entries:
+                if self._segment is not None:
+                    self._segment.close()
+                path = f"{self.spill_prefix}.{len(self.segments):04d}.jsonl"
+                self._segment = open(path, 'w', encoding='utf-8', buffering=1 << 16)
+                self.segments.append([path, 0])
+            
+            room = self.segment_entries - self.segments[-1][1]
+            chunk = batch[start:start + room]
+            self._segment.write("".join(json.dumps(entry.to_dict(), ensure_ascii=False, default=str) + "\n"
+                                        for entry in chunk))
+            self._segment.flush()
+            self.segments[-1][1] += len(chunk)
+            start += len(chunk)
+    
+    def __iter__(self):
+        with self._lock:
+            spilled = self.spilled
+            segments = [path for path, _ in self.segments]
+            memory = list(self._memory)
+        
+        remaining = spilled
+        for path in segments:
+            if remaining <= 0:
+                break
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in itertools.islice(f, remaining):
+                    remaining -= 1
+                    yield LogRecord.from_dict(json.loads(line))
+        yield from memory
+    
+    def close(self):
+        """Đóng và xóa segment files (session đầy đủ đã nằm trong file JSON/JSONL)
+        
+        Sau đó buffer chỉ còn các entry trong bộ nhớ; số entry bỏ đi nằm ở `dropped`.
+        """
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            segments, self.segments = self.segments, []
+            self.dropped += self.spilled
+            self.spilled = 0
+        for path, _ in segments:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+# ============================================================================
+# COLUMNAR LOG FORMAT
+# ============================================================================
+
+class ColumnarLog:
+    """File log dạng cột (stdlib, không cần Parquet) để phân tích session lớn
+    
+    Layout: MAGIC, các cột fixed-width (little-endian, căn 8 byte), string table
+    (offsets uint32 + UTF-8 blob), directory JSON, rồi footer `<I độ dài directory>` + MAGIC.
+    action/status/message/host là index (uint32) vào string table dùng chung; timestamp
+    và latency_ms là float64 (NaN nếu không có), port là int32 (-1 nếu không có).
+    
+    Reader mở file bằng mmap và trả về các cột dạng memoryview, không parse hay copy dữ liệu;
+    string table cũng chỉ decode khi được truy cập.
+    """
+    
+    MAGIC = b"NTCOL001"
+    VERSION = 1
+    COLUMNS = (
+        ('timestamp', 'd'),
+        ('action', 'I'),
+        ('status', 'I'),
+        ('message', 'I'),
+        ('host', 'I'),
+        ('port', 'i'),
+        ('latency_ms', 'd'),
+    )
+    STRING_COLUMNS = ('action', 'status', 'message', 'host')
+    HOST_KEYS = ('host', 'target', 'domain', 'ip')
+    
+    class StringTable:
+        """String table trên mmap, decode từng string khi được truy cập lần đầu"""
+        
+        def __init__(self, offsets, data):
+            self._offsets = offsets
+            self._data = data
+            self._cache = [None] * (len(offsets) - 1)
+        
+        def __len__(self):
+            return len(self._cache)
+        
+        def __getitem__(self, index):
+            value = self._cache[index]
+            if value is None:
+                value = self._cache[index] = str(self._data[self._offsets[index]:self._offsets[index + 1]], 'utf-8')
+            return value
+        
+        def __iter__(self):
+            return (self[i] for i in range(len(self)))
+        
+        def index(self, value):
+            """Index của một string (vd. để lọc cột action mà không decode cả cột)"""
+            for i, item in enumerate(self):
+                if item == value:
+                    return i
+            raise ValueError(value)
+    
+    @classmethod
+    def write(cls, path, logs, session_id=""):
+        """Ghi iterable LogRecord ra file, trả về số dòng"""
+        columns = {name: array.array(code) for name, code in cls.COLUMNS}
+        strings = {}  # string -> index trong string table
+        
+        timestamps, ports, latencies = columns['timestamp'], columns['port'], columns['latency_ms']
+        encoded = [(columns[name], name) for name in cls.STRING_COLUMNS]
+        nan = float('nan')
+        
+        for log in logs:
+            details = dict(log.detail_items())
+            host = next((details[key] for key in cls.HOST_KEYS if key in details), "")
+            values = {'action': log.action, 'status': log.status, 'message': log.message, 'host': str(host)}
+            for column, name in encoded:
+                value = values[name]
+                index = strings.get(value)
+                if index is None:
+                    index = strings[value] = len(strings)
+                column.append(index)
+            
+            timestamps.append(log.created)
+            port = details.get('port')
+            ports.append(port if isinstance(port, int) and not isinstance(port, bool) else -1)
+            latency = NetworkLogger.extract_latency_ms(details)
+            latencies.append(nan if latency is None else latency)
+        
+        blob = bytearray()
+        offsets = array.array('I', [0])
+        for value in strings:
+            blob += value.encode('utf-8')
+            offsets.append(len(blob))
+        
+        directory = {'version': cls.VERSION, 'session_id': session_id, 'rows': len(timestamps), 'columns': []}
+        with open(path, 'wb') as f:
+            f.write(cls.MAGIC)
+            
+            def write_block(data):
+                padding = -f.tell() % 8
+                f.write(b"\0" * padding)
+                offset = f.tell()
+                f.write(data)
+                return offset
+            
+            for name, code in cls.COLUMNS:
+                column = columns[name]
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                directory['columns'].append({'name': name, 'type': code,
+                                             'offset': write_block(column.tobytes()), 'count': len(column)})
+            if sys.byteorder != 'little':
+                offsets.byteswap()
+            directory['strings'] = {'count': len(strings), 'offsets': write_block(offsets.tobytes()),
+                                    'data': write_block(bytes(blob)), 'size': len(blob)}
+            
+            raw = json.dumps(directory).encode('utf-8')
+            f.write(raw)
+            f.write(struct.pack("<I", len(raw)) + cls.MAGIC)
+        return len(timestamps)
+    
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # file rỗng
+            self._file.close()
+            raise ValueError(f"{path}: không phải file columnar log")
+        
+        tail = len(self._mmap) - 12
+        if tail < len(self.MAGIC) or self._mmap[:8] != self.MAGIC or self._mmap[tail + 4:] != self.MAGIC:
+            self.close()
+            raise ValueError(f"{path}: không phải file columnar log")
+        size = struct.unpack_from("<I", self._mmap, tail)[0]
+        self.directory = json.loads(self._mmap[tail - size:tail])
+        self.session_id = self.directory.get('session_id', "")
+        
+        view = memoryview(self._mmap)
+        self._views = [view]
+        self.columns = {}
+        for column in self.directory['columns']:
+            self.columns[column['name']] = self._array(view, column['offset'], column['type'], column['count'])
+        
+        table = self.directory['strings']
+        offsets = self._array(view, table['offsets'], 'I', table['count'] + 1)
+        data = view[table['data']:table['data'] + table['size']]
+        self._views.append(data)
+        self.strings = self.StringTable(offsets, data)
+    
+    def _array(self, view, offset, code, count):
+        """memoryview trỏ thẳng vào mmap (copy + byteswap trên máy big-endian)"""
+        size = array.array(code).itemsize
+        raw = view[offset:offset + size * count]
+        self._views.append(raw)
+        if sys.byteorder == 'little':
+            column = raw.cast(code)
+            self._views.append(column)
+            return column
+        column = array.array(code, bytes(raw))
+        column.byteswap()
+        return column
+    
+    def __len__(self):
+        return self.directory['rows']
+    
+    def decode(self, name):
+        """Giá trị string của một cột dictionary-encoded"""
+        strings = self.strings
+        return [strings[index] for index in self.columns[name]]
+    
+    def rows(self):
+        """Duyệt từng dòng dạng dict (tiện cho script nhỏ; phân tích lớn nên dùng cột)"""
+        names = [name for name, _ in self.COLUMNS]
+        for values in zip(*(self.columns[name] for name in names)):
+            row = dict(zip(names, values))
+            for name in self.STRING_COLUMNS:
+                row[name] = self.strings[row[name]]
+            yield row
+    
+    def close(self):
+        for view in reversed(getattr(self, '_views', [])):
+            view.release()
+        self._views = []
+        self.columns = {}
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+# ============================================================================
+# TIME-SERIES STORE
+# ============================================================================
+
+class TimeSeriesStore:
+    """Lịch sử latency/success theo (probe, target) trong SQLite, có rollup 1m/1h và retention
+    
+    Sample thô nằm trong bảng `samples`; mỗi lần ghi cũng cộng dồn vào `rollup_1m` và
+    `rollup_1h` (count, success, sum/min/max latency) nên query khoảng dài không phải
+    đọc lại sample thô. Retention của từng mức (giây) được áp dụng định kỳ khi ghi.
+    
+    Dùng làm sink của NetworkLogger (`logger.attach_store(store)`): writer thread gọi
+    `write(records)` với mỗi batch log, entry có target (host/domain/ip) và status
+    success/error thành một sample. Query mở connection đọc riêng (WAL) và trả về
+    generator, không load cả khoảng thời gian vào bộ nhớ.
+    """
+    
+    RESOLUTIONS = {'raw': None, '1m': 60, '1h': 3600}
+    DEFAULT_RETENTION = {'raw': 2 * 86400, '1m': 14 * 86400, '1h': 400 * 86400}
+    TARGET_KEYS = ColumnarLog.HOST_KEYS
+    # Monitor ghi sample trực tiếp qua logger.record_samples(), không lấy lại từ log entry
+    SKIP_ACTION_PREFIXES = ('monitor',)
+    
+    def __init__(self, path="network_toolkit_metrics.db", retention=None, prune_interval=600.0):
+        import sqlite3
+        
+        self.path = path
+        self.retention = {**self.DEFAULT_RETENTION, **(retention or {})}
+        self.prune_interval = prune_interval
+        self._last_prune = None
+        self._series = {}  # (probe, target) -> series id
+        self._lock = threading.Lock()
+        
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS series (
+                id INTEGER PRIMARY KEY, probe TEXT NOT NULL, target TEXT NOT NULL, UNIQUE (probe, target));
+            CREATE TABLE IF NOT EXISTS samples (
+                series_id INTEGER NOT NULL, ts REAL NOT NULL, latency_ms REAL, success INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS samples_series_ts ON samples (series_id, ts);
+        """ + "".join(f"""
+            CREATE TABLE IF NOT EXISTS rollup_{name} (
+                series_id INTEGER NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL,
+                success INTEGER NOT NULL, latency_count INTEGER NOT NULL, latency_sum REAL NOT NULL,
+                latency_min REAL, latency_max REAL, PRIMARY KEY (series_id, bucket)) WITHOUT ROWID;
+        """ for name in self.rollups()))
+        for series_id, probe, target in self._db.execute("SELECT id, probe, target FROM series"):
+            self._series[(probe, target)] = series_id
+    
+    @classmethod
+    def rollups(cls):
+        return [name for name, seconds in cls.RESOLUTIONS.items() if seconds]
+    
+    @classmethod
+    def sample_from_record(cls, record):
+        """(ts, probe, target, latency_ms, success) từ một LogRecord, None nếu không phải kết quả probe"""
+        if record.status not in ('success', 'error') or record.action.startswith(cls.SKIP_ACTION_PREFIXES):
+            return None
+        details = dict(record.detail_items())
+        target = next((details[key] for key in cls.TARGET_KEYS if details.get(key)), None)
+        if target is None:
+            return None
+        port = details.get('port')
+        if isinstance(port, int) and not isinstance(port, bool):
+            target = f"{target}:{port}"
+        latency_ms = NetworkLogger.extract_latency_ms(details) if record.status == 'success' else None
+        return record.created, record.action, str(target), latency_ms, record.status == 'success'
+    
+    def write(self, records):
+        """Sink của NetworkLogger: ghi các entry là kết quả probe"""
+        samples = [sample for sample in map(self.sample_from_record, records) if sample is not None]
+        if samples:
+            self.add_samples(samples)
+    
+    def _series_id(self, probe, target):
+        series_id = self._series.get((probe, target))
+        if series_id is None:
+            self._db.execute("INSERT OR IGNORE INTO series (probe, target) VALUES (?, ?)", (probe, target))
+            series_id = self._db.execute("SELECT id FROM series WHERE probe = ? AND target = ?",
+                                         (probe, target)).fetchone()[0]
+            self._series[(probe, target)] = series_id
+        return series_id
+    
+    def add_samples(self, samples):
+        """Ghi list (ts, probe, target, latency_ms hoặc None, success) trong một transaction"""
+        with self._lock, self._db:
+            rows = []
+            rollups = {name: {} for name in self.rollups()}
+            for ts, probe, target, latency_ms, success in samples:
+                series_id = self._series_id(probe, target)
+                rows.append((series_id, ts, latency_ms, int(bool(success))))
+                
+                # Gộp trước trong batch: mỗi (series, bucket) chỉ một lệnh upsert
+                for name, buckets in rollups.items():
+                    key = (series_id, int(ts // self.RESOLUTIONS[name]) * self.RESOLUTIONS[name])
+                    bucket = buckets.get(key)
+                    if bucket is None:
+                        bucket = buckets[key] = [0, 0, 0, 0.0, None, None]
+                    bucket[0] += 1
+                    bucket[1] += bool(success)
+                    if latency_ms is not None:
+                        bucket[2] += 1
+                        bucket[3] += latency_ms
+                        bucket[4] = latency_ms if bucket[4] is None else min(bucket[4], latency_ms)
+                        bucket[5] = latency_ms if bucket[5] is None else max(bucket[5], latency_ms)
+            
+            self._db.executemany("INSERT INTO samples VALUES (?, ?, ?, ?)", rows)
+            for name, buckets in rollups.items():
+                self._db.executemany(f"""
+                    INSERT INTO rollup_{name} VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (series_id, bucket) DO UPDATE SET
+                        count = count + excluded.count,
+                        success = success + excluded.success,
+                        latency_count = latency_count + excluded.latency_count,
+                        latency_sum = latency_sum + excluded.latency_sum,
+                        latency_min = min(coalesce(latency_min, excluded.latency_min),
+                                          coalesce(excluded.latency_min, latency_min)),
+                        latency_max = max(coalesce(latency_max, excluded.latency_max),
+                                          coalesce(excluded.latency_max, latency_max))
+                """, ((*key, *values) for key, values in buckets.items()))
+        
+        if self._last_prune is None or time.monotonic() - self._last_prune >= self.prune_interval:
+            self.prune()
+    
+    def prune(self, now=None):
+        """Xóa dữ liệu quá retention của từng mức, trả về số dòng đã xóa"""
+        now = now if now is not None else time.time()
+        deleted = 0
+        with self._lock, self._db:
+            # Xóa theo từng series để dùng index (series_id, ts/bucket)
+            series_ids = list(self._series.values())
+            for series_id in series_ids:
+                deleted += self._db.execute("DELETE FROM samples WHERE series_id = ? AND ts < ?",
+                                            (series_id, now - self.retention['raw'])).rowcount
+                for name in self.rollups():
+                    deleted += self._db.execute(f"DELETE FROM rollup_{name} WHERE series_id = ? AND bucket < ?",
+                                                (series_id, now - self.retention[name])).rowcount
+        self._last_prune = time.monotonic()
+        return deleted
+    
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+    
+    def series(self, probe=None):
+        """List (probe, target) đã có dữ liệu"""
+        with self._lock:
+            keys = list(self._series)
+        return sorted(key for key in keys if probe is None or key[0] == probe)
+    
+    @classmethod
+    def pick_resolution(cls, start, end):
+        """Mức chi tiết phù hợp với độ dài khoảng query"""
+        span = (end or time.time()) - (start or 0)
+        if span <= 2 * 3600:
+            return 'raw'
+        return '1m' if span <= 2 * 86400 else '1h'
+    
+    def query(self, probe=None, target=None, start=None, end=None, resolution=None):
+        """Generator các dòng dict trong [start, end) (epoch giây), theo series rồi thời gian
+        
+        resolution 'raw' trả về từng sample; '1m'/'1h' trả về bucket với count, success_rate,
+        mean/min/max latency. None thì tự chọn theo độ dài khoảng.
+        """
+        import sqlite3
+        
+        resolution = resolution or self.pick_resolution(start, end)
+        if resolution not in self.RESOLUTIONS:
+            raise ValueError(f"Resolution không hợp lệ: {resolution} (hỗ trợ: {', '.join(self.RESOLUTIONS)})")
+        
+        conditions, params = [], []
+        for column, value in (('s.probe = ?', probe), ('s.target = ?', target)):
+            if value is not None:
+                conditions.append(column)
+                params.append(value)
+        time_column = 'd.ts' if resolution == 'raw' else 'd.bucket'
+        if start is not None:
+            conditions.append(f"{time_column} >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append(f"{time_column} < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        if resolution == 'raw':
+            sql = f"""SELECT d.ts, s.probe, s.target, d.latency_ms, d.success FROM samples d
+                      JOIN series s ON s.id = d.series_id {where} ORDER BY s.probe, s.target, d.ts"""
+        else:
+            sql = f"""SELECT d.bucket, s.probe, s.target, d.count, d.success, d.latency_count, d.latency_sum,
+                             d.latency_min, d.latency_max FROM rollup_{resolution} d
+                      JOIN series s ON s.id = d.series_id {where} ORDER BY s.probe, s.target, d.bucket"""
+        
+        db = sqlite3.connect(self.path)
+        try:
+            for row in db.execute(sql, params):
+                if resolution == 'raw':
+                    yield {'time': row[0], 'probe': row[1], 'target': row[2],
+                           'latency_ms': row[3], 'success': bool(row[4])}
+                else:
+                    bucket, probe_name, target_name, count, success, latency_count, latency_sum, low, high = row
+                    yield {'time': bucket, 'probe': probe_name, 'target': target_name, 'count': count,
+                           'success_rate': round(success / count * 100, 2),
+                           'mean_ms': round(latency_sum / latency_count, 3) if latency_count else None,
+                           'min_ms': round(low, 3) if low is not None else None,
+                           'max_ms': round(high, 3) if high is not None else None}
+        finally:
+            db.close()
+    
+    def export_csv(self, csv_file, probe=None, target=None, start=None, end=None, resolution=None):
+        """Ghi kết quả query ra CSV theo stream, trả về số dòng"""
+        import csv
+        
+        resolution = resolution or self.pick_resolution(start, end)
+        columns = (['time', 'probe', 'target', 'latency_ms', 'success'] if resolution == 'raw' else
+                   ['time', 'probe', 'target', 'count', 'success_rate', 'mean_ms', 'min_ms', 'max_ms'])
+        timespec = 'milliseconds' if resolution == 'raw' else 'seconds'
+        exported = 0
+        
+        def rows():
+            nonlocal exported
+            for row in self.query(probe, target, start, end, resolution):
+                exported += 1
+                row['time'] = datetime.fromtimestamp(row['time']).isoformat(timespec=timespec)
+                yield [row[column] for column in columns]
+        
+        with open(csv_file, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows())
+        return exported
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+# ============================================================================
+# PROMETHEUS METRICS
+# ============================================================================
+
+class MetricsRegistry:
+    """Metric aggregate sẵn cho Prometheus, cập nhật trong writer thread của NetworkLogger
+    
+    Là sink của logger: mỗi batch log cộng vào counter (action, status), histogram latency
+    theo action và các gauge của scan/bandwidth/loss; sample (từ log entry có target hoặc
+    từ `record_samples()` của monitor) cập nhật gauge up/latency theo (probe, target).
+    `render()` chỉ duyệt các series đã có, không bao giờ đọc `logger.logs`.
+    Số series theo target giới hạn bởi `max_series`, phần vượt được đếm vào
+    `network_toolkit_metrics_dropped_series_total`.
+    """
+    
+    PREFIX = "network_toolkit"
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+    LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    
+    # action -> (gauge, key trong details, hệ số đổi đơn vị, label lấy từ details)
+    GAUGES = {
+        'port_scan': (('scan_duration_seconds', 'scan_duration_seconds', 1, 'host'),
+                      ('scan_found', 'open_count', 1, 'host')),
+        'network_scan': (('scan_duration_seconds', 'scan_duration_seconds', 1, 'network_range'),
+                         ('scan_found', 'active_hosts_found', 1, 'network_range')),
+        'latency_test': (('packet_loss_ratio', 'loss_percent', 0.01, 'host'),),
+        'jitter_test': (('packet_loss_ratio', 'loss_percent', 0.01, 'host'),
+                        ('jitter_seconds', 'jitter_ms', 0.001, 'host')),
+    }
+    HELP = {
+        'probe_total': ("counter", "Số log entry theo action và status"),
+        'probe_duration_seconds': ("histogram", "Latency của probe thành công theo action"),
+        'target_up': ("gauge", "Kết quả probe gần nhất của target (1 = thành công)"),
+        'target_latency_seconds': ("gauge", "Latency probe thành công gần nhất của target"),
+        'target_probes_total': ("counter", "Số probe theo target và kết quả"),
+        'scan_duration_seconds': ("gauge", "Thời gian của lần scan gần nhất"),
+        'scan_found': ("gauge", "Số port mở / host phản hồi của lần scan gần nhất"),
+        'bandwidth_bytes_per_second': ("gauge", "Băng thông đo được gần nhất theo host và chiều"),
+        'packet_loss_ratio': ("gauge", "Tỉ lệ mất packet của lần đo gần nhất"),
+        'jitter_seconds': ("gauge", "Jitter RFC 3550 của lần đo gần nhất"),
+        'span_duration_seconds': ("histogram", "Thời gian các span instrumentation của toolkit"),
+        'metrics_dropped_series_total': ("counter", "Số series bị bỏ do vượt max_series"),
+    }
+    
+    def __init__(self, max_series=20000, providers=None):
+        self.max_series = max_series
+        self.providers = providers if providers is not None else {}  # name -> callable trả về dict số
+        self._lock = threading.Lock()
+        self._counts = {}  # (action, status) -> count
+        self._latency = {}  # action -> [bucket counts..., +Inf] , sum, count
+        self._spans = {}  # tên span -> cùng dạng với _latency
+        self._targets = {}  # (probe, target) -> [up, latency_s, successes, failures]
+        self._gauges = {}  # name -> {labels tuple: value}
+        self.dropped_series = 0
+    
+    def _observe(self, action, seconds, table=None):
+        table = self._latency if table is None else table
+        histogram = table.get(action)
+        if histogram is None:
+            histogram = table[action] = [[0] * (len(self.LATENCY_BUCKETS) + 1), 0.0, 0]
+        histogram[0][bisect.bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+    
+    def _series_slot(self, table, key, default):
+        """Lấy (hoặc tạo) series trong table; None nếu đã đủ max_series"""
+        value = table.get(key)
+        if value is None:
+            if len(self._targets) + sum(map(len, self._gauges.values())) >= self.max_series:
+                self.dropped_series += 1
+                return None
+            value = table[key] = default
+        return value
+    
+    def _set_gauge(self, name, labels, value):
+        gauge = self._gauges.setdefault(name, {})
+        if labels in gauge or self._series_slot(gauge, labels, value) is not None:
+            gauge[labels] = value
+    
+    def _sample(self, probe, target, latency_ms, success):
+        state = self._series_slot(self._targets, (probe, target), [0, None, 0, 0])
+        if state is None:
+            return
+        state[0] = 1 if success else 0
+        if success:
+            state[2] += 1
+            if latency_ms is not None:
+                state[1] = latency_ms / 1000
+        else:
+            state[3] += 1
+    
+    def write(self, records):
+        """Sink của NetworkLogger"""
+        with self._lock:
+            for record in records:
+                action, status = record.action, record.status
+                key = (action, status)
+                self._counts[key] = self._counts.get(key, 0) + 1
+                sample = TimeSeriesStore.sample_from_record(record)
+                if sample is not None:
+                    self._sample(*sample[1:])
+                if status != 'success':
+                    continue
+                
+                details = dict(record.detail_items())
+                latency_ms = NetworkLogger.extract_latency_ms(details)
+                if latency_ms is not None:
+                    self._observe(action, latency_ms / 1000)
+                
+                for name, detail_key, scale, label_key in self.GAUGES.get(action, ()):
+                    value = details.get(detail_key)
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        self._set_gauge(name, (('action', action), ('target', str(details.get(label_key)))),
+                                        value * scale)
+                if action == 'bandwidth_test':
+                    for direction in ('download', 'upload'):
+                        if isinstance(details.get(direction), dict):
+                            self._set_gauge('bandwidth_bytes_per_second',
+                                            (('host', str(details.get('host'))), ('direction', direction)),
+                                            details[direction].get('speed_bps', 0))
+    
+    def observe_span(self, name, duration_ns, labels=None):
+        """Sink của Instrumentation: histogram theo tên span"""
+        with self._lock:
+            self._observe(name, duration_ns / 1e9, self._spans)
+    
+    def add_samples(self, samples):
+        """Sample (ts, probe, target, latency_ms, success) từ logger.record_samples()"""
+        with self._lock:
+            for _, probe, target, latency_ms, success in samples:
+                key = (probe, 'success' if success else 'error')
+                self._counts[key] = self._counts.get(key, 0) + 1
+                if success and latency_ms is not None:
+                    self._observe(probe, latency_ms / 1000)
+                self._sample(probe, target, latency_ms, success)
+    
+    # ------------------------------------------------------------------
+    # Exposition
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _escape(value):
+        return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+    
+    @classmethod
+    def _labels(cls, pairs):
+        return "{" + ",".join(f'{name}="{cls._escape(value)}"' for name, value in pairs) + "}"
+    
+    @staticmethod
+    def _number(value):
+        return repr(float(value)) if isinstance(value, float) else str(value)
+    
+    def render(self):
+        """Text exposition format, O(số series)"""
+        with self._lock:
+            counts = dict(self._counts)
+            latency = {action: ([*buckets], total, count) for action, (buckets, total, count) in self._latency.items()}
+            spans = {name: ([*buckets], total, count) for name, (buckets, total, count) in self._spans.items()}
+            targets = {key: list(value) for key, value in self._targets.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+            dropped = self.dropped_series
+        
+        lines = []
+        labels, number = self._labels, self._number
+        
+        def header(name):
+            kind, text = self.HELP[name]
+            lines.append(f"# HELP {self.PREFIX}_{name} {text}")
+            lines.append(f"# TYPE {self.PREFIX}_{name} {kind}")
+        
+        header('probe_total')
+        for (action, status), count in sorted(counts.items()):
+            lines.append(f"{self.PREFIX}_probe_total{labels((('action', action), ('status', status)))} {count}")
+        
+        def histogram(name, label, series):
+            header(name)
+            for key, (buckets, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip((*self.LATENCY_BUCKETS, '+Inf'), buckets):
+                    cumulative += bucket_count
+                    lines.append(f"{self.PREFIX}_{name}_bucket{labels(((label, key), ('le', bound)))} {cumulative}")
+                lines.append(f"{self.PREFIX}_{name}_sum{labels(((label, key),))} {number(total)}")
+                lines.append(f"{self.PREFIX}_{name}_count{labels(((label, key),))} {count}")
+        
+        histogram('probe_duration_seconds', 'action', latency)
+        if spans:
+            histogram('span_duration_seconds', 'span', spans)
+        
+        if targets:
+            for name in ('target_up', 'target_latency_seconds', 'target_probes_total'):
+                header(name)
+                for (probe, target), (up, latency_s, successes, failures) in sorted(targets.items()):
+                    pairs = (('probe', probe), ('target', target))
+                    if name == 'target_up':
+                        lines.append(f"{self.PREFIX}_target_up{labels(pairs)} {up}")
+                    elif name == 'target_latency_seconds':
+                        if latency_s is not None:
+                            lines.append(f"{self.PREFIX}_target_latency_seconds{labels(pairs)} {number(latency_s)}")
+                    else:
+                        lines.append(f"{self.PREFIX}_target_probes_total{labels(pairs + (('result', 'success'),))} {successes}")
+                        lines.append(f"{self.PREFIX}_target_probes_total{labels(pairs + (('result', 'failure'),))} {failures}")
+        
+        for name, series in sorted(gauges.items()):
+            header(name)
+            for pairs, value in sorted(series.items()):
+                lines.append(f"{self.PREFIX}_{name}{labels(pairs)} {number(value)}")
+        
+        # Thống kê bổ sung của logger (vd. dns_cache), đọc trực tiếp lúc scrape
+        for provider_name, provider in sorted(self.providers.items()):
+            try:
+                stats = provider()
+            except Exception:
+                continue
+            for key, value in sorted(stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {self.PREFIX}_{provider_name}_{key} gauge")
+                    lines.append(f"{self.PREFIX}_{provider_name}_{key} {number(value)}")
+        
+        header('metrics_dropped_series_total')
+        lines.append(f"{self.PREFIX}_metrics_dropped_series_total {dropped}")
+        return "\n".join(lines) + "\n"
+    
+    def close(self):
+        pass
+
+class MetricsServer:
+    """HTTP endpoint `/metrics` (ThreadingHTTPServer) phục vụ MetricsRegistry.render()"""
+    
+    DEFAULT_PORT = 9108
+    
+    def __init__(self, registry, host="127.0.0.1", port=DEFAULT_PORT):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", MetricsRegistry.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass  # Không in access log ra console
+        
+        self.registry = registry
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
 
 # ============================================================================
 # NETWORK LOGGER CLASS
 # ============================================================================
 
 class NetworkLogger:
-    def __init__(self, log_file=None):
-        self.logs = []
+    """Logger của session
+    
+    Ghi log an toàn từ nhiều thread: `log()` chỉ append vào `self.logs` và đẩy entry vào
+    queue dưới một lock ngắn; một writer thread duy nhất ghi JSON Lines và compact file
+    JSON session, nên worker không bao giờ chờ disk I/O. Thứ tự trong `self.logs`, trong
+    file .jsonl và file .json là như nhau (thứ tự lấy lock); entries của cùng một thread
+    luôn giữ đúng thứ tự gọi.
+    
+    `self.logs` là `LogBuffer`: chỉ `max_memory_entries` entry gần nhất nằm trong bộ nhớ,
+    phần cũ hơn được writer thread đẩy ra segment file, nên session chạy dài dùng bộ nhớ
+    không đổi.
+    
+    `sinks` nhận từng batch entry trong writer thread (`sink.write(records)`), sample từ
+    `record_samples()` đi tới `sink.add_samples(samples)`; vd. TimeSeriesStore.
+    """
+    
+    WRITE_BATCH = 8192  # số entry tối đa mỗi lần ghi stream
+    
+    def __init__(self, log_file=None, compact_interval=30.0, echo=True, max_memory_entries=100000):
         self.session_id = datetime.now().strftime('%Y%m%d_%H%M%S')
         self.log_file = log_file or f"network_toolkit_logs_{self.session_id}.json"
+        self.echo = echo
+        self.logs = LogBuffer(max_memory_entries, os.path.splitext(self.log_file)[0] + ".spill")
+        
+        # Thống kê bổ sung cho summary, vd. {'dns_cache': resolver.stats}
+        self.summary_providers = {}
+        
+        # Sink nhận batch trong writer thread; metrics_store là TimeSeriesStore đang gắn (nếu có)
+        self.sinks = []
+        self.metrics_store = None
+        
+        # Span log.write/log.sink/log.compact của writer thread (NetworkToolkit gắn instance dùng chung)
+        self.instrumentation = Instrumentation(enabled=False)
+        
+        # Counters cập nhật trong log() để get_summary() là O(1) theo số logs
+        self._total_count = 0  # cả session, không phụ thuộc phần logs còn trong buffer
+        self._status_counts = {}
+        self._action_counts = {}
+        self._latency_stats = {}  # action -> LatencyStats
+        self._detail_columns = {}  # action -> {key details: None}, theo thứ tự xuất hiện
+        self._detail_shapes = set()  # (action, keys tuple) đã đưa vào _detail_columns
+        
+        # JSON Lines stream: mỗi entry một dòng, chỉ append (không rewrite toàn bộ file)
+        self.stream_file = os.path.splitext(self.log_file)[0] + ".jsonl"
+        self.compact_interval = compact_interval
+        self._stream = None
+        self._last_compact = None
+        self._compact_seconds = 0.0
+        self._compacted_count = 0
+        
+        self._lock = threading.Lock()
+        self._console_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        self._closed = False
+        self._closed_warned = False
+        
+        # Compact ra file JSON session khi thoát chương trình
+        atexit.register(self.close)
         
     def log(self, action: str, status: str, details: Dict[str, Any] = None, message: str = ""):
         """Ghi log cho một action"""
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'session_id': self.session_id,
-            'action': action,
-            'status': status,
-            'message': message,
-            'details': details or {}
-        }
-        
-        self.logs.append(log_entry)
-        
-        # In ra console với format đẹp
-        status_icon = {
-            'success': '✅',
-            'error': '❌', 
-            'warning': '⚠️',
-            'info': 'ℹ️',
-            'start': '🔍',
-            'complete': '✅'
-        }.get(status, '📝')
-        
-        print(f"{status_icon} [{action}] {message}")
-        
-        # Lưu vào file ngay lập tức
-        self.save_to_file()
+        log_entry = LogRecord(action, status, message, details, self.session_id)
+        
+        # Append + enqueue cùng một lock để thứ tự trong file khớp với self.logs
+        with self._lock:
+            self.logs.append(log_entry)
+            self._account(log_entry)
+            if self._closed:
+                self._warn_closed()
+            else:
+                if self._writer is None:
+                    self._start_writer()
+                self._queue.put(log_entry)
+        
+        if self.echo:
+            # In ra console với format đẹp
+            status_icon = {
+                'success': '✅',
+                'error': '❌', 
+                'warning': '⚠️',
+                'info': 'ℹ️',
+                'start': '🔍',
+                'complete': '✅'
+            }.get(status, '📝')
+            
+            with self._console_lock:
+                print(f"{status_icon} [{action}] {message}")
         
         return log_entry
     
+    def _account(self, log_entry):
+        """Cập nhật counters và latency aggregate cho một entry"""
+        status = log_entry.status
+        action = log_entry.action
+        self._total_count += 1
+        self._status_counts[status] = self._status_counts.get(status, 0) + 1
+        self._action_counts[action] = self._action_counts.get(action, 0) + 1
+        
+        shape = (action, log_entry.detail_keys)
+        if shape not in self._detail_shapes:
+            self._detail_shapes.add(shape)
+            self._detail_columns.setdefault(action, {}).update(dict.fromkeys(log_entry.detail_keys))
+        
+        latency_ms = self.extract_latency_ms(log_entry.detail_items())
+        if latency_ms is not None:
+            stats = self._latency_stats.get(action)
+            if stats is None:
+                stats = self._latency_stats[action] = LatencyStats()
+            stats.add(latency_ms)
+    
+    @staticmethod
+    def extract_latency_ms(details):
+        """Lấy latency (ms) từ details (dict hoặc iterator (key, value)): key *_time_ms,
+        rồi duration_ms, rồi execution_time_seconds"""
+        if not details:
+            return None
+        duration = seconds = None
+        for key, value in (details.items() if isinstance(details, dict) else details):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if key.endswith('_time_ms'):
+                return float(value)
+            if key == 'duration_ms':
+                duration = value
+            elif key == 'execution_time_seconds':
+                seconds = value
+        if duration is not None:
+            return float(duration)
+        return seconds * 1000.0 if seconds is not None else None
+    
+    def attach_store(self, store):
+        """Gắn TimeSeriesStore làm sink và nguồn dữ liệu lịch sử cho export"""
+        self.metrics_store = store
+        self.sinks.append(store)
+        return store
+    
+    def record_samples(self, samples):
+        """Đưa list sample (ts, probe, target, latency_ms, success) cho sinks qua writer thread"""
+        if not samples or not self.sinks:
+            return
+        with self._lock:
+            if self._closed:
+                self._warn_closed()
+                return
+            if self._writer is None:
+                self._start_writer()
+            self._queue.put(list(samples))
+    
+    def _warn_closed(self):
+        """Cảnh báo một lần khi có dữ liệu mới sau close() (gọi khi đang giữ self._lock)"""
+        if not self._closed_warned:
+            self._closed_warned = True
+            print("⚠️ NetworkLogger đã close(): log/sample mới chỉ giữ trong bộ nhớ, "
+                  "không ghi ra file session hay sinks", file=sys.stderr)
+    
+    def _start_writer(self):
+        """Khởi động writer thread (gọi khi đang giữ self._lock)"""
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._writer_loop, args=(self._queue,),
+                                        name="NetworkLoggerWriter", daemon=True)
+        self._writer.start()
+    
+    def _writer_loop(self, entries):
+        """Writer thread: gom batch từ queue, ghi stream và compact định kỳ"""
+        while True:
+            # Reset trước khi block để batch cũ không bị giữ trong bộ nhớ khi idle
+            batch = []
+            samples = []
+            waiters = []
+            stop = False
+            item = entries.get()
+            
+            # Gom những gì đang có trong queue (tối đa WRITE_BATCH entry) thành một lần ghi
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif isinstance(item, list):
+                    samples.extend(item)
+                else:
+                    batch.append(item)
+                    if len(batch) >= self.WRITE_BATCH:
+                        break
+                try:
+                    item = entries.get_nowait()
+                except queue.Empty:
+                    break
+            
+            if batch:
+                with self.instrumentation.span("log.write"):
+                    self._append_to_stream(batch)
+                    self.logs.spill_overflow()
+            if batch or samples:
+                with self.instrumentation.span("log.sink"):
+                    self._write_sinks(batch, samples)
+            if waiters or stop:
+                self._flush_stream()
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+            
+            # Session lớn thì compact thưa hơn: không dành quá ~10% thời gian cho compact
+            interval = max(self.compact_interval, self._compact_seconds * 10)
+            if self._last_compact is None or time.monotonic() - self._last_compact >= interval:
+                self._flush_stream()
+                with self.instrumentation.span("log.compact"):
+                    self._compact()
+    
+    def _append_to_stream(self, batch):
+        """Append các entry vào file JSON Lines qua buffered writer"""
+        try:
+            if self._stream is None:
+                self._stream = open(self.stream_file, 'a', encoding='utf-8', buffering=1 << 16)
+            self._stream.write("".join(json.dumps(entry.to_dict(), ensure_ascii=False, default=str) + "\n"
+                                       for entry in batch))
+        except Exception as e:
+            print(f"❌ Lỗi ghi log stream: {e}")
+    
+    def _write_sinks(self, batch, samples):
+        for sink in self.sinks:
+            try:
+                if batch:
+                    sink.write(batch)
+                if samples and hasattr(sink, 'add_samples'):
+                    sink.add_samples(samples)
+            except Exception as e:
+                print(f"❌ Lỗi ghi log sink {type(sink).__name__}: {e}")
+    
+    def _flush_stream(self):
+        if self._stream is not None:
+            try:
+                self._stream.flush()
+            except Exception as e:
+                print(f"❌ Lỗi flush log stream: {e}")
+    
+    def flush(self):
+        """Chờ writer thread ghi hết các entry đã nhận và đẩy buffer xuống disk"""
+        with self._lock:
+            writer, entries = self._writer, self._queue
+        if writer is None or writer is threading.current_thread():
+            self._flush_stream()
+            return
+        
+        done = threading.Event()
+        entries.put(done)
+        while not done.wait(0.5):
+            if not writer.is_alive():
+                break
+    
+    def close(self):
+        """Dừng writer thread, compact lần cuối và đóng stream
+        
+        close() là bước cuối của session: gọi lại (vd. user rồi atexit) không làm gì, log()
+        sau đó vẫn cập nhật summary nhưng không còn ghi ra file hay sinks (có cảnh báo).
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            writer, entries = self._writer, self._queue
+            self._writer = self._queue = None
+            if writer is not None:
+                entries.put(None)
+        if writer is not None and writer is not threading.current_thread():
+            writer.join()
+        
+        if len(self.logs) != self._compacted_count:
+            self._compact(final=True)
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception:
+                pass
+            self._stream = None
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception:
+                pass
+        self.sinks = []
+        self.logs.close()
+    
+    @classmethod
+    def load(cls, session_file, echo=True, max_memory_entries=100000):
+        """Đọc lại session đã lưu (.json hoặc .jsonl) để export/xem summary"""
+        with open(session_file, 'r', encoding='utf-8') as f:
+            if session_file.endswith(".jsonl"):
+                logs = [json.loads(line) for line in f if line.strip()]
+            else:
+                logs = json.load(f).get('logs', [])
+        
+        json_file = os.path.splitext(session_file)[0] + ".json"
+        logger = cls(log_file=json_file, echo=echo, max_memory_entries=max_memory_entries)
+        if logs:
+            logger.session_id = logs[0].get('session_id') or logger.session_id
+        for entry in logs:
+            record = LogRecord.from_dict(entry)
+            logger.logs.append(record)
+            logger._account(record)
+            if logger.logs.in_memory >= 2 * (logger.logs.max_entries or len(logs)):
+                logger.logs.spill_overflow()
+        logger.logs.spill_overflow()
+        logger._compacted_count = len(logs)
+        return logger
+    
     def log_start(self, action: str, message: str = ""):
         return self.log(action, 'start', message=message or f"Bắt đầu {action}")
     
@@ -73,22 +1526,30 @@ class NetworkLogger:
         return self.log(action, 'info', details, info)
     
     def get_summary(self) -> Dict[str, Any]:
-        total_logs = len(self.logs)
-        success_count = len([log for log in self.logs if log['status'] == 'success'])
-        error_count = len([log for log in self.logs if log['status'] == 'error'])
-        warning_count = len([log for log in self.logs if log['status'] == 'warning'])
+        total_logs = self._total_count
+        success_count = self._status_counts.get('success', 0)
+        error_count = self._status_counts.get('error', 0)
+        warning_count = self._status_counts.get('warning', 0)
         
-        actions = list(set(log['action'] for log in self.logs))
+        with self._lock:
+            actions = list(self._action_counts)
+            latency_stats = {action: stats.to_dict() for action, stats in self._latency_stats.items()}
         
-        return {
+        summary = {
             'session_id': self.session_id,
             'total_logs': total_logs,
             'success_count': success_count,
             'error_count': error_count,
             'warning_count': warning_count,
             'actions_performed': actions,
-            'success_rate': round((success_count / total_logs * 100), 2) if total_logs > 0 else 0
+            'success_rate': round((success_count / total_logs * 100), 2) if total_logs > 0 else 0,
+            'latency_stats': latency_stats
         }
+        
+        for name, provider in self.summary_providers.items():
+            summary[name] = provider()
+        
+        return summary
     
     def print_summary(self):
         summary = self.get_summary()
@@ -103,119 +1564,228 @@ class NetworkLogger:
         print(f"⚠️ Cảnh báo: {summary['warning_count']}")
         print(f"📈 Tỷ lệ thành công: {summary['success_rate']}%")
         print(f"🎯 Actions: {', '.join(summary['actions_performed'])}")
+        for action, stats in summary['latency_stats'].items():
+            print(f"⏱️ {action}: n={stats['count']} mean={stats['mean']}ms "
+                  f"p50={stats['p50']}ms p95={stats['p95']}ms p99={stats['p99']}ms")
+        if 'dns_cache' in summary:
+            cache = summary['dns_cache']
+            print(f"🗂️ DNS cache: {cache['hits'] + cache['negative_hits']} hits / {cache['misses']} misses "
+                  f"({cache['hit_rate']}%)")
+        for name, stats in summary.get('spans', {}).items():
+            print(f"🔬 {name}: n={stats['count']} mean={stats['mean']}ms p99={stats['p99']}ms max={stats['max']}ms")
         print("=" * 50)
     
     def save_to_file(self):
-        try:
-            log_data = {
-                'session_info': {
-                    'session_id': self.session_id,
-                    'created_at': datetime.now().isoformat(),
-                    'total_logs': len(self.logs)
-                },
-                'summary': self.get_summary(),
-                'logs': self.logs
-            }
+        """Compact logs ra file JSON session (format cũ, đọc được bởi các tool hiện có)"""
+        self.flush()
+        self._compact()
+    
+    def _compact(self, final=False):
+        """Ghi file JSON session bằng cách duyệt self.logs (bộ nhớ + segment trên disk)"""
+        if self._closed and not final:
+            # Sau close() file JSON đã là bản cuối; self.logs có thể chỉ còn phần trong bộ nhớ
+            return
+        with self._compact_lock:
+            started = time.monotonic()
+            self._last_compact = started
             
-            with open(self.log_file, 'w', encoding='utf-8') as f:
-                json.dump(log_data, f, indent=2, ensure_ascii=False)
+            try:
+                header = {
+                    'session_info': {
+                        'session_id': self.session_id,
+                        'created_at': datetime.now().isoformat(),
+                        'total_logs': len(self.logs)
+                    },
+                    'summary': self.get_summary()
+                }
                 
-        except Exception as e:
-            print(f"❌ Lỗi lưu log file: {e}")
+                # Ghi ra file tạm rồi replace để reader không bao giờ thấy file dở dang.
+                # Entries được encode từng cái một nên không cần giữ cả session trong bộ nhớ.
+                tmp_file = self.log_file + ".tmp"
+                count = 0
+                with open(tmp_file, 'w', encoding='utf-8', buffering=1 << 16) as f:
+                    f.write(json.dumps(header, indent=2, ensure_ascii=False, default=str)[:-2])
+                    f.write(',\n  "logs": [')
+                    for entry in self.logs:
+                        f.write(",\n    " if count else "\n    ")
+                        f.write(json.dumps(entry.to_dict(), indent=2, ensure_ascii=False,
+                                           default=str).replace("\n", "\n    "))
+                        count += 1
+                    f.write("\n  ]\n}" if count else "]\n}")
+                os.replace(tmp_file, self.log_file)
+                self._compacted_count = count
+                    
+            except Exception as e:
+                print(f"❌ Lỗi lưu log file: {e}")
+            self._compact_seconds = time.monotonic() - started
+    
+    # Fallback cho cột duration_ms của performance export với entry ghi trước khi có duration_ms:
+    # key thời gian cũ (theo thứ tự ưu tiên) -> hệ số đổi sang ms
+    EXECUTION_TIME_KEYS = {'execution_time_seconds': 1000, 'scan_duration_seconds': 1000,
+                           'connect_time_ms': 1, 'resolve_time_ms': 1}
     
-    def export_csv(self, csv_file=None, export_type="basic", filter_status=None, filter_action=None):
-        """Export logs ra CSV với nhiều tùy chọn"""
+    @classmethod
+    def duration_ms(cls, details):
+        """duration_ms của một entry; entry cũ thì suy ra từ các key thời gian trước đây"""
+        value = details.get('duration_ms')
+        if value is not None:
+            return value
+        for key, scale in cls.EXECUTION_TIME_KEYS.items():
+            value = details.get(key)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return round(value * scale, 3)
+        return None
+    
+    def detail_columns(self, action=None):
+        """Các key của details đã gặp (theo thứ tự xuất hiện), của một action hoặc tất cả"""
+        with self._lock:
+            if action is not None:
+                return list(self._detail_columns.get(action, ()))
+            columns = {}
+            for keys in self._detail_columns.values():
+                columns.update(keys)
+            return list(columns)
+    
+    @staticmethod
+    def _csv_value(value):
+        """Giá trị details cho một ô CSV: dict/list thành JSON thay vì repr của Python"""
+        if value is None:
+            return ""
+        if isinstance(value, (dict, list, tuple)):
+            return json.dumps(value, ensure_ascii=False, default=str)
+        return value
+    
+    def export_csv(self, csv_file=None, export_type="basic", filter_status=None, filter_action=None,
+                   history_hours=24, resolution=None):
+        """Export logs ra CSV với nhiều tùy chọn
+        
+        Filter, chọn cột và ghi file trong một lần duyệt logs (generator, không tạo list).
+        Export detailed/performance tách details thành các cột `details.<key>`, danh sách
+        cột lấy từ registry cập nhật trong log() nên không phải duyệt logs hai lần.
+        Export history đọc `history_hours` giờ gần nhất từ metrics store (filter_action
+        là probe), `resolution` raw/1m/1h hoặc tự chọn. Export summary ghi get_summary() của
+        cả session (không filter, không duyệt logs).
+        """
         import csv
         
         csv_file = csv_file or f"network_toolkit_logs_{self.session_id}.csv"
         
         try:
-            # Filter logs theo yêu cầu
-            filtered_logs = self.logs
+            if export_type == "history":
+                if self.metrics_store is None:
+                    print("❌ Chưa gắn metrics store (--metrics-db)")
+                    return False
+                exported = self.metrics_store.export_csv(csv_file, probe=filter_action,
+                                                         start=time.time() - history_hours * 3600,
+                                                         resolution=resolution)
+                print(f"📄 Đã export CSV (history {history_hours}h): {csv_file}")
+                print(f"📊 Số records: {exported}")
+                return True
+            
+            if export_type == "summary":
+                # Summary lấy từ counters O(1) của cả session
+                summary = self.get_summary()
+                if not summary['total_logs']:
+                    print("❌ Không có logs nào để export")
+                    return False
+                if filter_status or filter_action:
+                    print("⚠️ Export summary luôn tính cả session, bỏ qua filter status/action")
+                with open(csv_file, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(['metric', 'value'])
+                    writer.writerows([key, str(value)] for key, value in summary.items())
+                print(f"📄 Đã export CSV (summary): {csv_file}")
+                print(f"📊 Số metrics: {len(summary)} (tổng logs session: {summary['total_logs']})")
+                return True
+            
+            # Filter logs theo yêu cầu (duyệt cả phần đã tràn ra disk, không tạo list)
+            filtered_logs = iter(self.logs)
             
             if filter_status:
-                filtered_logs = [log for log in filtered_logs if log['status'] == filter_status]
+                filtered_logs = (log for log in filtered_logs if log.status == filter_status)
             
             if filter_action:
-                filtered_logs = [log for log in filtered_logs if log['action'] == filter_action]
+                filtered_logs = (log for log in filtered_logs if log.action == filter_action)
             
-            if not filtered_logs:
+            first = next(filtered_logs, None)
+            if first is None:
                 print("❌ Không có logs nào phù hợp với filter")
                 return False
+            filtered_logs = itertools.chain([first], filtered_logs)
+            exported = 0
+            
+            detail_columns = self.detail_columns(filter_action)
+            detail_header = [f"details.{key}" for key in detail_columns]
+            csv_value = self._csv_value
+            
+            def rows(project):
+                nonlocal exported
+                for log in filtered_logs:
+                    exported += 1
+                    yield project(log)
+            
+            def basic_row(log):
+                return (log.timestamp, log.action, log.status, log.message)
+            
+            def detailed_row(log):
+                details = dict(log.detail_items())
+                return [log.timestamp, log.action, log.status, log.message] + \
+                       [csv_value(details.get(key)) for key in detail_columns]
             
-            with open(csv_file, 'w', newline='', encoding='utf-8') as f:
+            def performance_row(log):
+                details = dict(log.detail_items())
+                return [log.action, log.status, log.timestamp, csv_value(self.duration_ms(details))] + \
+                       [csv_value(details.get(key)) for key in detail_columns]
+            
+            with open(csv_file, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+                writer = csv.writer(f)
+                
                 if export_type == "basic":
-                    fieldnames = ['timestamp', 'action', 'status', 'message']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    
-                    writer.writeheader()
-                    for log in filtered_logs:
-                        writer.writerow({
-                            'timestamp': log['timestamp'],
-                            'action': log['action'],
-                            'status': log['status'],
-                            'message': log['message']
-                        })
+                    writer.writerow(['timestamp', 'action', 'status', 'message'])
+                    writer.writerows(rows(basic_row))
                 
                 elif export_type == "detailed":
-                    fieldnames = ['timestamp', 'action', 'status', 'message', 'details']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    
-                    writer.writeheader()
-                    for log in filtered_logs:
-                        writer.writerow({
-                            'timestamp': log['timestamp'],
-                            'action': log['action'],
-                            'status': log['status'],
-                            'message': log['message'],
-                            'details': str(log.get('details', {}))
-                        })
-                
-                elif export_type == "summary":
-                    # Export summary statistics
-                    fieldnames = ['metric', 'value']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    
-                    writer.writeheader()
-                    summary = self.get_summary()
-                    for key, value in summary.items():
-                        writer.writerow({
-                            'metric': key,
-                            'value': str(value)
-                        })
+                    writer.writerow(['timestamp', 'action', 'status', 'message'] + detail_header)
+                    writer.writerows(rows(detailed_row))
                 
                 elif export_type == "performance":
                     # Export performance data
-                    fieldnames = ['action', 'status', 'timestamp', 'execution_time', 'details']
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    
-                    writer.writeheader()
-                    for log in filtered_logs:
-                        details = log.get('details', {})
-                        execution_time = ""
-                        
-                        # Tìm execution time trong details
-                        for key in ['execution_time_seconds', 'scan_duration_seconds', 'connect_time_ms', 'resolve_time_ms']:
-                            if key in details:
-                                execution_time = str(details[key])
-                                break
-                        
-                        writer.writerow({
-                            'action': log['action'],
-                            'status': log['status'],
-                            'timestamp': log['timestamp'],
-                            'execution_time': execution_time,
-                            'details': str(details)
-                        })
+                    writer.writerow(['action', 'status', 'timestamp', 'duration_ms'] + detail_header)
+                    writer.writerows(rows(performance_row))
                     
             print(f"📄 Đã export CSV ({export_type}): {csv_file}")
-            print(f"📊 Số records: {len(filtered_logs)}")
+            print(f"📊 Số records: {exported}")
             return True
             
         except Exception as e:
             print(f"❌ Lỗi export CSV: {e}")
             return False
     
+    def export_columnar(self, col_file=None, filter_status=None, filter_action=None):
+        """Export logs ra file columnar (.ntcol) để phân tích nhanh, đọc lại bằng ColumnarLog"""
+        col_file = col_file or f"network_toolkit_logs_{self.session_id}.ntcol"
+        
+        try:
+            filtered_logs = iter(self.logs)
+            if filter_status:
+                filtered_logs = (log for log in filtered_logs if log.status == filter_status)
+            if filter_action:
+                filtered_logs = (log for log in filtered_logs if log.action == filter_action)
+            
+            rows = ColumnarLog.write(col_file, filtered_logs, self.session_id)
+            if not rows:
+                os.remove(col_file)
+                print("❌ Không có logs nào phù hợp với filter")
+                return False
+            
+            print(f"🧱 Đã export columnar: {col_file}")
+            print(f"📊 Số records: {rows}")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Lỗi export columnar: {e}")
+            return False
+    
     def interactive_csv_export(self):
         """Interactive CSV export với menu tùy chọn"""
         print("\n📊 CSV EXPORT - TÙY CHỌN NÂNG CAO")
@@ -272,7 +1842,7 @@ class NetworkLogger:
                 print("\n🔍 CUSTOM FILTER OPTIONS:")
                 
                 # Filter by status
-                print(f"📊 Available statuses: success, error, warning, info, start")
+                print("📊 Available statuses: success, error, warning, info, start")
                 filter_status = input("Filter by status (Enter = all): ").strip()
                 if not filter_status:
                     filter_status = None
@@ -302,15 +1872,19 @@ class NetworkLogger:
             print("\n❌ Đã hủy export")
             return False
     
-    def export_html(self, html_file=None, report_type="comprehensive"):
-        """Export logs ra HTML report đẹp mắt"""
+    def export_html(self, html_file=None, report_type="comprehensive", open_browser=None, history_hours=24):
+        """Export logs ra HTML report đẹp mắt
+        
+        open_browser=None hỏi người dùng có mở browser không, True/False thì không hỏi.
+        Khi có metrics store, report thêm biểu đồ `history_hours` giờ gần nhất theo target.
+        """
         html_file = html_file or f"network_toolkit_report_{self.session_id}.html"
         
         try:
             summary = self.get_summary()
             
             # HTML Template
-            html_content = f"""
+            html_head = f"""
 <!DOCTYPE html>
 <html lang="vi">
 <head>
@@ -528,6 +2102,42 @@ class NetworkLogger:
             border-radius: 10px;
         }}
         
+        .histogram {{
+            display: flex;
+            align-items: flex-end;
+            gap: 2px;
+            height: 120px;
+            margin-top: 15px;
+        }}
+        
+        .histogram .bar {{
+            flex: 1;
+            min-height: 1px;
+            background: linear-gradient(180deg, #3498db 0%, #2980b9 100%);
+            border-radius: 3px 3px 0 0;
+        }}
+        
+        .histogram-axis {{
+            display: flex;
+            justify-content: space-between;
+            font-size: 0.85em;
+            color: #6c757d;
+        }}
+        
+        .logs-controls {{
+            display: flex;
+            flex-wrap: wrap;
+            gap: 10px;
+            align-items: center;
+        }}
+        
+        .logs-controls select, .logs-controls button {{
+            padding: 6px 12px;
+            border: 1px solid #ced4da;
+            border-radius: 5px;
+            background: white;
+        }}
+        
         @media (max-width: 768px) {{
             .summary-grid {{
                 grid-template-columns: 1fr;
@@ -591,10 +2201,7 @@ class NetworkLogger:
             </div>
 """
             
-            if report_type == "comprehensive":
-                html_content += self._generate_logs_table()
-            
-            html_content += f"""
+            html_foot = f"""
         </div>
         
         <div class="footer">
@@ -630,160 +2237,1367 @@ class NetworkLogger:
 </html>
 """
             
-            with open(html_file, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+            # Ghi thẳng ra file theo từng phần, logs được stream thay vì dựng một string lớn
+            with open(html_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                f.write(html_head)
+                f.write(self._generate_latency_charts(summary['latency_stats']))
+                if self.metrics_store is not None:
+                    f.write(self._generate_history_charts(history_hours))
+                if report_type == "comprehensive":
+                    self._write_logs_section(f)
+                f.write(html_foot)
             
             print(f"🌐 Đã tạo HTML report: {html_file}")
-            print(f"📊 Mở file trong browser để xem báo cáo đẹp mắt!")
+            print("📊 Mở file trong browser để xem báo cáo đẹp mắt!")
             
             # Hỏi có muốn mở file không
+            if open_browser is None:
+                try:
+                    open_browser = input("🌐 Mở file trong browser ngay? (y/N): ").strip().lower() in ['y', 'yes']
+                except (KeyboardInterrupt, EOFError):
+                    open_browser = False
+            if open_browser:
+                self._open_html_file(html_file)
+            
+            return True
+            
+        except Exception as e:
+            print(f"❌ Lỗi tạo HTML report: {e}")
+            return False
+    
+    def _format_timestamp(self):
+        """Format timestamp cho HTML"""
+        from datetime import datetime
+        return datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    
+    def _generate_action_tags(self, actions):
+        """Tạo action tags cho HTML"""
+        tags_html = ""
+        for action in actions:
+            tags_html += f'<span class="action-tag">{action}</span> '
+        return tags_html
+    
+    def _generate_latency_charts(self, latency_stats):
+        """Histogram latency theo action, lấy từ bucket của LatencyStats (không duyệt logs)"""
+        with self._lock:
+            histograms = {action: stats.histogram() for action, stats in self._latency_stats.items()}
+        
+        charts = []
+        for action, stats in latency_stats.items():
+            bins = histograms.get(action)
+            if not bins:
+                continue
+            peak = max(count for _, _, count in bins)
+            bars = "".join(
+                f'<div class="bar" style="height: {count / peak * 100:.1f}%" '
+                f'title="{lower:.3f}–{upper:.3f} ms: {count}"></div>'
+                for lower, upper, count in bins)
+            charts.append(f"""
+            <div class="chart-container">
+                <h3>⏱️ {html.escape(action)}: n={stats['count']} | mean={stats['mean']}ms | p50={stats['p50']}ms | p95={stats['p95']}ms | p99={stats['p99']}ms</h3>
+                <div class="histogram">{bars}</div>
+                <div class="histogram-axis"><span>{stats['min']} ms</span><span>{stats['max']} ms</span></div>
+            </div>
+""")
+        return "".join(charts)
+    
+    HISTORY_MAX_SERIES = 50
+    
+    def _generate_history_charts(self, hours):
+        """Latency trung bình theo bucket của từng (probe, target) từ metrics store
+        
+        Dùng rollup 1m hoặc 1h tùy độ dài khoảng; bucket có lỗi được tô đỏ.
+        """
+        start = time.time() - hours * 3600
+        resolution = '1m' if hours <= 6 else '1h'
+        charts = []
+        series = itertools.groupby(self.metrics_store.query(start=start, resolution=resolution),
+                                   key=lambda row: (row['probe'], row['target']))
+        for (probe, target), rows in itertools.islice(series, self.HISTORY_MAX_SERIES):
+            rows = list(rows)
+            peak = max((row['mean_ms'] or 0) for row in rows) or 1
+            count = sum(row['count'] for row in rows)
+            success = sum(row['count'] * row['success_rate'] / 100 for row in rows)
+            bars = "".join(
+                f'<div class="bar" style="height: {max((row["mean_ms"] or 0) / peak * 100, 2):.1f}%'
+                f'{"; background: #e74c3c" if row["success_rate"] < 100 else ""}" '
+                f'title="{datetime.fromtimestamp(row["time"]).strftime("%d/%m %H:%M")}: '
+                f'mean {row["mean_ms"]} ms, success {row["success_rate"]}%, n={row["count"]}"></div>'
+                for row in rows)
+            charts.append(f"""
+            <div class="chart-container">
+                <h3>📈 {html.escape(probe)} → {html.escape(target)}: {count} samples | success {success / count * 100:.2f}% | {resolution}</h3>
+                <div class="histogram">{bars}</div>
+                <div class="histogram-axis"><span>{datetime.fromtimestamp(rows[0]['time']).strftime('%d/%m %H:%M')}</span><span>peak {peak} ms</span></div>
+            </div>
+""")
+        if not charts:
+            return ""
+        return f"""
+            <div class="logs-section">
+                <h2 class="section-title">📈 History ({hours}h)</h2>
+            </div>
+""" + "".join(charts)
+    
+    LOGS_PAGE_SIZE = 100
+    
+    def _write_logs_section(self, f):
+        """Ghi bảng logs: toàn bộ logs nằm trong một JSON blob, trình duyệt tự render từng trang
+        
+        Blob dạng {"rows": [[ms từ t0, action, status, message], ...], "t0": epoch,
+        "actions": [...], "statuses": [...]}; action/status là index vào hai list cuối.
+        """
+        f.write("""
+            <div class="logs-section">
+                <h2 class="section-title">📋 Detailed Logs</h2>
+                <div class="logs-controls">
+                    <select id="logs-action"><option value="">Tất cả actions</option></select>
+                    <select id="logs-status"><option value="">Tất cả status</option></select>
+                    <button id="logs-prev">◀</button>
+                    <span id="logs-page"></span>
+                    <button id="logs-next">▶</button>
+                </div>
+                <table class="logs-table">
+                    <thead>
+                        <tr>
+                            <th>⏰ Timestamp</th>
+                            <th>🎯 Action</th>
+                            <th>📊 Status</th>
+                            <th>💬 Message</th>
+                        </tr>
+                    </thead>
+                    <tbody id="logs-body"></tbody>
+                </table>
+            </div>
+            <script type="application/json" id="logs-data">{"rows": [""")
+        
+        # "<" được escape để message không thể đóng thẻ <script>
+        def dump(value):
+            return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace("<", "\\u003c")
+        
+        actions = {}
+        statuses = {}
+        t0 = None
+        first = True
+        logs = iter(self.logs)
+        while True:
+            chunk = list(itertools.islice(logs, 4096))
+            if not chunk:
+                break
+            if t0 is None:
+                t0 = chunk[0].created
+            rows = [[round((log.created - t0) * 1000),
+                     actions.setdefault(log.action, len(actions)),
+                     statuses.setdefault(log.status, len(statuses)),
+                     log.message] for log in chunk]
+            f.write(("" if first else ",") + dump(rows)[1:-1])
+            first = False
+        
+        f.write(f"""], "t0": {t0 or 0}, "actions": {dump(list(actions))}, "statuses": {dump(list(statuses))}}}</script>
+            <script>
+            (function() {{
+                const data = JSON.parse(document.getElementById('logs-data').textContent);
+                const pageSize = {self.LOGS_PAGE_SIZE};
+                const body = document.getElementById('logs-body');
+                const actionSelect = document.getElementById('logs-action');
+                const statusSelect = document.getElementById('logs-status');
+                const pageLabel = document.getElementById('logs-page');
+                let rows = data.rows;
+                let page = 0;
+                
+                data.actions.forEach((name, i) => actionSelect.add(new Option(name, i)));
+                data.statuses.forEach((name, i) => statusSelect.add(new Option(name, i)));
+                
+                const pad = n => String(n).padStart(2, '0');
+                function formatTime(offset) {{
+                    const d = new Date(data.t0 * 1000 + offset);
+                    return d.getFullYear() + '-' + pad(d.getMonth() + 1) + '-' + pad(d.getDate()) + ' ' +
+                           pad(d.getHours()) + ':' + pad(d.getMinutes()) + ':' + pad(d.getSeconds());
+                }}
+                
+                function cell(tr, text, className, tagClass) {{
+                    const td = tr.insertCell();
+                    if (className) td.className = className;
+                    if (tagClass) {{
+                        const span = document.createElement('span');
+                        span.className = tagClass;
+                        span.textContent = text;
+                        td.appendChild(span);
+                    }} else {{
+                        td.textContent = text;
+                    }}
+                }}
+                
+                function render() {{
+                    const pages = Math.max(1, Math.ceil(rows.length / pageSize));
+                    page = Math.min(Math.max(page, 0), pages - 1);
+                    body.textContent = '';
+                    for (const row of rows.slice(page * pageSize, (page + 1) * pageSize)) {{
+                        const tr = body.insertRow();
+                        const status = data.statuses[row[2]];
+                        cell(tr, formatTime(row[0]), 'timestamp');
+                        cell(tr, data.actions[row[1]], null, 'action-tag');
+                        cell(tr, status, null, 'status-badge status-' + status);
+                        cell(tr, row[3]);
+                    }}
+                    pageLabel.textContent = 'Trang ' + (page + 1) + '/' + pages + ' (' + rows.length + ' logs)';
+                }}
+                
+                function applyFilter() {{
+                    const action = actionSelect.value, status = statusSelect.value;
+                    rows = data.rows.filter(row => (action === '' || row[1] == action) &&
+                                                   (status === '' || row[2] == status));
+                    page = 0;
+                    render();
+                }}
+                
+                actionSelect.addEventListener('change', applyFilter);
+                statusSelect.addEventListener('change', applyFilter);
+                document.getElementById('logs-prev').addEventListener('click', () => {{ page--; render(); }});
+                document.getElementById('logs-next').addEventListener('click', () => {{ page++; render(); }});
+                render();
+            }})();
+            </script>
+""")
+    
+    def interactive_html_export(self):
+        """Interactive HTML export với menu tùy chọn"""
+        print("\n🌐 HTML REPORT EXPORT")
+        print("=" * 50)
+        
+        if not self.logs:
+            print("❌ Không có logs để tạo report")
+            print("💡 Tip: Chạy một vài tests trước để có logs")
+            return False
+        
+        # Hiển thị thống kê hiện tại
+        summary = self.get_summary()
+        print(f"📝 Tổng logs: {summary['total_logs']}")
+        print(f"✅ Thành công: {summary['success_count']}")
+        print(f"❌ Lỗi: {summary['error_count']}")
+        print(f"📈 Success rate: {summary['success_rate']}%")
+        
+        print("\n📋 CHỌN LOẠI REPORT:")
+        print("1. Comprehensive Report - Bao gồm summary + detailed logs")
+        print("2. Summary Only        - Chỉ thống kê tổng hợp")
+        print("0. Hủy")
+        
+        try:
+            choice = int(input("\n👉 Chọn loại report (0-2): ").strip())
+            
+            if choice == 0:
+                print("❌ Đã hủy tạo report")
+                return False
+            
+            # Tên file
+            default_name = f"network_toolkit_report_{self.session_id}.html"
+            html_file = input(f"\n📁 Tên file HTML (Enter = {default_name}): ").strip()
+            if not html_file:
+                html_file = default_name
+            
+            if choice == 1:
+                return self.export_html(html_file, "comprehensive")
+            elif choice == 2:
+                return self.export_html(html_file, "summary")
+            else:
+                print("❌ Lựa chọn không hợp lệ")
+                return False
+                
+        except ValueError:
+            print("❌ Vui lòng nhập số hợp lệ")
+            return False
+        except KeyboardInterrupt:
+            print("\n❌ Đã hủy tạo report")
+            return False
+    
+    def _open_html_file(self, html_file):
+        """Mở HTML file trong browser"""
+        import webbrowser
+        import os
+        
+        try:
+            # Lấy absolute path
+            abs_path = os.path.abspath(html_file)
+            file_url = f"file://{abs_path}"
+            
+            # Mở trong browser
+            webbrowser.open(file_url)
+            print(f"🌐 Đã mở {html_file} trong browser")
+        except Exception as e:
+            print(f"❌ Không thể mở file trong browser: {e}")
+            print(f"💡 Bạn có thể mở file thủ công: {html_file}")
+
+# ============================================================================
+# ICMP ECHO ENGINE
+# ============================================================================
+
+class IcmpEchoEngine:
+    """ICMP echo in-process: một socket cho cả range, match reply theo identifier/sequence
+    
+    Ưu tiên socket SOCK_DGRAM/IPPROTO_ICMP (Linux, không cần root nếu user thuộc
+    net.ipv4.ping_group_range), fallback sang SOCK_RAW khi có quyền.
+    """
+    
+    ICMP_ECHO_REPLY = 0
+    ICMP_ECHO_REQUEST = 8
+    
+    def __init__(self, timeout=1.0, window=256, payload_size=16):
+        self.timeout = timeout
+        self.window = max(1, min(window, 0x8000))
+        self.payload = b"NTK" + bytes(max(0, payload_size - 3))
+        self.sock, self.mode = self._open_socket()
+        self.sock.setblocking(False)
+        try:
+            # Buffer lớn để không drop reply khi cả window trả lời cùng lúc
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        except OSError:
+            pass
+        self.identifier = (os.getpid() ^ id(self)) & 0xFFFF
+    
+    @staticmethod
+    def _open_socket():
+        """Mở ICMP socket, raise OSError nếu không có quyền"""
+        try:
+            return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), 'dgram'
+        except OSError:
+            pass
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), 'raw'
+    
+    @classmethod
+    def is_available(cls):
+        """Kiểm tra hệ thống có cho phép mở ICMP socket không"""
+        try:
+            sock, _ = cls._open_socket()
+            sock.close()
+            return True
+        except OSError:
+            return False
+    
+    @staticmethod
+    def _checksum(data):
+        """Internet checksum (RFC 1071)"""
+        if len(data) % 2:
+            data += b"\x00"
+        total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+        total = (total >> 16) + (total & 0xFFFF)
+        total += total >> 16
+        return ~total & 0xFFFF
+    
+    def _build_packet(self, seq):
+        header = struct.pack("!BBHHH", self.ICMP_ECHO_REQUEST, 0, 0, self.identifier, seq)
+        checksum = self._checksum(header + self.payload)
+        return struct.pack("!BBHHH", self.ICMP_ECHO_REQUEST, 0, checksum, self.identifier, seq) + self.payload
+    
+    def _parse_reply(self, data):
+        """Trả về (identifier, sequence) của echo reply, None nếu không phải"""
+        if self.mode == 'raw':
+            # Raw socket nhận cả IP header
+            data = data[(data[0] & 0x0F) * 4:]
+        if len(data) < 8:
+            return None
+        icmp_type, _, _, identifier, seq = struct.unpack("!BBHHH", data[:8])
+        if icmp_type != self.ICMP_ECHO_REPLY:
+            return None
+        return identifier, seq
+    
+    def sweep(self, ips):
+        """Ping cả range từ một socket, yield (ip, rtt_ms hoặc None) theo thứ tự nhận/timeout
+        
+        `ips` có thể là iterator bất kỳ; tối đa `window` probe chờ reply cùng lúc.
+        """
+        targets = iter(ips)
+        outstanding = {}  # seq -> (ip, send_time), thứ tự insert = thứ tự gửi
+        exhausted = False
+        seq = 0
+        
+        while True:
+            # Gửi probe mới cho đến khi đầy window
+            while not exhausted and len(outstanding) < self.window:
+                ip = next(targets, None)
+                if ip is None:
+                    exhausted = True
+                    break
+                ip = str(ip)
+                seq = (seq + 1) & 0xFFFF
+                while seq in outstanding:
+                    seq = (seq + 1) & 0xFFFF
+                try:
+                    self.sock.sendto(self._build_packet(seq), (ip, 0))
+                except OSError:
+                    yield ip, None
+                    continue
+                outstanding[seq] = (ip, time.perf_counter())
+            
+            if not outstanding:
+                if exhausted:
+                    return
+                continue
+            
+            # Chờ reply đến khi probe cũ nhất hết hạn
+            oldest_sent = next(iter(outstanding.values()))[1]
+            wait = max(0.0, oldest_sent + self.timeout - time.perf_counter())
+            readable, _, _ = select.select([self.sock], [], [], wait)
+            
+            if readable:
+                while True:
+                    try:
+                        data, addr = self.sock.recvfrom(2048)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        break
+                    received_at = time.perf_counter()
+                    reply = self._parse_reply(data)
+                    if reply is None:
+                        continue
+                    identifier, reply_seq = reply
+                    # SOCK_DGRAM: kernel tự gán identifier và chỉ trả reply của socket này
+                    if self.mode == 'raw' and identifier != self.identifier:
+                        continue
+                    entry = outstanding.get(reply_seq)
+                    if entry is None or entry[0] != addr[0]:
+                        continue
+                    del outstanding[reply_seq]
+                    yield entry[0], (received_at - entry[1]) * 1000
+            
+            # Probe quá timeout -> không phản hồi
+            now = time.perf_counter()
+            while outstanding:
+                oldest_seq, (ip, sent_at) = next(iter(outstanding.items()))
+                if now - sent_at < self.timeout:
+                    break
+                del outstanding[oldest_seq]
+                yield ip, None
+    
+    def close(self):
+        self.sock.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+# ============================================================================
+# DNS RESOLVER CACHE
+# ============================================================================
+
+class DnsCache:
+    """Cache phân giải tên dùng chung cho các probe dùng socket
+    
+    Entry thành công sống `ttl` giây (hoặc TTL thật khi được `put` từ DNS response),
+    NXDOMAIN được cache `negative_ttl` giây, vượt quá `max_entries` thì bỏ entry
+    dùng lâu nhất (LRU). IP literal không đi qua cache.
+    """
+    
+    # Lỗi "tên không tồn tại" mới được cache, lỗi tạm thời (EAI_AGAIN...) thì không
+    NEGATIVE_ERRORS = {getattr(socket, name) for name in ("EAI_NONAME", "EAI_NODATA") if hasattr(socket, name)}
+    
+    def __init__(self, ttl=300.0, negative_ttl=60.0, max_entries=4096, instrumentation=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.instrumentation = instrumentation or Instrumentation(enabled=False)
+        self._entries = OrderedDict()  # (host, family) -> (expires_at, addresses, error)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+    
+    def lookup(self, host, family=socket.AF_INET):
+        """Trả về (addresses, cached); raise socket.gaierror nếu không phân giải được"""
+        if self._is_ip_literal(host):
+            return [host], False
+        
+        key = (host.lower().rstrip("."), family)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                if entry[2] is not None:
+                    self.negative_hits += 1
+                    raise socket.gaierror(*entry[2])
+                self.hits += 1
+                return list(entry[1]), True
+            self.misses += 1
+        
+        try:
+            with self.instrumentation.span("dns.resolve"):
+                infos = socket.getaddrinfo(host, None, family, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            if e.errno in self.NEGATIVE_ERRORS:
+                self._store(key, None, self.negative_ttl, (e.errno, e.strerror))
+            raise
+        
+        addresses = list(OrderedDict.fromkeys(info[4][0] for info in infos))
+        self._store(key, addresses, self.ttl)
+        return addresses, False
+    
+    def resolve(self, host, family=socket.AF_INET):
+        """Trả về địa chỉ đầu tiên của host (thay cho socket.gethostbyname)"""
+        return self.lookup(host, family)[0][0]
+    
+    def put(self, host, addresses, ttl=None, family=socket.AF_INET):
+        """Nạp kết quả từ nguồn có TTL thật (vd. DNS response)"""
+        self._store((host.lower().rstrip("."), family), list(addresses), self.ttl if ttl is None else ttl)
+    
+    def _store(self, key, addresses, ttl, error=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, addresses, error)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    @staticmethod
+    def _is_ip_literal(host):
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round((self.hits + self.negative_hits) / lookups * 100, 2) if lookups else 0
+        }
+
+# ============================================================================
+# DNS WIRE-FORMAT CLIENT
+# ============================================================================
+
+class DnsClient:
+    """DNS client stdlib: query A/AAAA/CNAME/MX qua UDP tới server chỉ định, không qua libc resolver
+    
+    Response bị truncate (TC bit) được hỏi lại qua TCP. `query_many` pipeline nhiều
+    query trên cùng một UDP socket, match response theo transaction ID và question.
+    """
+    
+    RECORD_TYPES = {'A': 1, 'NS': 2, 'CNAME': 5, 'MX': 15, 'TXT': 16, 'AAAA': 28}
+    RECORD_NAMES = {value: name for name, value in RECORD_TYPES.items()}
+    RCODES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED'}
+    
+    def __init__(self, server="8.8.8.8", port=53, timeout=2.0):
+        if server.count(":") == 1:
+            server, port = server.split(":")
+        self.server = server
+        self.port = int(port)
+        self.timeout = timeout
+    
+    # ------------------------------------------------------------------
+    # Wire format
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def encode_name(name):
+        encoded = b""
+        for label in name.rstrip(".").split("."):
+            if label:
+                raw = label.encode("idna")
+                if len(raw) > 63:
+                    raise ValueError(f"DNS label quá dài: {label}")
+                encoded += bytes([len(raw)]) + raw
+        return encoded + b"\x00"
+    
+    @classmethod
+    def build_query(cls, txid, name, record_type="A"):
+        qtype = cls.RECORD_TYPES[record_type.upper()]
+        # Flags 0x0100: standard query, recursion desired
+        header = struct.pack("!HHHHHH", txid, 0x0100, 1, 0, 0, 0)
+        return header + cls.encode_name(name) + struct.pack("!HH", qtype, 1)
+    
+    @staticmethod
+    def decode_name(data, offset):
+        """Đọc domain name (có compression pointer), trả về (name, offset sau name)"""
+        labels = []
+        end_offset = None
+        jumps = 0
+        while True:
+            length = data[offset]
+            if length & 0xC0 == 0xC0:
+                if end_offset is None:
+                    end_offset = offset + 2
+                offset = ((length & 0x3F) << 8) | data[offset + 1]
+                jumps += 1
+                if jumps > 64:
+                    raise ValueError("DNS name pointer loop")
+                continue
+            offset += 1
+            if length == 0:
+                break
+            labels.append(data[offset:offset + length].decode("ascii", "replace"))
+            offset += length
+        return ".".join(labels), end_offset if end_offset is not None else offset
+    
+    @classmethod
+    def parse_response(cls, data):
+        """Parse DNS response thành dict (txid, rcode, question, answers...)"""
+        txid, flags, qdcount, ancount, _, _ = struct.unpack("!HHHHHH", data[:12])
+        offset = 12
+        question = None
+        for _ in range(qdcount):
+            qname, offset = cls.decode_name(data, offset)
+            qtype, _ = struct.unpack("!HH", data[offset:offset + 4])
+            offset += 4
+            question = question or (qname.lower(), qtype)
+        
+        answers = []
+        for _ in range(ancount):
+            name, offset = cls.decode_name(data, offset)
+            rtype, _, ttl, rdlength = struct.unpack("!HHIH", data[offset:offset + 10])
+            offset += 10
+            rdata = data[offset:offset + rdlength]
+            if rtype == 1 and rdlength == 4:
+                value = socket.inet_ntop(socket.AF_INET, rdata)
+            elif rtype == 28 and rdlength == 16:
+                value = socket.inet_ntop(socket.AF_INET6, rdata)
+            elif rtype in (2, 5):
+                value = cls.decode_name(data, offset)[0]
+            elif rtype == 15:
+                value = {'preference': struct.unpack("!H", rdata[:2])[0],
+                         'exchange': cls.decode_name(data, offset + 2)[0]}
+            else:
+                value = rdata.hex()
+            answers.append({'name': name, 'type': cls.RECORD_NAMES.get(rtype, str(rtype)),
+                            'ttl': ttl, 'data': value})
+            offset += rdlength
+        
+        rcode = flags & 0x000F
+        return {
+            'txid': txid,
+            'question': question,
+            'rcode': cls.RCODES.get(rcode, str(rcode)),
+            'truncated': bool(flags & 0x0200),
+            'answers': answers
+        }
+    
+    # ------------------------------------------------------------------
+    # Transport
+    # ------------------------------------------------------------------
+    
+    def _result(self, name, record_type, response, transport, rtt_ms):
+        return {
+            'name': name,
+            'type': record_type,
+            'server': self.server,
+            'transport': transport,
+            'rcode': response['rcode'],
+            'answers': response['answers'],
+            'rtt_ms': round(rtt_ms, 3)
+        }
+    
+    def query(self, name, record_type="A"):
+        """Một query đơn (UDP, fallback TCP khi truncate)"""
+        return next(self.query_many([(name, record_type)], window=1))
+    
+    def query_tcp(self, name, record_type="A"):
+        """Query qua TCP (2 byte length prefix)"""
+        txid = random.getrandbits(16)
+        packet = self.build_query(txid, name, record_type)
+        start = time.perf_counter()
+        with socket.create_connection((self.server, self.port), timeout=self.timeout) as sock:
+            sock.sendall(struct.pack("!H", len(packet)) + packet)
+            length = struct.unpack("!H", self._recv_exact(sock, 2))[0]
+            response = self.parse_response(self._recv_exact(sock, length))
+        return self._result(name, record_type, response, 'tcp', (time.perf_counter() - start) * 1000)
+    
+    @staticmethod
+    def _recv_exact(sock, size):
+        buffer = bytearray()
+        while len(buffer) < size:
+            chunk = sock.recv(size - len(buffer))
+            if not chunk:
+                raise ConnectionError("DNS server đóng kết nối TCP")
+            buffer += chunk
+        return bytes(buffer)
+    
+    def query_many(self, queries, window=256):
+        """Pipeline nhiều query trên một UDP socket, yield kết quả theo thứ tự hoàn thành
+        
+        `queries` là iterator các tên hoặc cặp (name, record_type). Query quá `timeout`
+        có 'error': 'timeout'.
+        """
+        pending = iter(queries)
+        outstanding = {}  # txid -> (name, record_type, question, send_time), theo thứ tự gửi
+        exhausted = False
+        family = socket.AF_INET6 if ":" in self.server else socket.AF_INET
+        
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            sock.connect((self.server, self.port))
+            
+            while True:
+                while not exhausted and len(outstanding) < window:
+                    item = next(pending, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    name, record_type = (item, "A") if isinstance(item, str) else item
+                    txid = random.getrandbits(16)
+                    while txid in outstanding:
+                        txid = random.getrandbits(16)
+                    question = (name.rstrip(".").encode("idna").decode("ascii").lower(),
+                                self.RECORD_TYPES[record_type.upper()])
+                    try:
+                        sock.send(self.build_query(txid, name, record_type))
+                    except OSError as e:
+                        yield {'name': name, 'type': record_type, 'server': self.server, 'error': str(e)}
+                        continue
+                    outstanding[txid] = (name, record_type, question, time.perf_counter())
+                
+                if not outstanding:
+                    if exhausted:
+                        return
+                    continue
+                
+                oldest_sent = next(iter(outstanding.values()))[3]
+                wait = max(0.0, oldest_sent + self.timeout - time.perf_counter())
+                readable, _, _ = select.select([sock], [], [], wait)
+                
+                if readable:
+                    while True:
+                        try:
+                            data = sock.recv(65535)
+                        except (BlockingIOError, InterruptedError):
+                            break
+                        except OSError:
+                            # ICMP port unreachable... - các query còn lại sẽ timeout
+                            break
+                        received_at = time.perf_counter()
+                        try:
+                            response = self.parse_response(data)
+                        except (ValueError, IndexError, struct.error):
+                            continue
+                        entry = outstanding.get(response['txid'])
+                        if entry is None or response['question'] != entry[2]:
+                            continue
+                        del outstanding[response['txid']]
+                        name, record_type, _, sent_at = entry
+                        
+                        if response['truncated']:
+                            try:
+                                yield self.query_tcp(name, record_type)
+                            except OSError as e:
+                                yield {'name': name, 'type': record_type, 'server': self.server,
+                                       'transport': 'tcp', 'error': str(e)}
+                            continue
+                        yield self._result(name, record_type, response, 'udp', (received_at - sent_at) * 1000)
+                
+                now = time.perf_counter()
+                while outstanding:
+                    txid, (name, record_type, _, sent_at) = next(iter(outstanding.items()))
+                    if now - sent_at < self.timeout:
+                        break
+                    del outstanding[txid]
+                    yield {'name': name, 'type': record_type, 'server': self.server, 'error': 'timeout'}
+
+# ============================================================================
+# THROUGHPUT ENGINE
+# ============================================================================
+
+class ThroughputServer:
+    """Test server (kiểu iperf) làm đầu xa cho bandwidth/latency test, vd. trên loopback
+    
+    mode="source" gửi liên tục (client đo download), "sink" nhận và bỏ dữ liệu (client đo
+    upload), "duplex" làm cả hai cùng lúc, "echo" gửi lại đúng dữ liệu nhận được (đo RTT).
+    mode="auto" để client chọn mode cho từng connection: client gửi một dòng JSON
+    `{"mode": "sink", "buffer_size": 262144}` và server trả `{"ok": true, ...}` trước khi
+    bắt đầu; với sink, khi client đóng chiều gửi server trả thêm `{"received_bytes": N}`.
+    udp=True mở thêm UDP echo (reflector) cùng port.
+    Dữ liệu gửi là một payload cấp phát sẵn, dữ liệu nhận được đọc bằng recv_into vào
+    buffer dùng lại.
+    """
+    
+    MODES = ("source", "sink", "duplex", "echo")
+    DEFAULT_PORT = 5201
+    PROTOCOL_VERSION = 1
+    MAX_BUFFER_SIZE = 4 * 1024 * 1024
+    
+    def __init__(self, host="127.0.0.1", port=0, buffer_size=262144, socket_buffer=None, mode="source", udp=False):
+        if mode not in self.MODES + ("auto",):
+            raise ValueError(f"mode không hợp lệ: {mode}")
+        self.host = host
+        self.port = port
+        self.buffer_size = buffer_size
+        self.socket_buffer = socket_buffer
+        self.mode = mode
+        self.udp = udp
+        self.payload = memoryview(bytes(buffer_size))
+        self.bytes_received = 0
+        self.connections_served = 0
+        self._listener = None
+        self._udp_sock = None
+        self._connections = set()
+        self._lock = threading.Lock()
+    
+    def start(self):
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.socket_buffer:
+            # Connection được accept thừa hưởng buffer size của listener
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socket_buffer)
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.socket_buffer)
+        self._listener.bind((self.host, self.port))
+        self._listener.listen(128)
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept_loop, name="ThroughputServer", daemon=True).start()
+        
+        if self.udp:
+            self._udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            self._udp_sock.bind((self.host, self.port))
+            threading.Thread(target=self._udp_echo_loop, name="ThroughputServerUDP", daemon=True).start()
+        return self
+    
+    def serve_forever(self):
+        """Chạy tới khi bị Ctrl+C (dùng cho CLI `server`)"""
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+    
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._connections.add(conn)
+                self.connections_served += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+    
+    @staticmethod
+    def read_line(sock, limit=4096):
+        """Đọc một dòng điều khiển từng byte một để không đọc lấn sang dữ liệu test phía sau"""
+        line = bytearray()
+        while len(line) < limit:
+            byte = sock.recv(1)
+            if not byte:
+                break
+            if byte == b"\n":
+                return bytes(line)
+            line += byte
+        raise ConnectionError("không nhận được dòng điều khiển")
+    
+    @staticmethod
+    def send_line(sock, message):
+        sock.sendall(json.dumps(message).encode() + b"\n")
+    
+    def _negotiate(self, conn):
+        """Đọc yêu cầu của client (mode="auto"), trả về (mode, buffer_size) hoặc None"""
+        conn.settimeout(10)
+        try:
+            request = json.loads(self.read_line(conn))
+            mode = request.get('mode')
+            buffer_size = int(request.get('buffer_size', self.buffer_size))
+            if mode not in self.MODES or not 0 < buffer_size <= self.MAX_BUFFER_SIZE:
+                self.send_line(conn, {'ok': False, 'error': f"yêu cầu không hợp lệ: {request}"})
+                return None
+            self.send_line(conn, {'ok': True, 'mode': mode, 'buffer_size': buffer_size,
+                                  'version': self.PROTOCOL_VERSION})
+            conn.settimeout(None)
+            return mode, buffer_size
+        except (OSError, ValueError, AttributeError):
+            return None
+    
+    def _serve(self, conn):
+        try:
+            mode, buffer_size = self.mode, self.buffer_size
+            if mode == "auto":
+                negotiated = self._negotiate(conn)
+                if negotiated is None:
+                    return
+                mode, buffer_size = negotiated
+            
+            if mode == "source":
+                self._send_loop(conn, buffer_size)
+            elif mode == "echo":
+                self._echo_loop(conn, buffer_size)
+            else:
+                if mode == "duplex":
+                    threading.Thread(target=self._send_loop, args=(conn, buffer_size), daemon=True).start()
+                received = self._receive_loop(conn, buffer_size)
+                if mode == "sink" and self.mode == "auto":
+                    try:
+                        self.send_line(conn, {'received_bytes': received})
+                    except OSError:
+                        pass
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+    
+    def _send_loop(self, conn, buffer_size):
+        payload = self.payload if buffer_size == self.buffer_size else memoryview(bytes(buffer_size))
+        try:
+            while True:
+                conn.sendall(payload)
+        except OSError:
+            pass
+    
+    def _receive_loop(self, conn, buffer_size):
+        """Nhận tới khi client đóng chiều gửi, trả về số byte đã nhận"""
+        view = memoryview(bytearray(buffer_size))
+        total = 0
+        try:
+            while True:
+                received = conn.recv_into(view)
+                if not received:
+                    break
+                total += received
+                with self._lock:
+                    self.bytes_received += received
+        except OSError:
+            pass
+        return total
+    
+    def _echo_loop(self, conn, buffer_size):
+        view = memoryview(bytearray(buffer_size))
+        try:
+            while True:
+                received = conn.recv_into(view)
+                if not received:
+                    break
+                conn.sendall(view[:received])
+        except OSError:
+            pass
+    
+    def _udp_echo_loop(self):
+        view = memoryview(bytearray(65535))
+        while True:
+            try:
+                received, addr = self._udp_sock.recvfrom_into(view)
+                self._udp_sock.sendto(view[:received], addr)
+            except OSError:
+                if self._udp_sock is None or self._udp_sock.fileno() == -1:
+                    return
+    
+    def stop(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if self._udp_sock is not None:
+            self._udp_sock.close()
+        with self._lock:
+            connections = list(self._connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+
+class ThroughputEngine:
+    """Đo throughput với nhiều TCP stream song song trên một selector
+    
+    direction="download" đọc bằng `recv_into` vào một buffer cấp phát sẵn, "upload" gửi
+    payload cấp phát sẵn bằng `os.sendfile` (zero-copy, từ file tạm) hoặc `send` các lát
+    memoryview, "duplex" làm cả hai trên cùng stream. Byte mỗi chiều được gom theo
+    `interval` giây để ra các sample throughput. Byte upload là byte đã được kernel nhận
+    vào send buffer.
+    `request` (vd. HTTP GET) được gửi sau khi connect; stream nào bị server đóng thì được
+    mở lại với request đó, không có request thì stream bị bỏ.
+    """
+    
+    DIRECTIONS = ("download", "upload", "duplex")
+    SERVER_MODES = {'download': "source", 'upload': "sink", 'duplex': "duplex"}
+    
+    def __init__(self, streams=4, duration=5.0, interval=1.0, buffer_size=262144, socket_buffer=None, timeout=2.0,
+                 direction="download", use_sendfile=True, negotiate=False):
+        if direction not in self.DIRECTIONS:
+            raise ValueError(f"direction không hợp lệ: {direction}")
+        self.streams = max(1, streams)
+        self.duration = duration
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.socket_buffer = socket_buffer
+        self.timeout = timeout
+        self.direction = direction
+        self.use_sendfile = use_sendfile and hasattr(os, "sendfile")
+        self.negotiate = negotiate
+    
+    def _connect(self, address, port, request):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            if self.socket_buffer:
+                # Set trước connect để TCP window scaling dùng được buffer lớn
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socket_buffer)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.socket_buffer)
+            sock.settimeout(self.timeout)
+            sock.connect((address, port))
+            if self.negotiate:
+                # ThroughputServer(mode="auto"): chọn mode phía server trước khi đo
+                ThroughputServer.send_line(sock, {'mode': self.SERVER_MODES[self.direction],
+                                                  'buffer_size': self.buffer_size})
+                reply = json.loads(ThroughputServer.read_line(sock))
+                if not reply.get('ok'):
+                    raise ConnectionError(reply.get('error', "server từ chối test"))
+            if request:
+                sock.sendall(request)
+            sock.setblocking(False)
+            return sock
+        except (OSError, ValueError):
+            sock.close()
+            raise
+    
+    def _collect_sink_reports(self, selector):
+        """Đóng chiều gửi của mỗi stream và đọc số byte server sink thực sự nhận được"""
+        total = 0
+        for key in list(selector.get_map().values()):
+            sock = key.fileobj
             try:
-                open_file = input("🌐 Mở file trong browser ngay? (y/N): ").strip().lower()
-                if open_file in ['y', 'yes']:
-                    self._open_html_file(html_file)
-            except KeyboardInterrupt:
-                pass
-            
-            return True
-            
-        except Exception as e:
-            print(f"❌ Lỗi tạo HTML report: {e}")
-            return False
+                sock.setblocking(True)
+                sock.settimeout(self.timeout)
+                sock.shutdown(socket.SHUT_WR)
+                total += int(json.loads(ThroughputServer.read_line(sock))['received_bytes'])
+            except (OSError, ValueError, KeyError, TypeError):
+                return None
+        return total
     
-    def _format_timestamp(self):
-        """Format timestamp cho HTML"""
-        from datetime import datetime
-        return datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    @staticmethod
+    def speeds(total_bytes, seconds):
+        """speed_bps/kbps/mbps theo cùng quy ước với bandwidth_test (bytes/giây, chia 1024)"""
+        speed_bps = total_bytes / seconds if seconds > 0 else 0.0
+        return {
+            'speed_bps': round(speed_bps, 2),
+            'speed_kbps': round(speed_bps / 1024, 2),
+            'speed_mbps': round(speed_bps / 1024 / 1024, 2)
+        }
     
-    def _generate_action_tags(self, actions):
-        """Tạo action tags cho HTML"""
-        tags_html = ""
-        for action in actions:
-            tags_html += f'<span class="action-tag">{action}</span> '
-        return tags_html
+    def _directions(self):
+        return ("download", "upload") if self.direction == "duplex" else (self.direction,)
     
-    def _generate_logs_table(self):
-        """Tạo bảng logs cho HTML"""
-        if not self.logs:
-            return "<p>Không có logs để hiển thị.</p>"
-        
-        table_html = """
-            <div class="logs-section">
-                <h2 class="section-title">📋 Detailed Logs</h2>
-                <table class="logs-table">
-                    <thead>
-                        <tr>
-                            <th>⏰ Timestamp</th>
-                            <th>🎯 Action</th>
-                            <th>📊 Status</th>
-                            <th>💬 Message</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-        """
-        
-        # Chỉ hiển thị 50 logs gần nhất để tránh file quá lớn
-        recent_logs = self.logs[-50:] if len(self.logs) > 50 else self.logs
-        
-        for log in recent_logs:
-            timestamp = log['timestamp'].split('T')[1].split('.')[0]  # Chỉ lấy time
-            status_class = f"status-{log['status']}"
-            
-            table_html += f"""
-                        <tr>
-                            <td class="timestamp">{timestamp}</td>
-                            <td><span class="action-tag">{log['action']}</span></td>
-                            <td><span class="status-badge {status_class}">{log['status']}</span></td>
-                            <td>{log['message']}</td>
-                        </tr>
-            """
-        
-        table_html += """
-                    </tbody>
-                </table>
-            </div>
-        """
-        
-        if len(self.logs) > 50:
-            table_html += f"<p style='text-align: center; margin-top: 15px; color: #6c757d;'>Hiển thị 50 logs gần nhất (tổng: {len(self.logs)} logs)</p>"
-        
-        return table_html
+    def _open_payload_file(self):
+        """File tạm chứa payload cho os.sendfile (None nếu không dùng sendfile)"""
+        if not self.use_sendfile or self.direction == "download":
+            return None
+        import tempfile
+        payload_file = tempfile.TemporaryFile()
+        payload_file.write(bytes(self.buffer_size))
+        payload_file.flush()
+        return payload_file
     
-    def interactive_html_export(self):
-        """Interactive HTML export với menu tùy chọn"""
-        print("\n🌐 HTML REPORT EXPORT")
-        print("=" * 50)
-        
-        if not self.logs:
-            print("❌ Không có logs để tạo report")
-            print("💡 Tip: Chạy một vài tests trước để có logs")
-            return False
-        
-        # Hiển thị thống kê hiện tại
-        summary = self.get_summary()
-        print(f"📝 Tổng logs: {summary['total_logs']}")
-        print(f"✅ Thành công: {summary['success_count']}")
-        print(f"❌ Lỗi: {summary['error_count']}")
-        print(f"📈 Success rate: {summary['success_rate']}%")
-        
-        print("\n📋 CHỌN LOẠI REPORT:")
-        print("1. Comprehensive Report - Bao gồm summary + detailed logs")
-        print("2. Summary Only        - Chỉ thống kê tổng hợp")
-        print("0. Hủy")
+    def run(self, address, port, request=None, on_sample=None):
+        """Chạy test, trả về dict tổng hợp; on_sample(sample) được gọi sau mỗi interval"""
+        directions = self._directions()
+        sending = "upload" in directions
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if sending else 0)
+        selector = selectors.DefaultSelector()
+        received_bytes = [0] * self.streams
+        sent_bytes = [0] * self.streams
+        offsets = [0] * self.streams
+        connections = 0
+        errors = []
+        
+        for index in range(self.streams):
+            try:
+                selector.register(self._connect(address, port, request), events, index)
+                connections += 1
+            except (OSError, ValueError) as e:
+                errors.append(str(e))
+        if not connections:
+            selector.close()
+            raise ConnectionError(errors[0] if errors else "không mở được stream nào")
+        
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        payload = memoryview(bytes(self.buffer_size))
+        payload_file = self._open_payload_file()
+        size = self.buffer_size
+        
+        samples = []
+        start = time.perf_counter()
+        deadline = start + self.duration
+        next_sample = start + self.interval
+        sample_start = start
+        sample_received = sample_sent = 0
         
         try:
-            choice = int(input("\n👉 Chọn loại report (0-2): ").strip())
-            
-            if choice == 0:
-                print("❌ Đã hủy tạo report")
-                return False
-            
-            # Tên file
-            default_name = f"network_toolkit_report_{self.session_id}.html"
-            html_file = input(f"\n📁 Tên file HTML (Enter = {default_name}): ").strip()
-            if not html_file:
-                html_file = default_name
-            
-            if choice == 1:
-                return self.export_html(html_file, "comprehensive")
-            elif choice == 2:
-                return self.export_html(html_file, "summary")
-            else:
-                print("❌ Lựa chọn không hợp lệ")
-                return False
+            while selector.get_map():
+                now = time.perf_counter()
+                if now >= next_sample or now >= deadline:
+                    elapsed = now - sample_start
+                    sample = {
+                        'start': round(sample_start - start, 3),
+                        'end': round(now - start, 3),
+                        'bytes': sample_received + sample_sent,
+                        **self.speeds(sample_received + sample_sent, elapsed)
+                    }
+                    for direction, count in (("download", sample_received), ("upload", sample_sent)):
+                        if direction in directions:
+                            sample[f'{direction}_mbps'] = self.speeds(count, elapsed)['speed_mbps']
+                    samples.append(sample)
+                    if on_sample:
+                        on_sample(sample)
+                    sample_start = now
+                    sample_received = sample_sent = 0
+                    next_sample = now + self.interval
+                    if now >= deadline:
+                        break
                 
-        except ValueError:
-            print("❌ Vui lòng nhập số hợp lệ")
-            return False
-        except KeyboardInterrupt:
-            print("\n❌ Đã hủy tạo report")
-            return False
+                for key, mask in selector.select(min(next_sample, deadline) - now):
+                    sock, index = key.fileobj, key.data
+                    closed = False
+                    try:
+                        if mask & selectors.EVENT_READ:
+                            received = sock.recv_into(view)
+                            if received:
+                                received_bytes[index] += received
+                                sample_received += received
+                            else:
+                                closed = True
+                        if mask & selectors.EVENT_WRITE and not closed:
+                            offset = offsets[index]
+                            if payload_file is not None:
+                                sent = os.sendfile(sock.fileno(), payload_file.fileno(), offset, size - offset)
+                            else:
+                                sent = sock.send(payload[offset:])
+                            offsets[index] = (offset + sent) % size
+                            sent_bytes[index] += sent
+                            sample_sent += sent
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    except OSError:
+                        closed = True
+                    
+                    if not closed:
+                        continue
+                    
+                    # Server đóng stream: mở lại nếu có request để gửi, không thì bỏ stream
+                    selector.unregister(sock)
+                    sock.close()
+                    if request and time.perf_counter() < deadline:
+                        try:
+                            selector.register(self._connect(address, port, request), events, index)
+                            connections += 1
+                        except (OSError, ValueError) as e:
+                            errors.append(str(e))
+            
+            elapsed = time.perf_counter() - start
+            server_received = None
+            if self.negotiate and self.direction == "upload":
+                server_received = self._collect_sink_reports(selector)
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+            if payload_file is not None:
+                payload_file.close()
+        
+        result = {
+            'direction': self.direction,
+            'duration_seconds': round(elapsed, 3),
+            'streams': self.streams,
+            'connections_made': connections,
+            'intervals': samples,
+            'errors': errors[:5]
+        }
+        total_bytes = 0
+        for direction, per_stream in (("download", received_bytes), ("upload", sent_bytes)):
+            if direction in directions:
+                total_bytes += sum(per_stream)
+                result[direction] = {
+                    'total_bytes': sum(per_stream),
+                    'per_stream_bytes': per_stream,
+                    **self.speeds(sum(per_stream), elapsed)
+                }
+        if server_received is not None:
+            result['upload']['server_received_bytes'] = server_received
+            result['upload']['server_speed_mbps'] = self.speeds(server_received, elapsed)['speed_mbps']
+        result['total_bytes'] = total_bytes
+        result.update(self.speeds(total_bytes, elapsed))
+        return result
+
+# ============================================================================
+# UDP JITTER / LOSS ENGINE
+# ============================================================================
+
+class UdpProbeEngine:
+    """Gửi UDP probe tới reflector (UDP echo của ThroughputServer) với tốc độ cố định
     
-    def _open_html_file(self, html_file):
-        """Mở HTML file trong browser"""
-        import webbrowser
-        import os
+    Mỗi probe mang sequence number và timestamp gửi, reflector gửi lại nguyên vẹn.
+    Thống kê được cập nhật khi nhận từng packet, bộ nhớ cố định theo `window`:
+    loss, duplicate, reorder (tới sau một seq lớn hơn), jitter theo RFC 3550
+    (J += (|D| - J) / 16, D là chênh lệch transit time giữa hai packet liên tiếp; ở đây
+    transit là round-trip vì chỉ có đồng hồ phía client) và RTT qua LatencyStats.
+    Duplicate được nhận ra qua ring `window` seq gần nhất; packet cũ hơn cả window
+    được đếm là `late`.
+    """
+    
+    MAGIC = 0x4E54  # "NT"
+    HEADER = struct.Struct("!HIQ")  # magic, seq, thời điểm gửi (perf_counter_ns)
+    
+    def __init__(self, rate_pps=50, packet_size=172, duration=5.0, window=1024, timeout=1.0):
+        self.rate_pps = max(1, rate_pps)
+        self.packet_size = max(packet_size, self.HEADER.size)
+        self.duration = duration
+        self.window = window
+        self.timeout = timeout
+        self._reset()
+    
+    def _reset(self):
+        self.sent = 0
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.late = 0
+        self.max_reorder_distance = 0
+        self.jitter_ms = 0.0
+        self.rtt = LatencyStats()
+        self._highest_seq = -1
+        self._last_transit = None
+        self._seen = array.array('q', [-1]) * self.window  # ring: seq % window -> seq
+    
+    def _on_packet(self, data, now_ns):
+        """Cập nhật thống kê cho một packet nhận được"""
+        if len(data) < self.HEADER.size:
+            return
+        magic, seq, sent_ns = self.HEADER.unpack_from(data)
+        if magic != self.MAGIC or seq >= self.sent:
+            return
+        
+        if seq <= self._highest_seq - self.window:
+            # Ngoài window: không còn biết có phải duplicate hay không
+            self.late += 1
+            return
+        slot = seq % self.window
+        if self._seen[slot] == seq:
+            self.duplicates += 1
+            return
+        self._seen[slot] = seq
+        self.received += 1
+        
+        if seq < self._highest_seq:
+            self.reordered += 1
+            self.max_reorder_distance = max(self.max_reorder_distance, self._highest_seq - seq)
+        else:
+            self._highest_seq = seq
         
-        try:
-            # Lấy absolute path
-            abs_path = os.path.abspath(html_file)
-            file_url = f"file://{abs_path}"
+        transit_ms = (now_ns - sent_ns) / 1e6
+        self.rtt.add(transit_ms)
+        if self._last_transit is not None:
+            self.jitter_ms += (abs(transit_ms - self._last_transit) - self.jitter_ms) / 16
+        self._last_transit = transit_ms
+    
+    def run(self, address, port):
+        """Chạy probe stream, trả về dict thống kê"""
+        self._reset()
+        total = max(1, round(self.duration * self.rate_pps))
+        interval_ns = 1e9 / self.rate_pps
+        packet = bytearray(self.packet_size)
+        buffer = bytearray(65535)
+        
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            sock.connect((address, port))
+            sock.setblocking(False)
+            errors = 0
             
-            # Mở trong browser
-            webbrowser.open(file_url)
-            print(f"🌐 Đã mở {html_file} trong browser")
-        except Exception as e:
-            print(f"❌ Không thể mở file trong browser: {e}")
-            print(f"💡 Bạn có thể mở file thủ công: {html_file}")
+            start_ns = time.perf_counter_ns()
+            end_ns = None
+            while True:
+                now_ns = time.perf_counter_ns()
+                if self.sent < total:
+                    due_ns = start_ns + self.sent * interval_ns
+                    if now_ns >= due_ns:
+                        self.HEADER.pack_into(packet, 0, self.MAGIC, self.sent, now_ns)
+                        try:
+                            sock.send(packet)
+                        except (BlockingIOError, ConnectionRefusedError):
+                            errors += 1
+                        self.sent += 1
+                        continue
+                    wait = (due_ns - now_ns) / 1e9
+                else:
+                    # Hết probe: chờ thêm `timeout` cho các reply tới trễ
+                    if end_ns is None:
+                        end_ns = now_ns + self.timeout * 1e9
+                    if now_ns >= end_ns or self.received == self.sent:
+                        break
+                    wait = (end_ns - now_ns) / 1e9
+                
+                readable, _, _ = select.select([sock], [], [], wait)
+                while readable:
+                    try:
+                        size = sock.recv_into(buffer)
+                    except BlockingIOError:
+                        break
+                    except ConnectionRefusedError:
+                        errors += 1
+                        break
+                    self._on_packet(memoryview(buffer)[:size], time.perf_counter_ns())
+            
+            elapsed = (time.perf_counter_ns() - start_ns) / 1e9
+        
+        lost = self.sent - self.received
+        return {
+            'sent': self.sent,
+            'received': self.received,
+            'lost': lost,
+            'loss_percent': round(lost / self.sent * 100, 3),
+            'duplicates': self.duplicates,
+            'reordered': self.reordered,
+            'max_reorder_distance': self.max_reorder_distance,
+            'late': self.late,
+            'jitter_ms': round(self.jitter_ms, 4),
+            'rtt': self.rtt.to_dict(),
+            'rate_pps': self.rate_pps,
+            'packet_size': self.packet_size,
+            'duration_seconds': round(elapsed, 3),
+            'send_errors': errors
+        }
 
 # ============================================================================
 # NETWORK TOOLKIT CLASS
 # ============================================================================
 
 class NetworkToolkit:
-    def __init__(self):
+    HTTP_PIPELINE = 16  # số GET gửi trên mỗi connection khi bandwidth_test đo web server
+    # errno của connect nghĩa là port đóng / bị filter (status 'closed'); errno khác là 'error'
+    CLOSED_CONNECT_ERRNOS = frozenset(getattr(errno, name) for name in (
+        'ECONNREFUSED', 'ETIMEDOUT', 'EAGAIN', 'EWOULDBLOCK', 'EHOSTUNREACH', 'ENETUNREACH',
+        'WSAECONNREFUSED', 'WSAETIMEDOUT', 'WSAEWOULDBLOCK', 'WSAEHOSTUNREACH', 'WSAENETUNREACH'
+    ) if hasattr(errno, name))
+    
+    def __init__(self, logger=None, resolver=None, instrumentation=None):
         self.results = {}
-        self.logger = NetworkLogger()
+        self.logger = logger or NetworkLogger()
+        
+        # Các probe dùng socket phân giải tên qua cache chung; ping/traceroute nhận hostname gốc
+        self.resolver = resolver or DnsCache()
+        self.logger.summary_providers['dns_cache'] = self.resolver.stats
+        
+        # Span của probe, resolver và writer thread của logger cộng vào cùng một Instrumentation
+        self.instrumentation = instrumentation or Instrumentation()
+        self.resolver.instrumentation = self.instrumentation
+        self.logger.instrumentation = self.instrumentation
+        self.logger.summary_providers['spans'] = self.instrumentation.stats
         
     # ========================================================================
     # BASIC NETWORK FUNCTIONS
@@ -797,9 +3611,9 @@ class NetworkToolkit:
         command = ["ping", param, str(count), host]
         
         try:
-            start_time = time.time()
-            result = subprocess.run(command, capture_output=True, text=True, timeout=15)
-            execution_time = time.time() - start_time
+            with self.instrumentation.span("subprocess.run", command="ping") as span:
+                result = subprocess.run(command, capture_output=True, text=True, timeout=15)
+            execution_time = span.duration_ns / 1e9
             
             ping_details = {
                 'host': host,
@@ -807,6 +3621,7 @@ class NetworkToolkit:
                 'command': ' '.join(command),
                 'return_code': result.returncode,
                 'execution_time_seconds': round(execution_time, 2),
+                'duration_ms': span.duration_ms,
                 'output_length': len(result.stdout) if result.stdout else 0
             }
             
@@ -837,53 +3652,117 @@ class NetworkToolkit:
             self.results[f'ping_{host}'] = {'host': host, 'success': False, 'error': str(e)}
             return False
     
-    def check_dns(self, domains=None):
-        """Kiểm tra DNS resolution"""
+    def check_dns(self, domains=None, concurrency=10, server=None, record_type="A"):
+        """Kiểm tra DNS resolution
+        
+        Các domain được phân giải song song bởi tối đa `concurrency` thread
+        (concurrency=1 chạy tuần tự); `dns_results` giữ đúng thứ tự của `domains`.
+        Khi có `server` ("1.1.1.1" hoặc "host:port"), query `record_type` được gửi thẳng
+        tới server đó bằng DnsClient (pipeline `concurrency` query trên một socket).
+        """
         if domains is None:
             domains = ["google.com", "github.com", "cloudflare.com"]
         
         self.logger.log_start("dns_check", f"Kiểm tra DNS cho {len(domains)} domains")
         
-        dns_results = []
-        success_count = 0
-        
-        for domain in domains:
+        def resolve_domain(domain):
             try:
-                start_time = time.time()
-                ip = socket.gethostbyname(domain)
-                resolve_time = (time.time() - start_time) * 1000
+                with self.instrumentation.span("dns.lookup") as span:
+                    addresses, cached = self.resolver.lookup(domain)
+                ip = addresses[0]
+                resolve_time = span.duration_ms
                 
                 dns_result = {
                     'domain': domain, 
                     'ip': ip, 
                     'success': True, 
-                    'resolve_time_ms': round(resolve_time, 2)
+                    'resolve_time_ms': round(resolve_time, 2),
+                    'duration_ms': span.duration_ms,
+                    'cached': cached
                 }
-                dns_results.append(dns_result)
-                success_count += 1
                 
                 self.logger.log_success("dns_resolve", dns_result,
                                       f"DNS {domain} -> {ip} ({resolve_time:.2f}ms)")
                 
             except socket.gaierror as e:
                 dns_result = {'domain': domain, 'success': False, 'error': str(e), 'error_type': 'gaierror'}
-                dns_results.append(dns_result)
                 self.logger.log_error("dns_resolve", str(e), dns_result)
             except Exception as e:
                 dns_result = {'domain': domain, 'success': False, 'error': str(e), 'error_type': 'exception'}
-                dns_results.append(dns_result)
                 self.logger.log_error("dns_resolve", str(e), dns_result)
+            return dns_result
+        
+        def wire_result(domain, response):
+            if 'error' in response:
+                error_type = 'timeout' if response['error'] == 'timeout' else 'exception'
+                dns_result = {'domain': domain, 'success': False, 'error': response['error'],
+                              'error_type': error_type, 'server': server}
+                self.logger.log_error("dns_resolve", response['error'], dns_result)
+                return dns_result
+            
+            answers = response['answers']
+            values = [a['data'] for a in answers if a['type'] == record_type.upper()] or [a['data'] for a in answers]
+            if response['rcode'] != 'NOERROR' or not values:
+                error = response['rcode'] if response['rcode'] != 'NOERROR' else 'NODATA'
+                dns_result = {'domain': domain, 'success': False, 'error': error, 'error_type': 'rcode',
+                              'server': server, 'resolve_time_ms': round(response['rtt_ms'], 2)}
+                self.logger.log_error("dns_resolve", error, dns_result)
+                return dns_result
+            
+            addresses = [a['data'] for a in answers if a['type'] in ('A', 'AAAA')]
+            self.instrumentation.record("dns.query", int(response['rtt_ms'] * 1e6), {'server': server})
+            dns_result = {
+                'domain': domain,
+                'ip': addresses[0] if addresses else str(values[0]),
+                'success': True,
+                'resolve_time_ms': round(response['rtt_ms'], 2),
+                'duration_ms': round(response['rtt_ms'], 3),
+                'record_type': record_type.upper(),
+                'answers': values,
+                'server': server,
+                'transport': response['transport']
+            }
+            # TTL thật từ response cho cache dùng chung
+            a_records = [a for a in answers if a['type'] == 'A']
+            if a_records:
+                self.resolver.put(domain, [a['data'] for a in a_records], ttl=min(a['ttl'] for a in a_records))
+            
+            self.logger.log_success("dns_resolve", dns_result,
+                                  f"DNS {domain} {record_type.upper()} -> {dns_result['ip']} "
+                                  f"({dns_result['resolve_time_ms']:.2f}ms)")
+            return dns_result
+        
+        workers = max(1, min(concurrency, len(domains)))
+        with self.instrumentation.span("dns.check") as wall_span:
+            if server:
+                client = DnsClient(server)
+                responses = {r['name']: r for r in client.query_many(((d, record_type) for d in domains), window=workers)}
+                dns_results = [wire_result(domain, responses[domain]) for domain in domains]
+            elif workers == 1:
+                dns_results = [resolve_domain(domain) for domain in domains]
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    dns_results = list(executor.map(resolve_domain, domains))
+        wall_time = wall_span.duration_ms
+        
+        success_count = sum(1 for r in dns_results if r['success'])
+        latency_sum = sum(r.get('resolve_time_ms', 0) for r in dns_results)
         
         self.results['dns'] = dns_results
         
         summary = {
             'total_domains': len(domains), 
             'success_count': success_count, 
-            'success_rate': success_count/len(domains)*100
+            'success_rate': success_count/len(domains)*100 if domains else 0,
+            'concurrency': workers,
+            'wall_time_ms': round(wall_time, 2),
+            'duration_ms': wall_span.duration_ms,
+            'sum_resolve_time_ms': round(latency_sum, 2)
         }
         
         self.logger.log_success("dns_check", summary,
-                              f"DNS check hoàn thành: {success_count}/{len(domains)} thành công")
+                              f"DNS check hoàn thành: {success_count}/{len(domains)} thành công "
+                              f"({wall_time:.2f}ms, tổng latency {latency_sum:.2f}ms)")
         
         return success_count == len(domains)
     
@@ -899,19 +3778,22 @@ class NetworkToolkit:
         
         for host, port in hosts:
             try:
-                start_time = time.time()
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(5)
-                result = sock.connect_ex((host, port))
-                sock.close()
-                connect_time = (time.time() - start_time) * 1000
+                with self.instrumentation.span("connectivity.check") as probe_span:
+                    address = self.resolver.resolve(host)
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.settimeout(5)
+                    with self.instrumentation.span("tcp.connect") as connect_span:
+                        result = sock.connect_ex((address, port))
+                    sock.close()
+                connect_time = connect_span.duration_ms
                 
                 if result == 0:
                     conn_result = {
                         'host': host,
                         'port': port,
                         'success': True,
-                        'connect_time_ms': round(connect_time, 2)
+                        'connect_time_ms': round(connect_time, 2),
+                        'duration_ms': probe_span.duration_ms
                     }
                     connectivity_results.append(conn_result)
                     success_count += 1
@@ -926,7 +3808,7 @@ class NetworkToolkit:
                         'error': f'Connection failed (code: {result})'
                     }
                     connectivity_results.append(conn_result)
-                    self.logger.log_error("connectivity_test", f"Kết nối thất bại", conn_result)
+                    self.logger.log_error("connectivity_test", "Kết nối thất bại", conn_result)
                     
             except Exception as e:
                 conn_result = {
@@ -957,7 +3839,7 @@ class NetworkToolkit:
         
         try:
             hostname = socket.gethostname()
-            local_ip = socket.gethostbyname(hostname)
+            local_ip = self.resolver.resolve(hostname)
             
             local_details = {
                 'hostname': hostname,
@@ -983,8 +3865,14 @@ class NetworkToolkit:
     # ADVANCED NETWORK FUNCTIONS
     # ========================================================================
     
-    def port_scan(self, host="127.0.0.1", ports=None, port_range=None):
-        """Scan các port"""
+    def port_scan(self, host="127.0.0.1", ports=None, port_range=None, engine="async",
+                  concurrency=1000, timeout=2, deadline=None):
+        """Scan các port
+        
+        engine="async" dùng non-blocking connect trên asyncio với tối đa `concurrency`
+        socket đồng thời; engine="thread" dùng ThreadPoolExecutor(50) như trước.
+        `deadline` (giây) giới hạn tổng thời gian scan, port chưa kịp scan có status 'skipped'.
+        """
         if ports is None and port_range is None:
             ports = [22, 23, 25, 53, 80, 443, 3389, 5432, 3306]
         elif port_range:
@@ -993,35 +3881,25 @@ class NetworkToolkit:
         
         self.logger.log_start("port_scan", f"Scanning {len(ports)} ports trên {host}")
         
-        def check_port(port):
+        with self.instrumentation.span("port_scan", engine=engine) as scan_span:
             try:
-                start_time = time.time()
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(2)
-                result = sock.connect_ex((host, port))
-                sock.close()
-                connect_time = (time.time() - start_time) * 1000
-                
-                if result == 0:
-                    self.logger.log_success("port_check", 
-                                          {'host': host, 'port': port, 'connect_time_ms': connect_time},
-                                          f"Port {port} mở ({connect_time:.2f}ms)")
-                    return {'port': port, 'status': 'open', 'connect_time_ms': round(connect_time, 2)}
-                else:
-                    return {'port': port, 'status': 'closed'}
+                address = self.resolver.resolve(host)
             except Exception as e:
-                self.logger.log_error("port_check", str(e), {'host': host, 'port': port})
-                return {'port': port, 'status': 'error', 'error': str(e)}
-        
-        start_scan_time = time.time()
-        with ThreadPoolExecutor(max_workers=50) as executor:
-            port_results = list(executor.map(check_port, ports))
-        scan_duration = time.time() - start_scan_time
+                # Không phân giải được host: mọi port đều lỗi
+                self.logger.log_error("port_check", str(e), {'host': host})
+                port_results = [{'port': port, 'status': 'error', 'error': str(e)} for port in ports]
+            else:
+                if engine == "thread":
+                    port_results = self._port_scan_threaded(host, address, ports, timeout)
+                else:
+                    port_results = self._port_scan_async(host, address, ports, concurrency, timeout, deadline)
+        scan_duration = scan_span.duration_ns / 1e9
         
         # Phân tích kết quả
         open_ports = [p for p in port_results if p['status'] == 'open']
         closed_ports = [p for p in port_results if p['status'] == 'closed']
         error_ports = [p for p in port_results if p['status'] == 'error']
+        skipped_ports = [p for p in port_results if p['status'] == 'skipped']
         
         scan_summary = {
             'host': host,
@@ -1029,7 +3907,10 @@ class NetworkToolkit:
             'open_count': len(open_ports),
             'closed_count': len(closed_ports),
             'error_count': len(error_ports),
+            'skipped_count': len(skipped_ports),
+            'engine': engine,
             'scan_duration_seconds': round(scan_duration, 2),
+            'duration_ms': scan_span.duration_ms,
             'open_ports': [p['port'] for p in open_ports]
         }
         
@@ -1051,14 +3932,260 @@ class NetworkToolkit:
         
         return len(open_ports) > 0
     
-    def network_scan(self, network="192.168.1", start=1, end=10):
-        """Quét các thiết bị trong mạng LAN"""
-        ip_range = f"{network}.{start}-{end}"
-        total_ips = end - start + 1
+    def _port_scan_threaded(self, host, address, ports, timeout=2):
+        """Scan port bằng thread pool với blocking connect_ex"""
+        def check_port(port):
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.settimeout(timeout)
+                with self.instrumentation.span("tcp.connect", engine="thread") as span:
+                    result = sock.connect_ex((address, port))
+                sock.close()
+                connect_time = span.duration_ms
+                
+                if result == 0:
+                    self.logger.log_success("port_check", 
+                                          {'host': host, 'port': port, 'connect_time_ms': connect_time},
+                                          f"Port {port} mở ({connect_time:.2f}ms)")
+                    return {'port': port, 'status': 'open', 'connect_time_ms': round(connect_time, 2)}
+                elif result in self.CLOSED_CONNECT_ERRNOS:
+                    return {'port': port, 'status': 'closed'}
+                else:
+                    raise OSError(result, os.strerror(result))
+            except Exception as e:
+                self.logger.log_error("port_check", str(e), {'host': host, 'port': port})
+                return {'port': port, 'status': 'error', 'error': str(e)}
+        
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            return list(executor.map(check_port, ports))
+    
+    def _port_scan_async(self, host, address, ports, concurrency=1000, timeout=2, deadline=None):
+        """Scan port bằng asyncio: `concurrency` worker, mỗi worker một non-blocking connect"""
+        concurrency = max(1, min(concurrency, len(ports) or 1, self._max_open_sockets()))
+        port_results = [None] * len(ports)
+        
+        async def check_port(loop, port, connect_timeout):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                with self.instrumentation.span("tcp.connect", engine="async") as span:
+                    await asyncio.wait_for(loop.sock_connect(sock, (address, port)), connect_timeout)
+                connect_time = span.duration_ms
+            except asyncio.TimeoutError:
+                # Timeout bị deadline cắt ngắn thì chưa scan xong port, giống port chưa kịp scan
+                return {'port': port, 'status': 'skipped' if connect_timeout < timeout else 'closed'}
+            except OSError as e:
+                # Refused / unreachable như connect_ex của engine thread, lỗi khác để worker ghi 'error'
+                if e.errno in self.CLOSED_CONNECT_ERRNOS:
+                    return {'port': port, 'status': 'closed'}
+                raise
+            finally:
+                sock.close()
+            
+            self.logger.log_success("port_check",
+                                  {'host': host, 'port': port, 'connect_time_ms': connect_time},
+                                  f"Port {port} mở ({connect_time:.2f}ms)")
+            return {'port': port, 'status': 'open', 'connect_time_ms': round(connect_time, 2)}
+        
+        async def worker(loop, queue, end_time):
+            for index, port in queue:
+                remaining = end_time - loop.time() if end_time is not None else timeout
+                if remaining <= 0:
+                    port_results[index] = {'port': port, 'status': 'skipped'}
+                    continue
+                try:
+                    port_results[index] = await check_port(loop, port, min(timeout, remaining))
+                except Exception as e:
+                    self.logger.log_error("port_check", str(e), {'host': host, 'port': port})
+                    port_results[index] = {'port': port, 'status': 'error', 'error': str(e)}
+        
+        async def run_scan():
+            loop = asyncio.get_running_loop()
+            end_time = loop.time() + deadline if deadline else None
+            # Các worker dùng chung một iterator nên mỗi port chỉ được lấy một lần
+            queue = iter(enumerate(ports))
+            await asyncio.gather(*(worker(loop, queue, end_time) for _ in range(concurrency)))
+        
+        asyncio.run(run_scan())
+        return port_results
+    
+    def _max_open_sockets(self):
+        """Số socket tối đa có thể mở đồng thời theo giới hạn file descriptor"""
+        try:
+            import resource
+            soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+            if soft_limit == resource.RLIM_INFINITY:
+                return 65536
+            return max(1, soft_limit - 64)
+        except (ImportError, ValueError, OSError):
+            return 2048
+    
+    def network_scan(self, network="192.168.1", start=1, end=10, method="auto", timeout=1.0,
+                     shard_prefix=22, checkpoint_file=None):
+        """Quét các thiết bị trong mạng LAN
+        
+        `network` là prefix 3 octet ("192.168.1", quét .start-.end), một CIDR ("10.0.0.0/16")
+        hoặc list các CIDR. Target được sinh lazy theo shard (mặc định /22); sau mỗi shard
+        tiến độ được ghi vào checkpoint file nên lần chạy lại cùng target sẽ tiếp tục từ đó.
+        
+        method="icmp" gửi ICMP echo in-process cho cả range từ một socket,
+        method="subprocess" gọi lệnh ping cho từng IP, "auto" dùng ICMP nếu hệ thống cho phép.
+        """
+        targets = self._parse_scan_targets(network, start, end)
+        ip_range = ", ".join(targets)
+        total_ips = sum(self._count_scan_hosts(target) for target in targets)
+        total_shards = sum(1 for _ in self._iter_scan_shards(targets, shard_prefix, count_only=True))
         self.logger.log_start("network_scan", f"Quét {total_ips} IPs trong range {ip_range}")
         
+        if method == "auto":
+            method = "icmp" if IcmpEchoEngine.is_available() else "subprocess"
+        
+        # Checkpoint chỉ cần khi sweep có nhiều shard
+        if checkpoint_file is None and total_shards > 1:
+            digest = hashlib.sha1(f"{ip_range}|{shard_prefix}".encode()).hexdigest()[:12]
+            checkpoint_file = f"network_toolkit_scan_{digest}.checkpoint.json"
+        checkpoint = self._load_scan_checkpoint(checkpoint_file, targets, shard_prefix)
+        resumed_shards = checkpoint['next_shard']
+        active_hosts = checkpoint['active_hosts']
+        
+        if resumed_shards:
+            self.logger.log_info("network_scan",
+                                 f"Tiếp tục từ checkpoint: shard {resumed_shards + 1}/{total_shards}",
+                                 {'checkpoint_file': checkpoint_file, 'resumed_shards': resumed_shards})
+        
+        shards = itertools.islice(self._iter_scan_shards(targets, shard_prefix), resumed_shards, None)
+        try:
+            with self.instrumentation.span("network_scan", method=method) as scan_span:
+                for shard_index, shard_hosts in enumerate(shards, resumed_shards + 1):
+                    if method == "icmp":
+                        active_hosts.extend(self._icmp_sweep(shard_hosts, timeout))
+                    else:
+                        active_hosts.extend(self._subprocess_sweep(list(shard_hosts)))
+                    
+                    checkpoint['next_shard'] = shard_index
+                    if checkpoint_file and shard_index < total_shards:
+                        self._save_scan_checkpoint(checkpoint_file, checkpoint)
+        except KeyboardInterrupt:
+            self.logger.log_warning("network_scan", "Đã dừng, chạy lại cùng range để tiếp tục",
+                                    {'checkpoint_file': checkpoint_file, 'next_shard': checkpoint['next_shard']})
+            raise
+        scan_duration = scan_span.duration_ns / 1e9
+        
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        
+        scan_summary = {
+            'network_range': ip_range,
+            'total_ips_scanned': total_ips,
+            'active_hosts_found': len(active_hosts),
+            'scan_duration_seconds': round(scan_duration, 2),
+            'duration_ms': scan_span.duration_ms,
+            'method': method,
+            'total_shards': total_shards,
+            'resumed_shards': resumed_shards,
+            'active_hosts': active_hosts,
+            'discovery_rate': len(active_hosts) / total_ips * 100 if total_ips > 0 else 0
+        }
+        
+        if active_hosts:
+            self.logger.log_success("network_scan", scan_summary,
+                                  f"Network scan hoàn thành: {len(active_hosts)} thiết bị tìm thấy")
+            print(f"✅ Tìm thấy {len(active_hosts)} thiết bị:")
+            for host in active_hosts:
+                print(f"   📱 {host}")
+        else:
+            self.logger.log_warning("network_scan", "Không tìm thấy thiết bị nào", scan_summary)
+            print("❌ Không tìm thấy thiết bị nào")
+            
+        self.results['network_scan'] = scan_summary
+        return len(active_hosts) > 0
+    
+    def _parse_scan_targets(self, network, start, end):
+        """Chuẩn hóa target của network_scan thành list string (CIDR hoặc 'a.b.c.start-end')"""
+        if isinstance(network, (list, tuple)):
+            specs = list(network)
+        else:
+            specs = [part.strip() for part in str(network).split(",") if part.strip()]
+        
+        targets = []
+        for spec in specs:
+            if "/" in spec:
+                targets.append(str(ipaddress.ip_network(spec, strict=False)))
+            else:
+                targets.append(f"{spec}.{start}-{end}")
+        return targets
+    
+    def _count_scan_hosts(self, target):
+        """Số host của một target mà không cần sinh danh sách IP"""
+        if "/" in target:
+            net = ipaddress.ip_network(target)
+            return net.num_addresses if net.num_addresses <= 2 else net.num_addresses - 2
+        first, last = target.rsplit(".", 1)[1].split("-")
+        return max(0, int(last) - int(first) + 1)
+    
+    def _iter_scan_shards(self, targets, shard_prefix, count_only=False):
+        """Sinh lazy các shard, mỗi shard là iterator IP (string)"""
+        for target in targets:
+            if "/" not in target:
+                prefix, host_range = target.rsplit(".", 1)
+                first, last = map(int, host_range.split("-"))
+                yield None if count_only else (f"{prefix}.{i}" for i in range(first, last + 1))
+                continue
+            
+            net = ipaddress.ip_network(target)
+            if net.prefixlen >= shard_prefix:
+                yield None if count_only else (str(ip) for ip in net.hosts())
+                continue
+            
+            # Shard con: bỏ network/broadcast address của network cha, giữ nguyên các địa chỉ khác
+            excluded = (net.network_address, net.broadcast_address)
+            for subnet in net.subnets(new_prefix=shard_prefix):
+                yield None if count_only else (str(ip) for ip in subnet if ip not in excluded)
+    
+    def _load_scan_checkpoint(self, checkpoint_file, targets, shard_prefix):
+        """Đọc checkpoint nếu khớp target và shard size, ngược lại bắt đầu từ đầu"""
+        checkpoint = {'targets': targets, 'shard_prefix': shard_prefix, 'next_shard': 0, 'active_hosts': []}
+        if not checkpoint_file or not os.path.exists(checkpoint_file):
+            return checkpoint
+        
+        try:
+            with open(checkpoint_file, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('targets') == targets and saved.get('shard_prefix') == shard_prefix:
+                checkpoint['next_shard'] = int(saved.get('next_shard', 0))
+                checkpoint['active_hosts'] = list(saved.get('active_hosts', []))
+        except Exception as e:
+            print(f"⚠️ Bỏ qua checkpoint lỗi {checkpoint_file}: {e}")
+        return checkpoint
+    
+    def _save_scan_checkpoint(self, checkpoint_file, checkpoint):
+        try:
+            tmp_file = checkpoint_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(checkpoint, f)
+            os.replace(tmp_file, checkpoint_file)
+        except Exception as e:
+            print(f"❌ Lỗi lưu checkpoint: {e}")
+    
+    def _icmp_sweep(self, ips, timeout=1.0):
+        """Ping các IP bằng IcmpEchoEngine, trả về các host phản hồi theo thứ tự địa chỉ"""
         active_hosts = []
         
+        try:
+            with IcmpEchoEngine(timeout=timeout) as engine:
+                for ip, rtt_ms in engine.sweep(ips):
+                    if rtt_ms is not None:
+                        self.logger.log_success("host_ping",
+                                              {'ip': ip, 'ping_time_ms': round(rtt_ms, 2), 'method': 'icmp'},
+                                              f"Tìm thấy thiết bị: {ip}")
+                        active_hosts.append(ip)
+        except OSError as e:
+            self.logger.log_error("host_ping", str(e), {'method': 'icmp'})
+        
+        return sorted(active_hosts, key=ipaddress.ip_address)
+    
+    def _subprocess_sweep(self, ips):
+        """Ping từng IP bằng lệnh ping của hệ điều hành"""
         def ping_host(ip):
             try:
                 if platform.system().lower() == "windows":
@@ -1066,108 +4193,101 @@ class NetworkToolkit:
                 else:
                     cmd = ["ping", "-c", "1", "-W", "1", ip]
                 
-                start_ping = time.time()
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=2)
-                ping_time = time.time() - start_ping
+                with self.instrumentation.span("subprocess.run", command="ping") as span:
+                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=2)
                 
                 if result.returncode == 0:
                     self.logger.log_success("host_ping", 
-                                          {'ip': ip, 'ping_time_ms': round(ping_time * 1000, 2)},
+                                          {'ip': ip, 'ping_time_ms': round(span.duration_ms, 2),
+                                           'duration_ms': span.duration_ms},
                                           f"Tìm thấy thiết bị: {ip}")
                     return ip
                     
             except Exception as e:
-                self.logger.log_error("host_ping", str(e), {'ip': ip})
-            return None
-        
-        ips = [f"{network}.{i}" for i in range(start, end + 1)]
-        
-        scan_start_time = time.time()
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            results = executor.map(ping_host, ips)
-            active_hosts = [ip for ip in results if ip is not None]
-        scan_duration = time.time() - scan_start_time
-        
-        scan_summary = {
-            'network_range': ip_range,
-            'total_ips_scanned': total_ips,
-            'active_hosts_found': len(active_hosts),
-            'scan_duration_seconds': round(scan_duration, 2),
-            'active_hosts': active_hosts,
-            'discovery_rate': len(active_hosts) / total_ips * 100 if total_ips > 0 else 0
-        }
+                self.logger.log_error("host_ping", str(e), {'ip': ip})
+            return None
         
-        if active_hosts:
-            self.logger.log_success("network_scan", scan_summary,
-                                  f"Network scan hoàn thành: {len(active_hosts)} thiết bị tìm thấy")
-            print(f"✅ Tìm thấy {len(active_hosts)} thiết bị:")
-            for host in active_hosts:
-                print(f"   📱 {host}")
-        else:
-            self.logger.log_warning("network_scan", "Không tìm thấy thiết bị nào", scan_summary)
-            print("❌ Không tìm thấy thiết bị nào")
-            
-        self.results['network_scan'] = scan_summary
-        return len(active_hosts) > 0
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = executor.map(ping_host, ips)
+            return [ip for ip in results if ip is not None]
     
-    def bandwidth_test(self, host="google.com", port=80, duration=5):
-        """Kiểm tra băng thông đơn giản"""
-        self.logger.log_start("bandwidth_test", f"Kiểm tra băng thông đến {host}:{port} trong {duration}s")
+    def bandwidth_test(self, host="google.com", port=80, duration=5, streams=4, interval=1.0,
+                       buffer_size=262144, socket_buffer=None, protocol="auto", direction="download"):
+        """Đo throughput với `streams` TCP stream song song
+        
+        direction="download" (mặc định), "upload" hoặc "duplex" (cả hai chiều cùng lúc).
+        protocol="toolkit" thương lượng với `network_toolkit.py server` ở đầu xa (kết quả lặp
+        lại được giữa các host của mình), "http" gửi pipeline HTTP GET trên mỗi stream (web
+        server thường, chỉ cho download), "raw" cho server tự gửi/nhận không cần thương lượng.
+        "auto" chọn toolkit nếu port là ThroughputServer.DEFAULT_PORT, ngược lại http.
+        Kết quả có sample theo `interval` và speed_* riêng cho từng chiều.
+        """
+        if protocol == "auto":
+            protocol = "toolkit" if port == ThroughputServer.DEFAULT_PORT else "http"
+        self.logger.log_start("bandwidth_test",
+                              f"Kiểm tra băng thông ({direction}, {protocol}) đến {host}:{port} trong {duration}s "
+                              f"({streams} streams)")
         
         try:
-            start_time = time.time()
-            total_bytes = 0
-            connections_made = 0
+            address = self.resolver.resolve(host)
+            request = None
+            if protocol == "http" and direction == "download":
+                # Pipeline nhiều GET trên một connection, request cuối đóng connection
+                get = f"GET / HTTP/1.1\r\nHost: {host}\r\n"
+                request = ((get + "\r\n") * (self.HTTP_PIPELINE - 1) + get + "Connection: close\r\n\r\n").encode()
             
-            while time.time() - start_time < duration:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(2)
-                
-                try:
-                    sock.connect((host, port))
-                    connections_made += 1
-                    request = f"GET / HTTP/1.1\r\nHost: {host}\r\n\r\n"
-                    sock.send(request.encode())
-                    
-                    while True:
-                        data = sock.recv(4096)
-                        if not data:
-                            break
-                        total_bytes += len(data)
-                        
-                except socket.timeout:
-                    break
-                except Exception:
-                    break
-                finally:
-                    sock.close()
+            engine = ThroughputEngine(streams, duration, interval, buffer_size, socket_buffer, direction=direction,
+                                      negotiate=protocol == "toolkit")
             
-            elapsed = time.time() - start_time
-            if elapsed > 0 and total_bytes > 0:
-                speed_bps = total_bytes / elapsed
-                speed_kbps = speed_bps / 1024
-                speed_mbps = speed_kbps / 1024
-                
+            def print_sample(sample):
+                line = f"   [{sample['start']:6.2f}-{sample['end']:6.2f}s] {sample['speed_mbps']:.2f} Mbps"
+                if direction == "duplex":
+                    line += f" (⬇️ {sample['download_mbps']:.2f} / ⬆️ {sample['upload_mbps']:.2f})"
+                print(line)
+            
+            with self.instrumentation.span("bandwidth.transfer", direction=direction) as span:
+                result = engine.run(address, port, request, on_sample=print_sample)
+            total_bytes = result['total_bytes']
+            
+            if result['duration_seconds'] > 0 and total_bytes > 0:
                 bandwidth_details = {
                     'host': host,
                     'port': port,
-                    'duration_seconds': round(elapsed, 2),
+                    'duration_seconds': round(result['duration_seconds'], 2),
+                    'duration_ms': span.duration_ms,
                     'total_bytes': total_bytes,
-                    'connections_made': connections_made,
-                    'speed_bps': round(speed_bps, 2),
-                    'speed_kbps': round(speed_kbps, 2),
-                    'speed_mbps': round(speed_mbps, 2)
+                    'connections_made': result['connections_made'],
+                    'speed_bps': result['speed_bps'],
+                    'speed_kbps': result['speed_kbps'],
+                    'speed_mbps': result['speed_mbps'],
+                    'streams': streams,
+                    'buffer_size': buffer_size,
+                    'socket_buffer': socket_buffer,
+                    'direction': direction,
+                    'protocol': protocol,
+                    'intervals': [{key: value for key, value in sample.items() if key.endswith('mbps') or key in ('start', 'end')}
+                                  for sample in result['intervals']]
                 }
+                for name in ("download", "upload"):
+                    if name in result:
+                        bandwidth_details[name] = result[name]
                 
                 self.logger.log_success("bandwidth_test", bandwidth_details,
-                                      f"Băng thông: {speed_mbps:.2f} Mbps ({total_bytes} bytes)")
+                                      f"Băng thông ({direction}): {result['speed_mbps']:.2f} Mbps ({total_bytes} bytes)")
                 
-                print(f"✅ Tốc độ ước tính: {speed_mbps:.2f} Mbps ({speed_kbps:.2f} Kbps)")
+                print(f"✅ Tốc độ ước tính: {result['speed_mbps']:.2f} Mbps ({result['speed_kbps']:.2f} Kbps)")
+                if direction == "duplex":
+                    print(f"   ⬇️ Download: {result['download']['speed_mbps']:.2f} Mbps | "
+                          f"⬆️ Upload: {result['upload']['speed_mbps']:.2f} Mbps")
+                if 'server_speed_mbps' in result.get('upload', {}):
+                    print(f"   📥 Server nhận: {result['upload']['server_speed_mbps']:.2f} Mbps "
+                          f"({result['upload']['server_received_bytes']} bytes)")
                 
                 self.results['bandwidth_test'] = bandwidth_details
                 return True
             else:
-                error_details = {'host': host, 'port': port, 'total_bytes': total_bytes, 'elapsed': elapsed}
+                error_details = {'host': host, 'port': port, 'total_bytes': total_bytes,
+                                 'elapsed': result['duration_seconds'], 'errors': result['errors']}
                 self.logger.log_error("bandwidth_test", "Không thể đo được tốc độ", error_details)
                 print("❌ Không thể đo được tốc độ")
                 return False
@@ -1178,6 +4298,186 @@ class NetworkToolkit:
             print(f"❌ Lỗi kiểm tra băng thông: {e}")
             return False
     
+    def latency_test(self, host="127.0.0.1", port=ThroughputServer.DEFAULT_PORT, count=20, protocol="tcp",
+                     size=64, timeout=2.0):
+        """Đo RTT tới `network_toolkit.py server` bằng echo (TCP hoặc UDP), `count` lần"""
+        self.logger.log_start("latency_test", f"Đo RTT ({protocol}) đến {host}:{port}, {count} lần")
+        
+        try:
+            started_ns = time.perf_counter_ns()
+            address = self.resolver.resolve(host)
+            stats = LatencyStats()
+            size = max(size, 8)
+            lost = 0
+            
+            if protocol == "tcp":
+                with self.instrumentation.span("tcp.connect"):
+                    sock = socket.create_connection((address, port), timeout=timeout)
+                try:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    ThroughputServer.send_line(sock, {'mode': "echo", 'buffer_size': max(size, 4096)})
+                    reply = json.loads(ThroughputServer.read_line(sock))
+                    if not reply.get('ok'):
+                        raise ConnectionError(reply.get('error', "server từ chối test"))
+                    
+                    payload = bytes(size)
+                    view = memoryview(bytearray(size))
+                    for _ in range(count):
+                        with self.instrumentation.span("tcp.send") as send_span:
+                            sock.sendall(payload)
+                        with self.instrumentation.span("tcp.recv") as recv_span:
+                            received = 0
+                            while received < size:
+                                chunk = sock.recv_into(view[received:])
+                                if not chunk:
+                                    raise ConnectionError("server đóng kết nối")
+                                received += chunk
+                        stats.add((send_span.duration_ns + recv_span.duration_ns) / 1e6)
+                finally:
+                    sock.close()
+            else:
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    sock.settimeout(timeout)
+                    sock.connect((address, port))
+                    padding = bytes(size - 8)
+                    for seq in range(count):
+                        start = time.perf_counter()
+                        with self.instrumentation.span("udp.send"):
+                            sock.send(struct.pack("!Q", seq) + padding)
+                        deadline = start + timeout
+                        while True:
+                            try:
+                                sock.settimeout(max(deadline - time.perf_counter(), 0.001))
+                                with self.instrumentation.span("udp.recv"):
+                                    data = sock.recv(65535)
+                            except (socket.timeout, ConnectionRefusedError):
+                                lost += 1
+                                break
+                            # Bỏ qua reply trễ của probe trước
+                            if len(data) >= 8 and struct.unpack("!Q", data[:8])[0] == seq:
+                                stats.add((time.perf_counter() - start) * 1000)
+                                break
+            
+            if not stats.count:
+                error_details = {'host': host, 'port': port, 'protocol': protocol, 'sent': count, 'lost': lost}
+                self.logger.log_error("latency_test", "Không nhận được reply nào", error_details)
+                print("❌ Không nhận được reply nào")
+                return False
+            
+            summary = stats.to_dict()
+            latency_details = {
+                'host': host,
+                'port': port,
+                'protocol': protocol,
+                'size': size,
+                'sent': count,
+                'received': stats.count,
+                'lost': lost,
+                'loss_percent': round(lost / count * 100, 2),
+                'duration_ms': round((time.perf_counter_ns() - started_ns) / 1e6, 3),
+                'avg_rtt_time_ms': summary['mean'],
+                'min_rtt_ms': summary['min'],
+                'max_rtt_ms': summary['max'],
+                'p50_rtt_ms': summary['p50'],
+                'p95_rtt_ms': summary['p95'],
+                'p99_rtt_ms': summary['p99']
+            }
+            self.logger.log_success("latency_test", latency_details,
+                                  f"RTT {host}:{port} ({protocol}): avg {summary['mean']:.3f}ms, p99 {summary['p99']:.3f}ms")
+            print(f"✅ RTT: min {summary['min']:.3f}ms / avg {summary['mean']:.3f}ms / "
+                  f"p99 {summary['p99']:.3f}ms / max {summary['max']:.3f}ms ({lost} mất)")
+            
+            self.results['latency_test'] = latency_details
+            return True
+            
+        except Exception as e:
+            error_details = {'host': host, 'port': port, 'protocol': protocol, 'error_type': 'exception', 'exception': str(e)}
+            self.logger.log_error("latency_test", str(e), error_details)
+            print(f"❌ Lỗi đo RTT: {e}")
+            return False
+    
+    def jitter_test(self, host="127.0.0.1", port=ThroughputServer.DEFAULT_PORT, rate_pps=50, packet_size=172,
+                    duration=5, timeout=1.0):
+        """Đo loss/jitter/reorder bằng UDP probe stream tới reflector (`network_toolkit.py server`)"""
+        self.logger.log_start("jitter_test",
+                              f"UDP probe {rate_pps} pps x {packet_size} bytes đến {host}:{port} trong {duration}s")
+        
+        try:
+            address = self.resolver.resolve(host)
+            with self.instrumentation.span("udp.probe_stream") as span:
+                result = UdpProbeEngine(rate_pps, packet_size, duration, timeout=timeout).run(address, port)
+            result['duration_ms'] = span.duration_ms
+            
+            if not result['received']:
+                error_details = {'host': host, 'port': port, **result}
+                self.logger.log_error("jitter_test", "Không nhận được probe nào từ reflector", error_details)
+                print("❌ Không nhận được probe nào từ reflector")
+                return False
+            
+            rtt = result.pop('rtt')
+            jitter_details = {
+                'host': host,
+                'port': port,
+                **result,
+                'avg_rtt_time_ms': rtt['mean'],
+                'p50_rtt_ms': rtt['p50'],
+                'p95_rtt_ms': rtt['p95'],
+                'p99_rtt_ms': rtt['p99'],
+                'max_rtt_ms': rtt['max']
+            }
+            self.logger.log_success("jitter_test", jitter_details,
+                                  f"Jitter {result['jitter_ms']:.3f}ms, loss {result['loss_percent']}% "
+                                  f"({result['received']}/{result['sent']})")
+            print(f"✅ Jitter: {result['jitter_ms']:.3f}ms | Loss: {result['loss_percent']}% "
+                  f"({result['lost']}/{result['sent']}) | Reorder: {result['reordered']} | "
+                  f"Duplicate: {result['duplicates']} | RTT avg {rtt['mean']}ms p99 {rtt['p99']}ms")
+            
+            self.results['jitter_test'] = jitter_details
+            return True
+            
+        except Exception as e:
+            error_details = {'host': host, 'port': port, 'error_type': 'exception', 'exception': str(e)}
+            self.logger.log_error("jitter_test", str(e), error_details)
+            print(f"❌ Lỗi đo jitter: {e}")
+            return False
+    
+    def serve_metrics(self, host="127.0.0.1", port=MetricsServer.DEFAULT_PORT, max_series=20000):
+        """Mở endpoint Prometheus `/metrics`; metric tính từ các log entry ghi sau thời điểm này"""
+        registry = MetricsRegistry(max_series, providers=self.logger.summary_providers)
+        server = MetricsServer(registry, host, port).start()
+        self.logger.sinks.append(registry)
+        self.instrumentation.sinks.append(registry.observe_span)
+        self.logger.log_info("metrics", f"Prometheus endpoint: http://{server.host}:{server.port}/metrics",
+                             {'host': server.host, 'port': server.port})
+        return server
+    
+    def monitor(self, targets, interval=10.0, duration=None, **options):
+        """Monitor liên tục các target ("icmp:host", "tcp:host:port", "dns:name", hậu tố "@giây")
+        
+        Chạy NetworkMonitor trên toolkit/logger hiện tại đến hết `duration` (None = Ctrl+C);
+        `options` truyền thẳng cho NetworkMonitor (jitter, timeout, window, workers, dns_server...).
+        """
+        try:
+            monitor = NetworkMonitor(self, targets, interval=interval, **options)
+        except ValueError as e:
+            self.logger.log_error("monitor", str(e), {'targets': list(targets)})
+            print(f"❌ {e}")
+            return False
+        
+        if not monitor.targets:
+            print("❌ Không có target nào để monitor")
+            return False
+        
+        print(f"📈 Monitor {len(monitor.targets)} targets mỗi {interval}s"
+              f"{f' trong {duration}s' if duration else ', Ctrl+C để dừng'}")
+        snapshot = monitor.run(duration)
+        self.results['monitor'] = snapshot
+        
+        summary = snapshot['summary']
+        print(f"✅ {summary['probes']} probes | {summary['up']} up, {summary['down']} down, "
+              f"{summary['unknown']} chưa có kết quả | CPU {summary['cpu_percent']}%")
+        return True
+    
     def traceroute(self, target="8.8.8.8", max_hops=15):
         """Thực hiện traceroute đến target"""
         self.logger.log_start("traceroute", f"Traceroute đến {target} với max {max_hops} hops")
@@ -1190,9 +4490,9 @@ class NetworkToolkit:
             else:
                 cmd = ["traceroute", "-m", str(max_hops), "-w", "3", target]
             
-            start_time = time.time()
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-            execution_time = time.time() - start_time
+            with self.instrumentation.span("subprocess.run", command=cmd[0]) as span:
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+            execution_time = span.duration_ns / 1e9
             
             traceroute_details = {
                 'target': target,
@@ -1200,6 +4500,7 @@ class NetworkToolkit:
                 'os_type': os_type,
                 'command': ' '.join(cmd),
                 'execution_time_seconds': round(execution_time, 2),
+                'duration_ms': span.duration_ms,
                 'return_code': result.returncode,
                 'output_lines': len(result.stdout.split('\n')) if result.stdout else 0
             }
@@ -1243,9 +4544,9 @@ class NetworkToolkit:
                 connections_cmd = ["netstat", "-tuln"]
             
             # Lấy interface statistics
-            start_time = time.time()
-            result = subprocess.run(stats_cmd, capture_output=True, text=True, timeout=10)
-            stats_time = time.time() - start_time
+            with self.instrumentation.span("subprocess.run", command="netstat") as stats_span:
+                result = subprocess.run(stats_cmd, capture_output=True, text=True, timeout=10)
+            stats_time = stats_span.duration_ns / 1e9
             
             if result.returncode != 0:
                 raise Exception(f"Stats command failed: {result.stderr}")
@@ -1253,9 +4554,9 @@ class NetworkToolkit:
             stats_output = result.stdout
             
             # Lấy connections
-            start_time = time.time()
-            connections = subprocess.run(connections_cmd, capture_output=True, text=True, timeout=10)
-            connections_time = time.time() - start_time
+            with self.instrumentation.span("subprocess.run", command="netstat") as connections_span:
+                connections = subprocess.run(connections_cmd, capture_output=True, text=True, timeout=10)
+            connections_time = connections_span.duration_ns / 1e9
             
             if connections.returncode != 0:
                 raise Exception(f"Connections command failed: {connections.stderr}")
@@ -1272,6 +4573,7 @@ class NetworkToolkit:
                 'connections_command': ' '.join(connections_cmd),
                 'stats_execution_time_seconds': round(stats_time, 2),
                 'connections_execution_time_seconds': round(connections_time, 2),
+                'duration_ms': round(stats_span.duration_ms + connections_span.duration_ms, 3),
                 'stats_output_lines': stats_lines,
                 'connections_output_lines': connections_lines,
                 'total_output_size': len(stats_output) + len(connections_output)
@@ -1304,7 +4606,7 @@ class NetworkToolkit:
     # TEST SUITES
     # ========================================================================
     
-    def run_quick_test(self):
+    def run_quick_test(self, parallel=True, test_timeout=None, suite_deadline=None, profile=None):
         """Chạy kiểm tra nhanh"""
         self.logger.log_start("quick_test", "Bắt đầu kiểm tra mạng nhanh")
         
@@ -1312,8 +4614,6 @@ class NetworkToolkit:
         print("=" * 50)
         print(f"⏰ Thời gian: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
-        start_time = datetime.now()
-        
         tests = [
             ("Local Info", self.get_local_info),
             ("DNS Check", self.check_dns),
@@ -1322,42 +4622,10 @@ class NetworkToolkit:
             ("Ping Cloudflare DNS", lambda: self.ping_test("1.1.1.1", 2))
         ]
         
-        completed_tests = 0
-        failed_tests = 0
-        
-        for i, (test_name, test_func) in enumerate(tests, 1):
-            try:
-                print(f"\n{i}. {test_name}...")
-                self.logger.log_info("test_execution", f"Đang chạy: {test_name}")
-                
-                success = test_func()
-                
-                if success:
-                    completed_tests += 1
-                    print(f"   ✅ {test_name} thành công")
-                else:
-                    failed_tests += 1
-                    print(f"   ❌ {test_name} thất bại")
-                    
-            except Exception as e:
-                failed_tests += 1
-                self.logger.log_error("test_execution", f"Lỗi trong {test_name}: {str(e)}")
-                print(f"   ❌ {test_name} lỗi: {e}")
-        
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        
-        self.generate_report("Quick Test", completed_tests, failed_tests, duration)
-        
-        return {
-            'total_tests': len(tests),
-            'completed_tests': completed_tests,
-            'failed_tests': failed_tests,
-            'duration_seconds': round(duration, 2),
-            'success_rate': completed_tests / len(tests) * 100
-        }
+        return self._run_suite("Quick Test", tests, max_workers=5 if parallel else 1,
+                               test_timeout=test_timeout, suite_deadline=suite_deadline, profile=profile)
     
-    def run_full_test(self):
+    def run_full_test(self, parallel=True, test_timeout=None, suite_deadline=None, profile=None):
         """Chạy kiểm tra đầy đủ"""
         self.logger.log_start("full_test", "Bắt đầu kiểm tra mạng đầy đủ")
         
@@ -1365,8 +4633,6 @@ class NetworkToolkit:
         print("=" * 50)
         print(f"⏰ Thời gian: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
-        start_time = datetime.now()
-        
         tests = [
             ("Local Info", self.get_local_info),
             ("DNS Check", self.check_dns),
@@ -1377,42 +4643,10 @@ class NetworkToolkit:
             ("Network Stats", self.get_network_stats)
         ]
         
-        completed_tests = 0
-        failed_tests = 0
-        
-        for i, (test_name, test_func) in enumerate(tests, 1):
-            try:
-                print(f"\n{i}. {test_name}...")
-                self.logger.log_info("test_execution", f"Đang chạy: {test_name}")
-                
-                success = test_func()
-                
-                if success:
-                    completed_tests += 1
-                    print(f"   ✅ {test_name} thành công")
-                else:
-                    failed_tests += 1
-                    print(f"   ❌ {test_name} thất bại")
-                    
-            except Exception as e:
-                failed_tests += 1
-                self.logger.log_error("test_execution", f"Lỗi trong {test_name}: {str(e)}")
-                print(f"   ❌ {test_name} lỗi: {e}")
-        
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        
-        self.generate_report("Full Test", completed_tests, failed_tests, duration)
-        
-        return {
-            'total_tests': len(tests),
-            'completed_tests': completed_tests,
-            'failed_tests': failed_tests,
-            'duration_seconds': round(duration, 2),
-            'success_rate': completed_tests / len(tests) * 100
-        }
+        return self._run_suite("Full Test", tests, max_workers=7 if parallel else 1,
+                               test_timeout=test_timeout, suite_deadline=suite_deadline, profile=profile)
     
-    def run_advanced_test(self):
+    def run_advanced_test(self, parallel=True, test_timeout=None, suite_deadline=None, profile=None):
         """Chạy kiểm tra nâng cao"""
         self.logger.log_start("advanced_test", "Bắt đầu kiểm tra mạng nâng cao")
         
@@ -1420,8 +4654,6 @@ class NetworkToolkit:
         print("=" * 50)
         print(f"⏰ Thời gian: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
-        start_time = datetime.now()
-        
         tests = [
             ("Network LAN Scan", lambda: self.network_scan("192.168.1", 1, 10)),
             ("Port Range Scan", lambda: self.port_scan("127.0.0.1", port_range=(20, 100))),
@@ -1430,32 +4662,111 @@ class NetworkToolkit:
             ("Traceroute Test", lambda: self.traceroute("8.8.8.8"))
         ]
         
+        return self._run_suite("Advanced Test", tests, max_workers=5 if parallel else 1,
+                               test_timeout=test_timeout, suite_deadline=suite_deadline, profile=profile)
+    
+    PROFILE_MODES = {'cpu': (True, False), 'memory': (False, True), 'all': (True, True)}
+    
+    def _run_suite(self, test_type, tests, dependencies=None, max_workers=4,
+                   test_timeout=None, suite_deadline=None, profile=None):
+        """Chạy các test của một suite, song song khi không phụ thuộc nhau
+        
+        `dependencies` map tên test -> list tên test phải thành công trước; test có
+        dependency thất bại bị tính là failed mà không chạy. Test vượt `test_timeout`
+        hoặc còn dang dở khi hết `suite_deadline` (giây) bị tính là failed; thread của
+        nó không bị kill mà chạy nốt ở background.
+        `profile` ("cpu", "memory", "all") bật cProfile/tracemalloc cho cả suite; kết quả
+        nằm trong `results['profile']` và file `network_toolkit_profile_<suite>_<session>.prof`.
+        """
+        if profile:
+            cpu, memory = self.PROFILE_MODES[profile]
+            prefix = f"network_toolkit_profile_{test_type.lower().replace(' ', '_')}_{self.logger.session_id}"
+            with self.instrumentation.profile(test_type, cpu=cpu, memory=memory, output_prefix=prefix) as report:
+                result = self._run_suite(test_type, tests, dependencies, max_workers, test_timeout, suite_deadline)
+            self._report_profile(report)
+            return result
+        
+        dependencies = dependencies or {}
+        start_time = datetime.now()
+        deadline = time.monotonic() + suite_deadline if suite_deadline else None
+        
+        status = {}    # test_name -> True/False
+        pending = list(enumerate(tests, 1))
+        running = {}   # future -> (index, test_name, started_at)
         completed_tests = 0
         failed_tests = 0
         
-        for i, (test_name, test_func) in enumerate(tests, 1):
-            try:
-                print(f"\n{i}. {test_name}...")
-                self.logger.log_info("test_execution", f"Đang chạy: {test_name}")
+        def finish(test_name, success, reason=None):
+            nonlocal completed_tests, failed_tests
+            status[test_name] = success
+            if success:
+                completed_tests += 1
+                print(f"   ✅ {test_name} thành công")
+            elif reason:
+                failed_tests += 1
+                self.logger.log_error("test_execution", f"{test_name}: {reason}")
+                print(f"   ❌ {test_name} {reason}")
+            else:
+                failed_tests += 1
+                print(f"   ❌ {test_name} thất bại")
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+        try:
+            while pending or running:
+                # Submit các test đã đủ điều kiện chạy
+                for item in list(pending):
+                    i, (test_name, test_func) = item
+                    deps = dependencies.get(test_name, [])
+                    if any(status.get(dep) is False for dep in deps):
+                        pending.remove(item)
+                        finish(test_name, False, "bỏ qua do dependency thất bại")
+                    elif all(status.get(dep) is True for dep in deps):
+                        pending.remove(item)
+                        if deadline is not None and time.monotonic() >= deadline:
+                            finish(test_name, False, "bỏ qua do hết thời gian suite")
+                            continue
+                        print(f"\n{i}. {test_name}...")
+                        self.logger.log_info("test_execution", f"Đang chạy: {test_name}")
+                        running[executor.submit(test_func)] = (i, test_name, time.monotonic())
                 
-                success = test_func()
+                if not running:
+                    # Dependency không tồn tại hoặc vòng lặp: không thể chạy
+                    for _, (test_name, _) in pending:
+                        finish(test_name, False, "dependency không thể thỏa mãn")
+                    break
                 
-                if success:
-                    completed_tests += 1
-                    print(f"   ✅ {test_name} thành công")
-                else:
-                    failed_tests += 1
-                    print(f"   ❌ {test_name} thất bại")
-                    
-            except Exception as e:
-                failed_tests += 1
-                self.logger.log_error("test_execution", f"Lỗi trong {test_name}: {str(e)}")
-                print(f"   ❌ {test_name} lỗi: {e}")
+                # Chờ test xong đầu tiên, tối đa đến timeout/deadline gần nhất
+                now = time.monotonic()
+                limits = []
+                if test_timeout:
+                    limits.extend(started + test_timeout - now for _, _, started in running.values())
+                if deadline is not None:
+                    limits.append(deadline - now)
+                done, _ = wait(running, timeout=max(0, min(limits)) if limits else None,
+                               return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    _, test_name, _ = running.pop(future)
+                    try:
+                        finish(test_name, bool(future.result()))
+                    except Exception as e:
+                        finish(test_name, False, f"lỗi: {e}")
+                
+                now = time.monotonic()
+                for future, (_, test_name, started) in list(running.items()):
+                    if deadline is not None and now >= deadline:
+                        running.pop(future)
+                        finish(test_name, False, "timeout (hết thời gian suite)")
+                    elif test_timeout and now - started >= test_timeout:
+                        running.pop(future)
+                        finish(test_name, False, f"timeout sau {test_timeout}s")
+        finally:
+            executor.shutdown(wait=False)
         
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
         
-        self.generate_report("Advanced Test", completed_tests, failed_tests, duration)
+        self.generate_report(test_type, completed_tests, failed_tests, duration)
         
         return {
             'total_tests': len(tests),
@@ -1465,9 +4776,25 @@ class NetworkToolkit:
             'success_rate': completed_tests / len(tests) * 100
         }
     
+    def _report_profile(self, report):
+        """In và log kết quả profile của một suite"""
+        self.results['profile'] = report
+        self.logger.log_info("profile", f"Profile {report['name']}: {report['duration_ms']}ms", report)
+        
+        print(f"\n🔬 PROFILE - {report['name'].upper()}")
+        if 'top_functions' in report:
+            threads = f"{report['threads_profiled']} threads" if 'threads_profiled' in report else "mọi thread"
+            print(f"   CPU ({threads}, file: {report.get('profile_file')}):")
+            for item in report['top_functions'][:10]:
+                print(f"   {item['cumulative_seconds']:>9.4f}s {item['calls']:>8} calls  {item['function']}")
+        if 'top_allocations' in report:
+            print(f"   Memory peak: {report['memory_peak_kb']} KB")
+            for item in report['top_allocations'][:10]:
+                print(f"   {item['size_kb']:>9.1f} KB {item['count']:>8} blocks  {item['location']}")
+    
     def generate_report(self, test_type, completed_tests, failed_tests, duration):
         """Tạo báo cáo kết quả"""
-        print(f"\n" + "=" * 60)
+        print("\n" + "=" * 60)
         print(f"📊 BÁO CÁO KẾT QUÁ - {test_type.upper()}")
         print("=" * 60)
         
@@ -1519,15 +4846,16 @@ class NetworkToolkit:
         total_tests = completed_tests + failed_tests
         success_rate = (completed_tests / total_tests * 100) if total_tests > 0 else 0
         
-        print(f"\n📈 TỔNG KẾT:")
+        print("\n📈 TỔNG KẾT:")
         print(f"   ✅ Thành công: {completed_tests}/{total_tests} tests ({success_rate:.1f}%)")
         print(f"   ⏱️ Thời gian: {duration:.2f} giây")
         print(f"   📁 Log file: {self.logger.log_file}")
         
         print("=" * 60)
         
-        # Lưu kết quả
+        # Lưu kết quả và compact log session
         self.save_results()
+        self.logger.save_to_file()
         
         # In summary logs
         self.logger.print_summary()
@@ -1548,6 +4876,778 @@ class NetworkToolkit:
         except Exception as e:
             print(f"❌ Lỗi khi lưu file: {e}")
 
+# ============================================================================
+# NETWORK MONITOR
+# ============================================================================
+
+class MonitorTarget:
+    """Một target của monitor với rolling aggregate của `window` probe gần nhất
+    
+    Spec dạng "kind:host[:port][@interval]", ví dụ "icmp:8.8.8.8", "tcp:github.com:443@5",
+    "dns:example.com". Host không có kind được hiểu là icmp.
+    """
+    
+    __slots__ = ('kind', 'host', 'port', 'interval', 'samples', 'probes', 'failures',
+                 'consecutive_failures', 'last_latency_ms', 'last_error', 'last_probe', 'state', 'in_flight')
+    
+    KINDS = ('icmp', 'tcp', 'dns')
+    
+    def __init__(self, kind, host, port=None, interval=None, window=60):
+        if kind not in self.KINDS:
+            raise ValueError(f"Loại probe không hợp lệ: {kind} (hỗ trợ: {', '.join(self.KINDS)})")
+        if kind == 'tcp' and not port:
+            raise ValueError(f"Target tcp cần port: {host}")
+        self.kind = kind
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.samples = deque(maxlen=window)  # latency ms, None nếu probe lỗi
+        self.probes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_latency_ms = None
+        self.last_error = None
+        self.last_probe = None
+        self.state = 'unknown'
+        self.in_flight = False
+    
+    @classmethod
+    def parse(cls, spec, window=60):
+        spec = spec.strip()
+        interval = None
+        if "@" in spec:
+            spec, interval = spec.rsplit("@", 1)
+            interval = float(interval)
+        kind, _, rest = spec.partition(":")
+        if not rest:
+            kind, rest = 'icmp', kind
+        host, _, port = rest.partition(":")
+        return cls(kind.lower(), host, int(port) if port else None, interval, window)
+    
+    @property
+    def name(self):
+        return f"{self.kind}:{self.host}" + (f":{self.port}" if self.port else "")
+    
+    def record(self, latency_ms, error, now, down_after):
+        """Thêm kết quả một probe, trả về state cũ nếu state thay đổi (None nếu không)"""
+        self.probes += 1
+        self.last_probe = now
+        self.samples.append(latency_ms)
+        previous = self.state
+        
+        if error is None:
+            self.last_latency_ms = latency_ms
+            self.consecutive_failures = 0
+            self.state = 'up'
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            if self.consecutive_failures >= down_after:
+                self.state = 'down'
+        return previous if self.state != previous else None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = sorted(value for value in self.samples if value is not None)
+        window = len(self.samples)
+        result = {
+            'target': self.name,
+            'state': self.state,
+            'probes': self.probes,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'window_samples': window,
+            'window_success_rate': round(len(latencies) / window * 100, 2) if window else None,
+            'last_latency_ms': round(self.last_latency_ms, 3) if self.last_latency_ms is not None else None,
+            'last_error': self.last_error
+        }
+        if latencies:
+            result.update({
+                'window_min_ms': round(latencies[0], 3),
+                'window_mean_ms': round(sum(latencies) / len(latencies), 3),
+                'window_p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+                'window_max_ms': round(latencies[-1], 3)
+            })
+        return result
+
+class NetworkMonitor:
+    """Monitor chạy dài: lập lịch probe theo heap, dùng lại một NetworkToolkit/NetworkLogger
+    
+    Mỗi target chạy theo interval riêng (mặc định `interval`), lệch ngẫu nhiên ±`jitter`
+    để không dồn probe vào cùng thời điểm. Scheduler thread ngủ đến hạn của target sớm nhất,
+    gom mọi target đến hạn trong `batch_window` thành batch theo loại và đưa cho
+    `workers` thread: tcp dùng non-blocking connect trên một selector, icmp dùng một
+    IcmpEchoEngine cho cả batch, dns query pipeline qua DnsClient khi có `dns_server`.
+    Target còn đang probe khi tới hạn thì bị bỏ lượt (`skipped`) nên hàng đợi không phình.
+    
+    Log chỉ ghi khi target đổi state (down sau `down_after` lỗi liên tiếp, up lại) và
+    một `monitor_summary` mỗi `summary_interval` giây; `log_samples=True` ghi mọi probe.
+    Khi logger có sink (vd. TimeSeriesStore), mọi kết quả probe được gom và gửi qua
+    `logger.record_samples()` mỗi `SAMPLE_FLUSH_INTERVAL` giây với probe "monitor_<kind>".
+    """
+    
+    SAMPLE_FLUSH_INTERVAL = 1.0
+    
+    def __init__(self, toolkit, targets=(), interval=10.0, jitter=0.1, timeout=2.0, window=60,
+                 workers=4, batch_size=256, batch_window=0.05, down_after=3, summary_interval=60.0,
+                 dns_server=None, log_samples=False):
+        self.toolkit = toolkit
+        self.logger = toolkit.logger
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.window = window
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.down_after = down_after
+        self.summary_interval = summary_interval
+        self.dns_client = DnsClient(dns_server, timeout=timeout) if dns_server else None
+        self.log_samples = log_samples
+        
+        self.targets = []
+        self._schedule = []  # heap (due, counter, target)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        
+        self._samples = []  # chờ gửi cho logger sinks
+        self.probes = 0
+        self.skipped = 0
+        self.lag = LatencyStats()  # độ trễ dispatch so với hạn (ms)
+        self.started = None
+        self._cpu_start = None
+        
+        for target in targets:
+            self.add_target(target)
+    
+    def add_target(self, target):
+        """Thêm target (MonitorTarget hoặc spec string), probe đầu tiên rải đều trong một interval"""
+        if isinstance(target, str):
+            target = MonitorTarget.parse(target, self.window)
+        interval = target.interval or self.interval
+        with self._lock:
+            self.targets.append(target)
+            heapq.heappush(self._schedule, (time.monotonic() + random.uniform(0, interval),
+                                            next(self._counter), target))
+        self._wakeup.set()
+        return target
+    
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+    
+    def _next_due(self, due, target, now):
+        interval = target.interval or self.interval
+        next_due = due + interval * (1 + random.uniform(-self.jitter, self.jitter))
+        # Trễ quá một interval (máy bận, suspend): bắt nhịp lại thay vì chạy bù hàng loạt
+        return next_due if next_due > now else now + interval * random.uniform(0, 1)
+    
+    def run(self, duration=None):
+        """Chạy đến khi hết `duration` giây (None = đến khi stop()/Ctrl+C), trả về snapshot"""
+        self.started = time.monotonic()
+        self._cpu_start = time.process_time()
+        deadline = self.started + duration if duration else None
+        next_summary = self.started + self.summary_interval
+        next_flush = self.started + self.SAMPLE_FLUSH_INTERVAL
+        self._stopped = False
+        
+        self.logger.log_start("monitor", f"Monitor {len(self.targets)} targets, interval {self.interval}s "
+                                         f"(±{self.jitter * 100:.0f}%)")
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="monitor")
+        pending = {}  # future -> batch, để hủy batch chưa chạy khi dừng
+        try:
+            while not self._stopped:
+                now = time.monotonic()
+                if deadline and now >= deadline:
+                    break
+                if now >= next_summary:
+                    self._log_summary()
+                    next_summary = now + self.summary_interval
+                if now >= next_flush:
+                    self._flush_samples()
+                    next_flush = now + self.SAMPLE_FLUSH_INTERVAL
+                
+                with self._lock:
+                    next_due = self._schedule[0][0] if self._schedule else float('inf')
+                    batches = {}
+                    while self._schedule and self._schedule[0][0] <= now + self.batch_window:
+                        due, _, target = heapq.heappop(self._schedule)
+                        heapq.heappush(self._schedule, (self._next_due(due, target, now),
+                                                        next(self._counter), target))
+                        self.lag.add(max(0.0, now - due) * 1000)
+                        if target.in_flight:
+                            self.skipped += 1
+                            continue
+                        target.in_flight = True
+                        batches.setdefault(target.kind, []).append(target)
+                
+                for kind, targets in batches.items():
+                    for offset in range(0, len(targets), self.batch_size):
+                        batch = targets[offset:offset + self.batch_size]
+                        future = executor.submit(self._run_batch, kind, batch)
+                        pending[future] = batch
+                        future.add_done_callback(lambda done: pending.pop(done, None))
+                
+                if not batches:
+                    wake_at = min(next_due, next_summary, next_flush if self._samples else float('inf'),
+                                  deadline or float('inf'))
+                    self._wakeup.wait(max(0.0, wake_at - time.monotonic()))
+                    self._wakeup.clear()
+        except KeyboardInterrupt:
+            print("\n⏹️ Dừng monitor")
+        finally:
+            # shutdown(cancel_futures=True) chỉ có từ Python 3.9
+            for future, batch in list(pending.items()):
+                if future.cancel():
+                    for target in batch:
+                        target.in_flight = False
+            executor.shutdown(wait=True)
+            self._flush_samples()
+        
+        snapshot = self.snapshot()
+        self.logger.log_success("monitor", snapshot['summary'],
+                              f"Monitor dừng sau {snapshot['summary']['elapsed_seconds']}s, "
+                              f"{self.probes} probes")
+        return snapshot
+    
+    # ------------------------------------------------------------------
+    # Probes
+    # ------------------------------------------------------------------
+    
+    def _run_batch(self, kind, targets):
+        try:
+            with self.toolkit.instrumentation.span("monitor.batch", kind=kind):
+                {'tcp': self._probe_tcp, 'icmp': self._probe_icmp, 'dns': self._probe_dns}[kind](targets)
+        except Exception as e:
+            for target in targets:
+                if target.in_flight:
+                    self._record(target, None, str(e))
+    
+    def _resolve(self, targets):
+        """Phân giải host qua DnsCache chung, trả về list (target, address); target lỗi được record luôn"""
+        resolved = []
+        for target in targets:
+            try:
+                resolved.append((target, self.toolkit.resolver.resolve(target.host)))
+            except Exception as e:
+                self._record(target, None, f"resolve: {e}")
+        return resolved
+    
+    def _probe_tcp(self, targets):
+        selector = selectors.DefaultSelector()
+        try:
+            for target, address in self._resolve(targets):
+                sock = socket.socket(socket.AF_INET6 if ":" in address else socket.AF_INET, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                started = time.perf_counter()
+                code = sock.connect_ex((address, target.port))
+                if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    sock.close()
+                    self._record(target, None, os.strerror(code))
+                    continue
+                selector.register(sock, selectors.EVENT_WRITE, (target, started))
+            
+            deadline = time.perf_counter() + self.timeout
+            while selector.get_map():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                for key, _ in selector.select(remaining):
+                    target, started = key.data
+                    latency_ms = (time.perf_counter() - started) * 1000
+                    code = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+                    self._record(target, latency_ms if code == 0 else None, os.strerror(code) if code else None)
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+                self._record(key.data[0], None, 'timeout')
+            selector.close()
+    
+    def _probe_icmp(self, targets):
+        by_address = {}
+        for target, address in self._resolve(targets):
+            by_address.setdefault(address, []).append(target)
+        if not by_address:
+            return
+        with IcmpEchoEngine(timeout=self.timeout) as engine:
+            for address, rtt_ms in engine.sweep(list(by_address)):
+                for target in by_address.get(address, ()):
+                    self._record(target, rtt_ms, None if rtt_ms is not None else 'timeout')
+    
+    def _probe_dns(self, targets):
+        if self.dns_client:
+            pending = {}
+            for target in targets:
+                pending.setdefault(target.host.rstrip(".").lower(), []).append(target)
+            for response in self.dns_client.query_many(list(pending), window=len(pending)):
+                error = response.get('error')
+                if error is None and response['rcode'] != 'NOERROR':
+                    error = response['rcode']
+                latency_ms = response.get('rtt_ms') if error is None else None
+                for target in pending.pop(response['name'].rstrip(".").lower(), ()):
+                    self._record(target, latency_ms, error)
+            return
+        
+        # Không có dns_server: đo resolver của hệ thống (bỏ qua DnsCache)
+        for target in targets:
+            started = time.perf_counter()
+            try:
+                socket.getaddrinfo(target.host, None, socket.AF_INET, socket.SOCK_STREAM)
+                self._record(target, (time.perf_counter() - started) * 1000, None)
+            except socket.gaierror as e:
+                self._record(target, None, str(e))
+    
+    def _record(self, target, latency_ms, error):
+        with self._lock:
+            target.in_flight = False
+            self.probes += 1
+            previous = target.record(latency_ms, error, time.time(), self.down_after)
+            if self.logger.sinks:
+                host = f"{target.host}:{target.port}" if target.port else target.host
+                self._samples.append((target.last_probe, f"monitor_{target.kind}", host, latency_ms, error is None))
+        
+        if self.log_samples:
+            details = {'target': target.name, 'kind': target.kind, 'host': target.host, 'port': target.port}
+            if error is None:
+                self.logger.log_success("monitor_probe", {**details, 'probe_time_ms': round(latency_ms, 3)},
+                                      f"{target.name} OK ({latency_ms:.2f}ms)")
+            else:
+                self.logger.log_error("monitor_probe", error, {**details, 'error': error})
+        
+        if previous is None or (previous == 'unknown' and target.state == 'up'):
+            return
+        details = {'target': target.name, 'kind': target.kind, 'host': target.host, 'port': target.port,
+                   'previous_state': previous, 'state': target.state,
+                   'consecutive_failures': target.consecutive_failures}
+        if target.state == 'down':
+            self.logger.log_error("monitor_state", f"{target.name} DOWN: {error}", {**details, 'error': error})
+        else:
+            self.logger.log_success("monitor_state", {**details, 'probe_time_ms': round(latency_ms, 3)},
+                                  f"{target.name} UP lại ({latency_ms:.2f}ms)")
+    
+    # ------------------------------------------------------------------
+    # Aggregates
+    # ------------------------------------------------------------------
+    
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        cpu_seconds = time.process_time() - self._cpu_start if self._cpu_start is not None else 0.0
+        with self._lock:
+            states = {}
+            for target in self.targets:
+                states[target.state] = states.get(target.state, 0) + 1
+            lag = self.lag.to_dict()
+            probes, skipped = self.probes, self.skipped
+        return {
+            'targets': len(self.targets),
+            'up': states.get('up', 0),
+            'down': states.get('down', 0),
+            'unknown': states.get('unknown', 0),
+            'probes': probes,
+            'skipped': skipped,
+            'probes_per_second': round(probes / elapsed, 2) if elapsed else 0,
+            'elapsed_seconds': round(elapsed, 2),
+            'cpu_seconds': round(cpu_seconds, 3),
+            'cpu_percent': round(cpu_seconds / elapsed * 100, 2) if elapsed else 0,
+            'scheduler_lag_p99_ms': lag.get('p99'),
+            'scheduler_lag_max_ms': lag.get('max')
+        }
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary và rolling aggregate của từng target"""
+        with self._lock:
+            targets = [target.to_dict() for target in self.targets]
+        return {'summary': self.summary(), 'targets': targets}
+    
+    def _flush_samples(self):
+        with self._lock:
+            samples, self._samples = self._samples, []
+        self.logger.record_samples(samples)
+    
+    def _log_summary(self):
+        summary = self.summary()
+        self.logger.log_success("monitor_summary", summary,
+                              f"Monitor: {summary['up']} up, {summary['down']} down, "
+                              f"{summary['probes']} probes, CPU {summary['cpu_percent']}%")
+
+# ============================================================================
+# COMMAND LINE INTERFACE
+# ============================================================================
+
+# Tham số positional của từng subcommand (dùng khi chuyển job file thành argv)
+CLI_POSITIONALS = {
+    'dns': 'domains',
+    'ping': 'hosts',
+    'portscan': 'hosts',
+    'netscan': 'networks',
+    'bandwidth': 'hosts',
+    'latency': 'hosts',
+    'jitter': 'hosts',
+    'monitor': 'targets',
+    'traceroute': 'targets',
+    'job': 'job_files',
+}
+
+def build_arg_parser():
+    """Tạo argparse parser với subcommands tương ứng menu"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        prog="network_toolkit.py",
+        description="Network Toolkit - chạy không có tham số để mở menu tương tác")
+    parser.add_argument("--log-file", help="File JSON log của session")
+    parser.add_argument("--max-memory-entries", type=int, default=100000,
+                        help="Số log entry giữ trong bộ nhớ, phần cũ hơn ghi ra disk (0 = không giới hạn)")
+    parser.add_argument("--metrics-db", help="SQLite time-series store lưu lịch sử probe (rollup 1m/1h)")
+    parser.add_argument("--metrics-port", type=int, help="Mở Prometheus endpoint /metrics trên port này")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="Địa chỉ bind của Prometheus endpoint")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Không in output ra console")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON khi kết thúc")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    
+    for name, help_text in (("quick", "Quick Test (5 tests)"), ("full", "Full Test (7 tests)"),
+                            ("advanced", "Advanced Test (5 tests)")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("--sequential", action="store_true", help="Chạy tuần tự từng test")
+        sub.add_argument("--test-timeout", type=float, help="Timeout mỗi test (giây)")
+        sub.add_argument("--deadline", type=float, help="Deadline cả suite (giây)")
+        sub.add_argument("--profile", choices=list(NetworkToolkit.PROFILE_MODES),
+                         help="Bật cProfile/tracemalloc cho suite")
+    
+    sub = subparsers.add_parser("dns", help="Kiểm tra DNS resolution")
+    sub.add_argument("domains", nargs="*", help="Domains (mặc định: google.com github.com cloudflare.com)")
+    sub.add_argument("--server", help="Gửi query thẳng tới DNS server (vd: 1.1.1.1 hoặc host:port)")
+    sub.add_argument("--type", dest="record_type", default="A", help="Record type khi dùng --server")
+    sub.add_argument("--concurrency", type=int, default=10)
+    
+    sub = subparsers.add_parser("ping", help="Ping host")
+    sub.add_argument("hosts", nargs="*", default=["8.8.8.8"])
+    sub.add_argument("-c", "--count", type=int, default=4)
+    
+    sub = subparsers.add_parser("portscan", help="Quét port")
+    sub.add_argument("hosts", nargs="*", default=["127.0.0.1"])
+    sub.add_argument("--ports", help="Danh sách port, vd: 22,80,443")
+    sub.add_argument("--range", dest="port_range", help="Port range, vd: 20-100")
+    sub.add_argument("--engine", choices=["async", "thread"], default="async")
+    sub.add_argument("--concurrency", type=int, default=1000)
+    sub.add_argument("--timeout", type=float, default=2)
+    sub.add_argument("--deadline", type=float)
+    
+    sub = subparsers.add_parser("netscan", help="Quét thiết bị trong mạng")
+    sub.add_argument("networks", nargs="*", default=["192.168.1"],
+                     help="Prefix 3 octet (dùng --start/--end) hoặc CIDR")
+    sub.add_argument("--start", type=int, default=1)
+    sub.add_argument("--end", type=int, default=10)
+    sub.add_argument("--method", choices=["auto", "icmp", "subprocess"], default="auto")
+    sub.add_argument("--timeout", type=float, default=1.0)
+    sub.add_argument("--shard-prefix", type=int, default=22)
+    sub.add_argument("--checkpoint", help="File checkpoint (mặc định tự đặt tên theo target)")
+    
+    sub = subparsers.add_parser("bandwidth", help="Kiểm tra băng thông")
+    sub.add_argument("hosts", nargs="*", default=["google.com"])
+    sub.add_argument("--port", type=int, default=80)
+    sub.add_argument("--duration", type=float, default=5)
+    sub.add_argument("--streams", type=int, default=4, help="Số TCP stream song song")
+    sub.add_argument("--interval", type=float, default=1.0, help="Khoảng thời gian mỗi sample (giây)")
+    sub.add_argument("--buffer-size", type=int, default=262144, help="Buffer recv_into (bytes)")
+    sub.add_argument("--socket-buffer", type=int, help="SO_RCVBUF (bytes)")
+    sub.add_argument("--protocol", choices=["auto", "toolkit", "http", "raw"], default="auto",
+                     help="toolkit: thương lượng với `server` ở đầu xa; auto = toolkit nếu port 5201")
+    sub.add_argument("--direction", choices=["download", "upload", "duplex"], default="download")
+    
+    sub = subparsers.add_parser("latency", help="Đo RTT tới `server` (TCP/UDP echo)")
+    sub.add_argument("hosts", nargs="*", default=["127.0.0.1"])
+    sub.add_argument("--port", type=int, default=ThroughputServer.DEFAULT_PORT)
+    sub.add_argument("--count", type=int, default=20)
+    sub.add_argument("--protocol", choices=["tcp", "udp"], default="tcp")
+    sub.add_argument("--size", type=int, default=64, help="Kích thước mỗi probe (bytes)")
+    
+    sub = subparsers.add_parser("jitter", help="Đo jitter/loss bằng UDP probe tới `server`")
+    sub.add_argument("hosts", nargs="*", default=["127.0.0.1"])
+    sub.add_argument("--port", type=int, default=ThroughputServer.DEFAULT_PORT)
+    sub.add_argument("--rate", type=int, default=50, help="Số packet mỗi giây")
+    sub.add_argument("--packet-size", type=int, default=172, help="Kích thước packet (bytes)")
+    sub.add_argument("--duration", type=float, default=5)
+    
+    sub = subparsers.add_parser("monitor", help="Monitor liên tục icmp/tcp/dns targets")
+    sub.add_argument("targets", nargs="*", help='Spec "kind:host[:port][@interval]", ví dụ tcp:github.com:443@5')
+    sub.add_argument("--targets-file", help="File chứa mỗi dòng một target spec")
+    sub.add_argument("--interval", type=float, default=10.0, help="Interval mặc định (giây)")
+    sub.add_argument("--jitter", type=float, default=0.1, help="Độ lệch ngẫu nhiên của interval (tỉ lệ)")
+    sub.add_argument("--timeout", type=float, default=2.0)
+    sub.add_argument("--duration", type=float, help="Chạy trong N giây (mặc định đến khi Ctrl+C)")
+    sub.add_argument("--window", type=int, default=60, help="Số probe gần nhất cho rolling aggregate")
+    sub.add_argument("--workers", type=int, default=4)
+    sub.add_argument("--down-after", type=int, default=3, help="Số lỗi liên tiếp trước khi báo DOWN")
+    sub.add_argument("--summary-interval", type=float, default=60.0)
+    sub.add_argument("--dns-server", help="Gửi query dns target tới server này thay vì resolver hệ thống")
+    sub.add_argument("--log-samples", action="store_true", help="Ghi log mọi probe thay vì chỉ khi đổi state")
+    
+    sub = subparsers.add_parser("server", help="Chạy test server (TCP + UDP) cho bandwidth/latency từ host khác")
+    sub.add_argument("--host", default="0.0.0.0")
+    sub.add_argument("--port", type=int, default=ThroughputServer.DEFAULT_PORT)
+    sub.add_argument("--socket-buffer", type=int, help="SO_RCVBUF/SO_SNDBUF (bytes)")
+    sub.add_argument("--no-udp", action="store_true", help="Không mở UDP echo")
+    
+    sub = subparsers.add_parser("traceroute", help="Traceroute")
+    sub.add_argument("targets", nargs="*", default=["8.8.8.8"])
+    sub.add_argument("--max-hops", type=int, default=15)
+    
+    subparsers.add_parser("stats", help="Thống kê mạng")
+    
+    sub = subparsers.add_parser("export", help="Export logs ra CSV/HTML/columnar")
+    sub.add_argument("--source", help="Session log (.json/.jsonl) cần export, mặc định session hiện tại")
+    sub.add_argument("--csv", help="File CSV output")
+    sub.add_argument("--csv-type", choices=["basic", "detailed", "summary", "performance", "history"],
+                     default="basic", help="history: lịch sử từ --metrics-db (--action là probe)")
+    sub.add_argument("--status", help="Chỉ export logs có status này")
+    sub.add_argument("--action", help="Chỉ export logs có action này")
+    sub.add_argument("--html", help="File HTML output")
+    sub.add_argument("--html-type", choices=["comprehensive", "summary"], default="comprehensive")
+    sub.add_argument("--columnar", help="File columnar (.ntcol) output")
+    sub.add_argument("--history-hours", type=float, default=24, help="Khoảng lịch sử cho history CSV/HTML")
+    sub.add_argument("--resolution", choices=list(TimeSeriesStore.RESOLUTIONS), help="Mức chi tiết history CSV")
+    
+    sub = subparsers.add_parser("job", help="Chạy job file (JSON/INI) trong một process")
+    sub.add_argument("job_files", nargs="+")
+    
+    return parser
+
+def load_job_file(job_file):
+    """Đọc job file, trả về list (argv, error) theo thứ tự job
+    
+    JSON: {"jobs": [{"command": "ping", "hosts": ["8.8.8.8"], "count": 2}, ...]}
+    INI:  mỗi section là một job, vd. [ping-dns] command = ping, hosts = 8.8.8.8, 1.1.1.1
+    Job không hợp lệ có argv None và error là lý do, các job còn lại vẫn được trả về;
+    chỉ lỗi đọc/parse cả file mới raise.
+    """
+    if job_file.lower().endswith((".ini", ".cfg", ".conf")):
+        import configparser
+        parser = configparser.ConfigParser()
+        with open(job_file, 'r', encoding='utf-8') as f:
+            parser.read_file(f)
+        jobs = [dict(parser[section], name=section) for section in parser.sections()]
+    else:
+        with open(job_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        jobs = data.get('jobs', []) if isinstance(data, dict) else data
+    
+    if not isinstance(jobs, list):
+        raise ValueError("'jobs' phải là một list")
+    
+    argvs = []
+    for index, job in enumerate(jobs, 1):
+        if not isinstance(job, dict):
+            argvs.append((None, f"Job #{index} không phải object: {job!r}"))
+            continue
+        job = dict(job)
+        job.pop('name', None)
+        command = job.pop('command', None) or job.pop('check', None)
+        if not command:
+            argvs.append((None, f"Job #{index} thiếu 'command': {job}"))
+            continue
+        
+        argv = [str(command)]
+        positional = CLI_POSITIONALS.get(argv[0])
+        if positional in job:
+            values = job.pop(positional)
+            if isinstance(values, str):
+                values = [v.strip() for v in values.split(",") if v.strip()]
+            elif not isinstance(values, (list, tuple)):
+                values = [values]
+            argv.extend(str(v) for v in values)
+        
+        for key, value in job.items():
+            option = "--" + key.replace("_", "-")
+            if isinstance(value, bool) or str(value).lower() in ("true", "false"):
+                if value is True or str(value).lower() == "true":
+                    argv.append(option)
+            elif isinstance(value, (list, tuple)):
+                argv.extend([option, ",".join(str(v) for v in value)])
+            else:
+                argv.extend([option, str(value)])
+        argvs.append((argv, None))
+    return argvs
+
+def run_command(toolkit, args):
+    """Chạy một subcommand, trả về True nếu thành công"""
+    command = args.command
+    
+    if command in ("quick", "full", "advanced"):
+        suite = {'quick': toolkit.run_quick_test, 'full': toolkit.run_full_test,
+                 'advanced': toolkit.run_advanced_test}[command]
+        result = suite(parallel=not args.sequential, test_timeout=args.test_timeout,
+                       suite_deadline=args.deadline, profile=args.profile)
+        return result['failed_tests'] == 0
+    
+    if command == "dns":
+        return toolkit.check_dns(args.domains or None, concurrency=args.concurrency,
+                                 server=args.server, record_type=args.record_type)
+    
+    if command == "ping":
+        return all([toolkit.ping_test(host, args.count) for host in args.hosts])
+    
+    if command == "portscan":
+        ports = [int(p) for p in args.ports.split(",")] if args.ports else None
+        port_range = tuple(map(int, args.port_range.split("-"))) if args.port_range else None
+        return all([toolkit.port_scan(host, ports=ports, port_range=port_range, engine=args.engine,
+                                      concurrency=args.concurrency, timeout=args.timeout,
+                                      deadline=args.deadline)
+                    for host in args.hosts])
+    
+    if command == "netscan":
+        cidrs = [n for n in args.networks if "/" in n]
+        prefixes = [n for n in args.networks if "/" not in n]
+        results = []
+        if cidrs:
+            results.append(toolkit.network_scan(cidrs, method=args.method, timeout=args.timeout,
+                                                shard_prefix=args.shard_prefix, checkpoint_file=args.checkpoint))
+        for prefix in prefixes:
+            results.append(toolkit.network_scan(prefix, args.start, args.end, method=args.method,
+                                                timeout=args.timeout))
+        return all(results)
+    
+    if command == "bandwidth":
+        return all([toolkit.bandwidth_test(host, args.port, args.duration, args.streams, args.interval,
+                                           args.buffer_size, args.socket_buffer, protocol=args.protocol,
+                                           direction=args.direction)
+                    for host in args.hosts])
+    
+    if command == "latency":
+        return all([toolkit.latency_test(host, args.port, args.count, args.protocol, args.size)
+                    for host in args.hosts])
+    
+    if command == "jitter":
+        return all([toolkit.jitter_test(host, args.port, args.rate, args.packet_size, args.duration)
+                    for host in args.hosts])
+    
+    if command == "monitor":
+        targets = list(args.targets)
+        if args.targets_file:
+            with open(args.targets_file, 'r', encoding='utf-8') as f:
+                targets += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        return toolkit.monitor(targets, args.interval, args.duration, jitter=args.jitter, timeout=args.timeout,
+                               window=args.window, workers=args.workers, down_after=args.down_after,
+                               summary_interval=args.summary_interval, dns_server=args.dns_server,
+                               log_samples=args.log_samples)
+    
+    if command == "server":
+        server = ThroughputServer(args.host, args.port, socket_buffer=args.socket_buffer, mode="auto",
+                                  udp=not args.no_udp)
+        print(f"🖥️ Test server đang chạy trên {args.host}:{args.port} (TCP{'' if args.no_udp else ' + UDP'}), "
+              f"Ctrl+C để dừng")
+        toolkit.logger.log_info("server", f"Test server chạy trên {args.host}:{args.port}")
+        server.serve_forever()
+        toolkit.logger.log_info("server", f"Test server dừng sau {server.connections_served} connections",
+                                {'connections_served': server.connections_served,
+                                 'bytes_received': server.bytes_received})
+        return True
+    
+    if command == "traceroute":
+        return all([toolkit.traceroute(target, args.max_hops) for target in args.targets])
+    
+    if command == "stats":
+        return toolkit.get_network_stats()
+    
+    if command == "export":
+        logger = NetworkLogger.load(args.source, echo=toolkit.logger.echo,
+                                    max_memory_entries=toolkit.logger.logs.max_entries) if args.source else toolkit.logger
+        if not args.csv and not args.html and not args.columnar:
+            args.csv = f"network_toolkit_export_{logger.session_id}.csv"
+        success = True
+        if logger is not toolkit.logger and toolkit.logger.metrics_store is not None:
+            logger.metrics_store = toolkit.logger.metrics_store
+        if args.csv:
+            success &= logger.export_csv(args.csv, args.csv_type, args.status, args.action,
+                                         history_hours=args.history_hours, resolution=args.resolution)
+        if args.html:
+            success &= logger.export_html(args.html, args.html_type, open_browser=False,
+                                          history_hours=args.history_hours)
+        if args.columnar:
+            success &= logger.export_columnar(args.columnar, args.status, args.action)
+        return success
+    
+    if command == "job":
+        # Job lỗi (file hỏng, tham số sai, exception) chỉ bị tính failed, các job còn lại vẫn chạy
+        parser = build_arg_parser()
+        job_results = toolkit.results.setdefault('jobs', [])
+        success = True
+        for job_file in args.job_files:
+            try:
+                argvs = load_job_file(job_file)
+            except Exception as e:
+                toolkit.logger.log_error("job", f"Không đọc được job file: {e}", {'job_file': job_file})
+                job_results.append({'job_file': job_file, 'success': False, 'error': str(e)})
+                success = False
+                continue
+            for argv, error in argvs:
+                result = {'job_file': job_file, 'argv': argv, 'success': False}
+                if error:
+                    result['error'] = error
+                    toolkit.logger.log_error("job", error, {'job_file': job_file})
+                    job_results.append(result)
+                    success = False
+                    continue
+                try:
+                    job_args = parser.parse_args(argv)
+                    toolkit.logger.log_info("job", f"Job {job_file}: {' '.join(argv)}")
+                    result['success'] = bool(run_command(toolkit, job_args))
+                except SystemExit:
+                    # argparse đã in lỗi ra stderr
+                    result['error'] = "Tham số job không hợp lệ"
+                    toolkit.logger.log_error("job", result['error'], {'job_file': job_file, 'argv': argv})
+                except Exception as e:
+                    result['error'] = str(e)
+                    toolkit.logger.log_error("job", str(e), {'job_file': job_file, 'argv': argv})
+                job_results.append(result)
+                success &= result['success']
+        return success
+    
+    raise ValueError(f"Command không hợp lệ: {command}")
+
+def run_cli(argv):
+    """Entry point không tương tác (cron, monitoring hosts), trả về exit code"""
+    
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        return 2
+    
+    logger = NetworkLogger(log_file=args.log_file, echo=not args.quiet,
+                           max_memory_entries=args.max_memory_entries or None)
+    if args.metrics_db:
+        logger.attach_store(TimeSeriesStore(args.metrics_db))
+    toolkit = NetworkToolkit(logger=logger)
+    metrics_server = toolkit.serve_metrics(args.metrics_host, args.metrics_port) if args.metrics_port else None
+    
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull if args.quiet else sys.stdout):
+        try:
+            success = run_command(toolkit, args)
+        except KeyboardInterrupt:
+            success = False
+        except Exception as e:
+            logger.log_error("cli", str(e), {'argv': argv})
+            success = False
+    
+    logger.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    if args.json:
+        print(json.dumps({
+            'command': args.command,
+            'success': bool(success),
+            'log_file': logger.log_file,
+            'summary': logger.get_summary(),
+            'results': toolkit.results
+        }, indent=2, ensure_ascii=False, default=str))
+    return 0 if success else 1
+
 # ============================================================================
 # MAIN MENU INTERFACE
 # ============================================================================
@@ -1645,8 +5745,12 @@ def get_user_input(prompt, input_type=str, default=None):
             print("\n👋 Đã hủy")
             return None
 
-def main():
-    """Main function"""
+def main(argv=None):
+    """Main function: có tham số thì chạy CLI, không có thì mở menu tương tác"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return run_cli(argv)
+    
     toolkit = NetworkToolkit()
     
     print("🎉 Chào mừng đến với Network Toolkit!")
@@ -1671,11 +5775,12 @@ def main():
                 toolkit.run_advanced_test()
             elif choice == 4:
                 domains = get_user_input("Nhập domains (cách nhau bởi dấu phẩy, Enter = mặc định): ", str, "")
+                server = get_user_input("DNS server (vd: 1.1.1.1, Enter = resolver hệ thống): ", str, "")
                 if domains:
                     domain_list = [d.strip() for d in domains.split(",")]
-                    toolkit.check_dns(domain_list)
+                    toolkit.check_dns(domain_list, server=server or None)
                 else:
-                    toolkit.check_dns()
+                    toolkit.check_dns(server=server or None)
             elif choice == 5:
                 host = get_user_input("Nhập host để ping (Enter = 8.8.8.8): ", str, "8.8.8.8")
                 count = get_user_input("Số lần ping (Enter = 4): ", int, 4)
@@ -1689,15 +5794,23 @@ def main():
                 else:
                     toolkit.port_scan(host)
             elif choice == 7:
-                network = get_user_input("Nhập network (Enter = 192.168.1): ", str, "192.168.1")
-                start = get_user_input("IP bắt đầu (Enter = 1): ", int, 1)
-                end = get_user_input("IP kết thúc (Enter = 10): ", int, 10)
-                toolkit.network_scan(network, start, end)
+                network = get_user_input("Nhập network (vd: 192.168.1 hoặc 10.0.0.0/16, Enter = 192.168.1): ",
+                                         str, "192.168.1")
+                if "/" in network:
+                    toolkit.network_scan(network)
+                else:
+                    start = get_user_input("IP bắt đầu (Enter = 1): ", int, 1)
+                    end = get_user_input("IP kết thúc (Enter = 10): ", int, 10)
+                    toolkit.network_scan(network, start, end)
             elif choice == 8:
                 host = get_user_input("Nhập host (Enter = google.com): ", str, "google.com")
                 port = get_user_input("Nhập port (Enter = 80): ", int, 80)
                 duration = get_user_input("Thời gian test (giây, Enter = 5): ", int, 5)
-                toolkit.bandwidth_test(host, port, duration)
+                streams = get_user_input("Số streams song song (Enter = 4): ", int, 4)
+                direction = get_user_input("Chiều đo (download/upload/duplex, Enter = download): ", str, "download")
+                if direction not in ThroughputEngine.DIRECTIONS:
+                    direction = "download"
+                toolkit.bandwidth_test(host, port, duration, streams, direction=direction)
             elif choice == 9:
                 target = get_user_input("Nhập target (Enter = 8.8.8.8): ", str, "8.8.8.8")
                 max_hops = get_user_input("Max hops (Enter = 15): ", int, 15)
@@ -1726,4 +5839,4 @@ def main():
             input("⏸️  Nhấn Enter để tiếp tục...")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file